@@ -154,8 +154,9 @@ const PokeScreen = () => {
           },
         });
         if (response.ok) {
-          const data: NearbyUser[] = await response.json();
-          setAllNearbyUsers(data);
+          // Paginated response: { results, next }
+          const data: { results: NearbyUser[]; next: string | null } = await response.json();
+          setAllNearbyUsers(data.results);
         } else {
           Alert.alert("Error", "Failed to fetch nearby users");
         }
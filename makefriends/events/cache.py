@@ -0,0 +1,116 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+EVENT_CACHE_DEFAULTS = {
+    'ENABLED': False,
+    'CACHE_ALIAS': 'default',
+    'TTL': 30,  # seconds a cached response is served as fresh
+    'STALE_TTL': 300,  # further seconds it may be served while one request rebuilds it
+    'LOCK_TTL': 10,  # upper bound on a rebuild before another request may try
+}
+
+LIST_GENERATION_KEY = 'events:list-generation'
+
+
+class EventResponseCache:
+    """
+    Serialised EventViewSet responses in a Django cache, so repeated reads skip the query and the
+    serializer. Keys include the version the response's ETag was built from (see conditional_get),
+    so a cached body always matches its ETag, even with a per-process cache. Lists are also keyed
+    on the normalised query params and on a generation that every Event write replaces (see
+    events.signals), so one write evicts every cached list at once.
+    Expired entries stay around for STALE_TTL: while one request rebuilds an entry, the others keep
+    getting the previous copy instead of all running the query at once.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale_serves = 0
+        self.refreshes = 0
+
+    @property
+    def config(self):
+        return {**EVENT_CACHE_DEFAULTS, **getattr(settings, 'EVENT_RESPONSE_CACHE', {})}
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    @property
+    def shared(self):
+        """Whether all processes see one cache, and with it every process's writes to the generation."""
+        return not isinstance(self.cache, LocMemCache)
+
+    def list_generation(self):
+        generation = self.cache.get(LIST_GENERATION_KEY)
+        if generation is None:
+            self.cache.add(LIST_GENERATION_KEY, time.time_ns(), None)
+            generation = self.cache.get(LIST_GENERATION_KEY)
+        return generation
+
+    def list_key(self, query_params, version):
+        generation = self.list_generation()
+        # ?b=2&a=1 and ?a=1&b=2 are the same list
+        params = sorted((key, sorted(value.strip() for value in values)) for key, values in query_params.lists())
+        digest = hashlib.blake2b(repr((params, version)).encode(), digest_size=16).hexdigest()
+        return f'events:list:{generation}:{digest}'
+
+    @staticmethod
+    def detail_key(pk, version):
+        # An update changes the version, so the previous entry is simply never read again.
+        return f'events:detail:{pk}:{version}'
+
+    def get_or_build(self, key, build):
+        """Cached data for key, or build() stored under it. build() may return None to skip caching."""
+        config, cache = self.config, self.cache
+        now = time.time()
+        entry = cache.get(key)
+        lock_key = None
+        if entry is not None:
+            fresh_until, data = entry
+            if now < fresh_until:
+                self.hits += 1
+                return data
+            lock_key = f'{key}:rebuild'
+            if not cache.add(lock_key, 1, config['LOCK_TTL']):
+                # Someone else is rebuilding it
+                self.stale_serves += 1
+                return data
+            self.refreshes += 1
+        else:
+            self.misses += 1
+
+        try:
+            data = build()
+            if data is not None:
+                cache.set(key, (now + config['TTL'], data), config['TTL'] + config['STALE_TTL'])
+        finally:
+            if lock_key:
+                cache.delete(lock_key)
+        return data
+
+    def invalidate(self):
+        """Drop every cached list."""
+        # A fresh timestamp rather than incr(): concurrent writers can't end up on the same generation.
+        self.cache.set(LIST_GENERATION_KEY, time.time_ns(), None)
+
+    def stats(self):
+        total = self.hits + self.misses + self.stale_serves + self.refreshes
+        served_from_cache = self.hits + self.stale_serves
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_serves': self.stale_serves,
+            'refreshes': self.refreshes,
+            'hit_rate': round(served_from_cache / total, 3) if total else 0.0,
+        }
+
+
+event_cache = EventResponseCache()
@@ -0,0 +1,95 @@
+# Generated by Django 5.1.6 on 2026-10-17 13:05
+# Brings the migration state in line with the Event model, which changed after 0001 without a migration.
+
+import re
+from django.db import migrations, models
+
+# "<latitude>, <longitude>", the only form of the old free-text location that maps onto coordinates
+COORDINATES = re.compile(r'^\s*(-?\d{1,2}(?:\.\d+)?)\s*[,;]\s*(-?\d{1,3}(?:\.\d+)?)\s*$')
+
+
+def location_text_to_coordinates(apps, schema_editor):
+    # Place names and addresses can't be geocoded here: those events get no coordinates, and the
+    # text itself is kept as location_text either way.
+    Event = apps.get_model('events', 'Event')
+    batch = []
+    for event in Event.objects.exclude(location='').iterator(chunk_size=1000):
+        match = COORDINATES.match(event.location)
+        if not match:
+            continue
+        latitude, longitude = float(match[1]), float(match[2])
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            event.latitude, event.longitude = latitude, longitude
+            batch.append(event)
+        if len(batch) >= 1000:
+            Event.objects.bulk_update(batch, ['latitude', 'longitude'])
+            batch = []
+    Event.objects.bulk_update(batch, ['latitude', 'longitude'])
+
+
+def coordinates_to_location_text(apps, schema_editor):
+    # Only events created since have no text of their own.
+    Event = apps.get_model('events', 'Event')
+    batch = []
+    events = Event.objects.filter(location='', latitude__isnull=False, longitude__isnull=False)
+    for event in events.iterator(chunk_size=1000):
+        event.location = f'{event.latitude}, {event.longitude}'
+        batch.append(event)
+        if len(batch) >= 1000:
+            Event.objects.bulk_update(batch, ['location'])
+            batch = []
+    Event.objects.bulk_update(batch, ['location'])
+
+
+def nulls_to_blank(apps, schema_editor):
+    # 0001 has both columns NOT NULL.
+    Event = apps.get_model('events', 'Event')
+    Event.objects.filter(age_range__isnull=True).update(age_range='')
+    Event.objects.filter(gender_preference__isnull=True).update(gender_preference='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='event',
+            old_name='type',
+            new_name='event_type',
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(location_text_to_coordinates, coordinates_to_location_text),
+        migrations.RenameField(
+            model_name='event',
+            old_name='location',
+            new_name='location_text',
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='location_text',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='age_range',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='gender_preference',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, nulls_to_blank),
+    ]
@@ -0,0 +1,38 @@
+from django.contrib.gis.geos import Point
+from django.db import migrations
+
+
+def coordinates_to_location(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    events = Event.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    batch = []
+    for event in events.iterator(chunk_size=1000):
+        event.location = Point(event.longitude, event.latitude, srid=4326)
+        batch.append(event)
+        if len(batch) >= 1000:
+            Event.objects.bulk_update(batch, ['location'])
+            batch = []
+    Event.objects.bulk_update(batch, ['location'])
+
+
+def location_to_coordinates(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    batch = []
+    for event in Event.objects.filter(location__isnull=False).iterator(chunk_size=1000):
+        event.longitude, event.latitude = event.location.x, event.location.y
+        batch.append(event)
+        if len(batch) >= 1000:
+            Event.objects.bulk_update(batch, ['latitude', 'longitude'])
+            batch = []
+    Event.objects.bulk_update(batch, ['latitude', 'longitude'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_event_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(coordinates_to_location, location_to_coordinates),
+    ]
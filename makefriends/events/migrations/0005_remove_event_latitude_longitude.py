@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-17 13:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_backfill_event_location'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='event',
+            name='latitude',
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='longitude',
+        ),
+    ]
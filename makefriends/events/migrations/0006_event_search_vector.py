@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('english', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}description, '')), 'B')
+"""
+
+CREATE_TRIGGER = f"""
+CREATE FUNCTION events_event_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER events_event_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON events_event
+    FOR EACH ROW EXECUTE FUNCTION events_event_search_vector_update();
+
+UPDATE events_event SET search_vector = {SEARCH_VECTOR.format(row='')};
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS events_event_search_vector_trigger ON events_event;
+DROP FUNCTION IF EXISTS events_event_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0005_remove_event_latitude_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Backfill before building the index, so the rows aren't indexed one update at a time.
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='event_search_idx'),
+        ),
+    ]
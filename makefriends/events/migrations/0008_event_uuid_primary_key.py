@@ -0,0 +1,78 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:40
+# Replaces the integer primary key of 0001 with the model's UUID. The old ids are kept in legacy_id,
+# so the migration can be reversed.
+
+import uuid
+from django.db import migrations, models
+
+
+def fill_uuids(apps, schema_editor):
+    # One uuid4 per row; a default on AddField would be evaluated once and shared by every row.
+    Event = apps.get_model('events', 'Event')
+    batch = []
+    for event in Event.objects.filter(uuid__isnull=True).only('pk').iterator(chunk_size=1000):
+        event.uuid = uuid.uuid4()
+        batch.append(event)
+        if len(batch) >= 1000:
+            Event.objects.bulk_update(batch, ['uuid'])
+            batch = []
+    Event.objects.bulk_update(batch, ['uuid'])
+
+
+def fill_legacy_ids(apps, schema_editor):
+    # Going back: events created since have no integer id yet; number them after the existing ones.
+    Event = apps.get_model('events', 'Event')
+    last_id = Event.objects.aggregate(last_id=models.Max('legacy_id'))['last_id'] or 0
+    batch = []
+    for event in Event.objects.filter(legacy_id__isnull=True).order_by('date').only('pk').iterator(chunk_size=1000):
+        last_id += 1
+        event.legacy_id = last_id
+        batch.append(event)
+        if len(batch) >= 1000:
+            Event.objects.bulk_update(batch, ['legacy_id'])
+            batch = []
+    Event.objects.bulk_update(batch, ['legacy_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_event_updated_at'),
+    ]
+
+    operations = [
+        # Add the column, fill it row by row, then promote it.
+        migrations.AddField(
+            model_name='event',
+            name='uuid',
+            field=models.UUIDField(null=True),
+        ),
+        migrations.RunPython(fill_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='event',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, unique=True),
+        ),
+        migrations.RenameField(
+            model_name='event',
+            old_name='id',
+            new_name='legacy_id',
+        ),
+        # Becoming the primary key drops the old primary key constraint on legacy_id.
+        migrations.AlterField(
+            model_name='event',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='legacy_id',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, fill_legacy_ids),
+        migrations.RenameField(
+            model_name='event',
+            old_name='uuid',
+            new_name='id',
+        ),
+    ]
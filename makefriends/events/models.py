@@ -1,18 +1,49 @@
 import uuid
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.gis.db import models as geomodels
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 class Event(models.Model):
 	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	# Integer id of events from before ids were UUIDs (migration 0008); None for newer events
+	legacy_id = models.IntegerField(blank=True, null=True, editable=False)
 	title = models.CharField(max_length=255)
 	description = models.TextField()
 	date = models.DateTimeField()
-	latitude = models.FloatField(blank=True, null=True)
-	longitude = models.FloatField(blank=True, null=True)
+	# Free-text location entered before events had coordinates, kept as written (migration 0002)
+	location_text = models.CharField(max_length=255, blank=True, default='')
+	# Geography point (lon/lat, WGS84) with a GiST index, so radius queries don't scan every event
+	location = geomodels.PointField(geography=True, srid=4326, blank=True, null=True)
 	event_type = models.CharField(max_length=50) #"sport", "online", "cultural", "networking"
 	age_range = models.CharField(max_length=20, blank=True, null=True)
 	gender_preference = models.CharField(max_length=20, blank=True, null=True)
 
 	organizer = models.ForeignKey(User, on_delete=models.CASCADE)
+	# Weighted tsvector of title/description, maintained by a DB trigger (migration 0006)
+	search_vector = SearchVectorField(null=True, editable=False)
+	updated_at = models.DateTimeField(auto_now=True)  # Version stamp for ETag / Last-Modified
+
+	class Meta:
+		indexes = [
+			# ?event_type=...&date_from=...&date_to=... and plain date range filters
+			models.Index(fields=['event_type', 'date'], name='event_type_date_idx'),
+			models.Index(fields=['date'], name='event_date_idx'),
+			# Full-text search, ?q= on /api/events/search/
+			GinIndex(fields=['search_vector'], name='event_search_idx'),
+			# Max(updated_at), the version of the event list
+			models.Index(fields=['updated_at'], name='event_updated_idx'),
+		]
+
+	# The API still speaks plain coordinates
+	@property
+	def latitude(self):
+		return self.location.y if self.location else None
+
+	@property
+	def longitude(self):
+		return self.location.x if self.location else None
+
 	def __str__(self):
 		return self.title
\ No newline at end of file
@@ -1,8 +1,14 @@
 from rest_framework import serializers
+from django.contrib.gis.geos import Point
 from .models import Event
 
 class EventSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True) # auto-generated, not required in request
+    # Stored together as Event.location; read back through the model's latitude/longitude properties
+    latitude = serializers.FloatField(required=False, allow_null=True, min_value=-90, max_value=90)
+    longitude = serializers.FloatField(required=False, allow_null=True, min_value=-180, max_value=180)
+    # Only present when the list is filtered with ?near=, in km
+    distance = serializers.SerializerMethodField()
 
     class Meta:
         model = Event
@@ -13,10 +19,26 @@ class EventSerializer(serializers.ModelSerializer):
             'date',
             'latitude',
             'longitude',
+            'distance',
             'event_type',
             'organizer',
             'age_range',
             'gender_preference'
         ]
 
-        read_only_fields = ['organizer']
\ No newline at end of file
+        read_only_fields = ['organizer']
+
+    def validate(self, attrs):
+        if 'latitude' in attrs or 'longitude' in attrs:
+            # On partial updates the missing coordinate comes from the stored location.
+            latitude = attrs.pop('latitude', self.instance.latitude if self.instance else None)
+            longitude = attrs.pop('longitude', self.instance.longitude if self.instance else None)
+            if latitude is None or longitude is None:
+                attrs['location'] = None
+            else:
+                attrs['location'] = Point(longitude, latitude, srid=4326)
+        return attrs
+
+    def get_distance(self, obj):
+        distance = getattr(obj, 'distance', None)
+        return round(distance.km, 3) if distance is not None else None
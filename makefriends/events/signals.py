@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import event_cache
+from .models import Event
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed(sender, instance, **kwargs):
+	# Covers the viewset's create/update/destroy as well as admin and shell writes.
+	event_cache.invalidate()
+	# Again once committed: a list read between the write and the commit still saw the old rows
+	# and may have been cached under the new generation.
+	transaction.on_commit(event_cache.invalidate)
@@ -1,3 +1,224 @@
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from .cache import event_cache
+from .models import Event
 
-# Create your tests here.
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'event-tests'}},
+    EVENT_RESPONSE_CACHE={'ENABLED': True, 'CACHE_ALIAS': 'default', 'TTL': 30, 'STALE_TTL': 300},
+)
+class EventResponseCacheTests(APITestCase):
+    def setUp(self):
+        event_cache.cache.clear()
+        self.user = User.objects.create_user(username='organizer', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+        self.make_event('Salsa night')
+
+    def make_event(self, title):
+        return Event.objects.create(
+            title=title, description='', date=timezone.now() + timedelta(days=1), event_type='cultural', organizer=self.user,
+        )
+
+    def get_list(self, params=''):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('event-list') + params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_repeated_list_is_served_from_cache(self):
+        _, first_queries = self.get_list('?event_type=cultural&date_from=2000-01-01')
+        hits = event_cache.hits
+        response, cached_queries = self.get_list('?date_from=2000-01-01&event_type=cultural')
+        self.assertEqual(event_cache.hits, hits + 1)
+        self.assertEqual([event['title'] for event in response.data], ['Salsa night'])
+        # Only the version query behind the ETag is left
+        self.assertEqual(cached_queries, 1)
+        self.assertLess(cached_queries, first_queries)
+
+    def test_writes_evict_cached_lists_and_details(self):
+        event = Event.objects.get()
+        self.get_list()
+        self.client.get(reverse('event-detail', args=[event.pk]))
+
+        self.make_event('Board games')
+        response, _ = self.get_list()
+        self.assertEqual(sorted(row['title'] for row in response.data), ['Board games', 'Salsa night'])
+
+        event.title = 'Salsa & bachata night'
+        event.save()
+        response = self.client.get(reverse('event-detail', args=[event.pk]))
+        self.assertEqual(response.data['title'], 'Salsa & bachata night')
+
+        event.delete()
+        response, _ = self.get_list()
+        self.assertEqual([row['title'] for row in response.data], ['Board games'])
+
+    def test_list_is_revalidated_by_etag_only(self):
+        response, _ = self.get_list()
+        self.assertNotIn('Last-Modified', response)
+        Event.objects.get().delete()
+        response = self.client.get(reverse('event-list'), HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+
+@override_settings(EVENT_RESPONSE_CACHE={'ENABLED': False})
+class EventQueryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='organizer', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+
+    def make_event(self, title, days=1, event_type='cultural', lon=None, lat=None):
+        return Event.objects.create(
+            title=title, description='', date=timezone.now() + timedelta(days=days), event_type=event_type,
+            organizer=self.user, location=Point(lon, lat, srid=4326) if lon is not None else None,
+        )
+
+    def get_titles(self, **params):
+        response = self.client.get(reverse('event-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data]
+
+    def test_near_orders_by_distance_within_the_radius(self):
+        self.make_event('Five km', lon=13.4, lat=52.545)
+        self.make_event('Here', lon=13.4, lat=52.5)
+        self.make_event('Twenty km', lon=13.4, lat=52.68)
+        self.make_event('Online')
+        response = self.client.get(reverse('event-list'), {'near': '13.4,52.5', 'radius': 10})
+        self.assertEqual([row['title'] for row in response.data], ['Here', 'Five km'])
+        self.assertEqual(response.data[0]['distance'], 0)
+        self.assertAlmostEqual(response.data[1]['distance'], 5.0, delta=0.1)
+
+    def test_radius_is_capped(self):
+        self.make_event('400 km', lon=13.4, lat=52.5 + 400 / 111.2)
+        self.make_event('1000 km', lon=13.4, lat=52.5 + 1000 / 111.2)
+        self.assertEqual(self.get_titles(near='13.4,52.5', radius=100_000), ['400 km'])
+
+    def test_invalid_near_and_dates_are_rejected(self):
+        for params in [
+            {'near': '13.4'},
+            {'near': '13.4,95'},
+            {'near': '200,52.5'},
+            {'near': 'nan,52.5'},
+            {'near': '13.4,52.5', 'radius': 'inf'},
+            {'near': '13.4,52.5', 'radius': '0'},
+            {'near': '13.4,52.5', 'radius': '-5'},
+            {'date_from': '2024-02-30'},
+            {'date_to': '2024-13-01T10:00:00'},
+            {'date_from': 'next week'},
+        ]:
+            response = self.client.get(reverse('event-list'), params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_event_type_and_date_filters(self):
+        self.make_event('Tomorrow', days=1)
+        self.make_event('Next week', days=7)
+        self.make_event('Match', days=2, event_type='sport')
+        in_three_days = (timezone.now() + timedelta(days=3)).isoformat()
+        self.assertEqual(self.get_titles(event_type='sport'), ['Match'])
+        self.assertEqual(sorted(self.get_titles(date_to=in_three_days)), ['Match', 'Tomorrow'])
+        self.assertEqual(self.get_titles(date_from=in_three_days), ['Next week'])
+        self.assertEqual(self.get_titles(event_type='cultural', date_to=in_three_days), ['Tomorrow'])
+
+    def test_coordinates_map_onto_the_location_point(self):
+        response = self.client.post(reverse('event-list'), {
+            'title': 'Picnic', 'description': '', 'date': (timezone.now() + timedelta(days=1)).isoformat(),
+            'event_type': 'cultural', 'latitude': 52.5, 'longitude': 13.4,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['latitude'], response.data['longitude']), (52.5, 13.4))
+        event = Event.objects.get()
+        self.assertEqual((event.location.x, event.location.y), (13.4, 52.5))
+
+        # A partial update keeps the other coordinate
+        response = self.client.patch(reverse('event-detail', args=[event.pk]), {'latitude': 48.1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        event.refresh_from_db()
+        self.assertEqual((event.location.x, event.location.y), (13.4, 48.1))
+
+        response = self.client.patch(reverse('event-detail', args=[event.pk]), {'latitude': None}, format='json')
+        self.assertEqual(response.status_code, 200)
+        event.refresh_from_db()
+        self.assertIsNone(event.location)
+        self.assertIsNone(response.data['longitude'])
+
+        response = self.client.patch(reverse('event-detail', args=[event.pk]), {'latitude': 91, 'longitude': 0}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SharedCacheEventListTests(APITestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        # Any backend other than the per-process LocMemCache counts as shared
+        override = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir.name}},
+            EVENT_RESPONSE_CACHE={'ENABLED': True, 'CACHE_ALIAS': 'default', 'TTL': 30, 'STALE_TTL': 300},
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='organizer', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+        self.event = Event.objects.create(
+            title='Salsa night', description='', date=timezone.now() + timedelta(days=1), event_type='cultural', organizer=self.user,
+        )
+
+    def test_cached_list_and_its_etag_need_no_query(self):
+        etag = self.client.get(reverse('event-list'))['ETag']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('event-list'))
+            not_modified = self.client.get(reverse('event-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, not_modified.status_code), (200, 304))
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get(reverse('event-list'))['ETag']
+        self.event.delete()
+        response = self.client.get(reverse('event-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+
+class EventSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='organizer', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+        for title, description in [
+            ('Board games', 'Bring snacks, salsa dip welcome'),
+            ('Salsa night', 'Beginners class first'),
+            ('Chess club', 'Weekly games'),
+        ]:
+            Event.objects.create(
+                title=title, description=description, date=timezone.now() + timedelta(days=1),
+                event_type='cultural', organizer=self.user,
+            )
+
+    def search(self, **params):
+        response = self.client.get(reverse('event-search'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data['results']], response.data['next']
+
+    def test_title_matches_rank_first(self):
+        titles, cursor = self.search(q='salsa')
+        self.assertEqual(titles, ['Salsa night', 'Board games'])
+        self.assertIsNone(cursor)
+
+    def test_pages_continue_from_the_cursor(self):
+        titles, cursor = self.search(q='games', limit=1)
+        more, last_cursor = self.search(q='games', limit=1, cursor=cursor)
+        self.assertEqual(set(titles + more), {'Board games', 'Chess club'})
+        self.assertIsNone(last_cursor)
+
+    def test_exclusions_and_bad_input(self):
+        titles, _ = self.search(q='games -chess')
+        self.assertEqual(titles, ['Board games'])
+        self.assertEqual(self.client.get(reverse('event-search')).status_code, 400)
@@ -1,11 +1,139 @@
+import math
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance as DistanceFunc
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_date, parse_datetime
+from users.conditional import conditional_get
+from users.search import search_params, ranked_search
+from .cache import event_cache
 from .models import Event
 from .serializers import EventSerializer
 
+def event_list_version(view, request):
+	if event_cache.shared:
+		# Replaced on every Event write (see events.signals), so the version costs no query.
+		return ('generation', event_cache.list_generation()), None
+	# A per-process cache only sees this process's writes. Fall back to the table: any write
+	# changes the newest updated_at, and the count catches deletes.
+	version = Event.objects.aggregate(updated_at=Max('updated_at'), rows=Count('id'))
+	updated_at = version['updated_at']
+	# No Last-Modified: Max(updated_at) doesn't move on deletes, so only the ETag is reliable.
+	return (updated_at.isoformat() if updated_at else '', version['rows']), None
+
+def event_version(view, request, pk=None):
+	try:
+		updated_at = Event.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+	except DjangoValidationError:  # Not a UUID
+		return None
+	if updated_at is None:
+		return None
+	return (updated_at.isoformat(),), updated_at
+
 class EventViewSet(viewsets.ModelViewSet):
 	queryset = Event.objects.all()
 	serializer_class = EventSerializer
 
+	@conditional_get(event_list_version)
+	def list(self, request, *args, **kwargs):
+		# The list is the same for every user, so whole responses are cached (see events.cache).
+		if not event_cache.enabled:
+			return super().list(request, *args, **kwargs)
+		data = event_cache.get_or_build(
+			event_cache.list_key(request.query_params, getattr(request, 'version_etag', None)),
+			lambda: self.cacheable_data(super(EventViewSet, self).list(request, *args, **kwargs)),
+		)
+		return Response(data)
+
+	@conditional_get(event_version)
+	def retrieve(self, request, *args, **kwargs):
+		version = getattr(request, 'version_etag', None)
+		if not event_cache.enabled or version is None:  # No such event: let retrieve() 404
+			return super().retrieve(request, *args, **kwargs)
+		data = event_cache.get_or_build(
+			event_cache.detail_key(kwargs['pk'], version),
+			lambda: self.cacheable_data(super(EventViewSet, self).retrieve(request, *args, **kwargs)),
+		)
+		return Response(data)
+
+	@staticmethod
+	def cacheable_data(response):
+		# Plain lists/dicts: the serializer's ReturnList/ReturnDict would pickle the serializer with them.
+		if isinstance(response.data, list):
+			return list(response.data)
+		return dict(response.data)
+
+	def get_queryset(self):
+		"""
+		Optional filters, all index-backed:
+		  ?near=<lon>,<lat>&radius=<km>   events within radius, closest first
+		  ?event_type=sport
+		  ?date_from=<iso datetime>&date_to=<iso datetime>
+		"""
+		queryset = Event.objects.all()
+		params = self.request.query_params
+
+		event_type = params.get('event_type')
+		if event_type:
+			queryset = queryset.filter(event_type=event_type)
+		date_from = self.parse_date_param('date_from')
+		if date_from:
+			queryset = queryset.filter(date__gte=date_from)
+		date_to = self.parse_date_param('date_to')
+		if date_to:
+			queryset = queryset.filter(date__lte=date_to)
+
+		near = params.get('near')
+		if near:
+			try:
+				lon, lat = (float(value) for value in near.split(','))
+				radius = float(params.get('radius', settings.EVENTS_NEAR_DEFAULT_RADIUS_KM))
+			except ValueError:
+				raise ValidationError({"near": "Expected near=<lon>,<lat> and a numeric radius in km."})
+			if not all(math.isfinite(value) for value in (lon, lat, radius)):
+				raise ValidationError({"near": "Coordinates and radius must be finite numbers."})
+			if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+				raise ValidationError({"near": "Longitude must be within -180..180 and latitude within -90..90."})
+			if radius <= 0:
+				raise ValidationError({"radius": "radius must be positive."})
+			radius = min(radius, settings.EVENTS_NEAR_MAX_RADIUS_KM)
+			point = Point(lon, lat, srid=4326)
+			queryset = queryset.filter(
+				location__dwithin=(point, D(km=radius))
+			).annotate(
+				distance=DistanceFunc('location', point)
+			).order_by('distance')
+		return queryset
+
+	def parse_date_param(self, name):
+		value = self.request.query_params.get(name)
+		if not value:
+			return None
+		try:
+			parsed = parse_datetime(value.replace(' ', '+')) or parse_date(value)
+		except ValueError:  # Well formed but impossible, e.g. 2024-02-30
+			parsed = None
+		if parsed is None:
+			raise ValidationError({name: "Expected an ISO 8601 date or datetime."})
+		return parsed
+
+	@action(detail=False, methods=['get'])
+	def search(self, request):
+		"""
+		Full-text search over title and description, best matches first.
+		GET /api/events/search/?q=salsa night&limit=20&cursor=<next>
+		"""
+		text, limit, cursor = search_params(request)
+		page, next_cursor = ranked_search(Event.objects.all(), text, limit, cursor)
+		serializer = self.get_serializer(page, many=True)
+		return Response({"results": serializer.data, "next": next_cursor})
+
 	def perform_create(self, serializer):
         # Set the user as the organizer automatically
 		serializer.save(organizer=self.request.user)
\ No newline at end of file
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'django_otp',
     'django_otp.plugins.otp_static',
@@ -168,6 +169,11 @@ REST_FRAMEWORK = {
     ),
 }
 
+SIMPLE_JWT = {
+    # Tokens carry the username so WebSocket connects don't need a user lookup
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.TokenObtainPairWithUsernameSerializer',
+}
+
 AUTHENTICATION_BACKENDS = [
     'axes.backends.AxesStandaloneBackend',  # For django-axes v5+
     'django.contrib.auth.backends.ModelBackend',
@@ -236,6 +242,135 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat message persistence. When ENABLED, messages are broadcast straight away and written
+# with bulk_create every FLUSH_INTERVAL_MS or as soon as MAX_BATCH messages are pending.
+CHAT_WRITE_BEHIND = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL_MS': 50,
+    'MAX_BATCH': 200,
+}
+
+# Chat fan-out wire options (see users.wire). Sockets opting in with ?batch=1 get the messages
+# arriving within BATCH_MS sent as one frame, at most MAX_BATCH per frame.
+CHAT_FANOUT = {
+    'BATCH_MS': 5,
+    'MAX_BATCH': 50,
+}
+
+# "read" frames on the chat sockets are coalesced for FLUSH_MS before the read cursor is written
+CHAT_READ_RECEIPTS = {
+    'FLUSH_MS': 500,
+}
+
+# Each chat socket remembers the last WINDOW messageIds it received, so resent messages are acked
+# again without a query; older resends are caught by ChatMessage's (chat, sender, client_id) constraint.
+CHAT_MESSAGE_DEDUP = {
+    'WINDOW': 256,
+}
+
+# Incoming WebSocket frames (see users.ratelimit): token buckets per connection (RATE/BURST) and per
+# user (USER_RATE/USER_BURST; kept in the cache across processes when SHARED). Frames over the limit
+# wait up to MAX_DELAY_MS, then are dropped; CLOSE_AFTER_DROPS drops in a row close the socket.
+CHAT_RATE_LIMIT = {
+    'RATE': 5,
+    'BURST': 20,
+    'USER_RATE': 10,
+    'USER_BURST': 40,
+    'SHARED': False,
+    'CACHE_ALIAS': 'default',
+    'MAX_FRAME_BYTES': 16 * 1024,
+    'MAX_DELAY_MS': 250,
+    'CLOSE_AFTER_DROPS': 50,
+}
+
+# ws/chats/<chat_id>/?since=<message id> replays the missed messages CHUNK at a time before live
+# delivery, MAX_MESSAGES at most; longer gaps are left to the history API.
+CHAT_REPLAY = {
+    'CHUNK': 100,
+    'MAX_MESSAGES': 1000,
+}
+
+# Profile pictures are stored under their content hash with these thumbnails rendered on upload
+# (longest side in pixels); `manage.py backfill_thumbnails` processes pictures uploaded before.
+PROFILE_THUMBNAILS = {
+    'SIZES': {'small': 96, 'medium': 320, 'large': 800},
+    'FORMAT': 'WEBP',
+    'QUALITY': 80,
+}
+
+# Limits of profile picture uploads through PATCH /api/users/me/, enforced while the upload streams in
+PROFILE_PICTURE_UPLOAD = {
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'MAX_PIXELS': 40_000_000,
+}
+
+# Keyset pagination of the profile list, /api/users/
+USER_PROFILES_PAGE_SIZE = 50
+USER_PROFILES_MAX_PAGE_SIZE = 100
+
+# Keyset pagination of /api/chats/<chat_id>/messages/
+CHAT_MESSAGES_PAGE_SIZE = 50
+CHAT_MESSAGES_MAX_PAGE_SIZE = 200
+
+# Chat membership checks on WebSocket connect are cached in this cache backend for TTL seconds.
+# Removing a participant only clears the entry everywhere when the cache is shared (e.g. Redis);
+# with the per-process default cache, entries are kept for LOCAL_TTL seconds at most.
+CHAT_MEMBERSHIP_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 300,
+    'LOCAL_TTL': 5,
+}
+
+# WebSocket JWT auth: users are loaded from the DB (and checked for is_active) on connect, cached
+# for USER_CACHE_TTL seconds. STATELESS builds the user from the token claims instead, with no
+# query, but then deactivating or deleting a user only locks them out once their access token
+# expires (SimpleJWT's ACCESS_TOKEN_LIFETIME, 5 minutes by default).
+WS_JWT_AUTH = {
+    'STATELESS': False,
+    'USER_CACHE_TTL': 30,
+    'CACHE_ALIAS': 'default',
+}
+
+# /api/events/?near=<lon>,<lat>&radius=<km>
+EVENTS_NEAR_DEFAULT_RADIUS_KM = 10
+EVENTS_NEAR_MAX_RADIUS_KM = 500
+
+# /api/nearby-users/: radius in km (capped at MAX_RADIUS_KM) and page sizes
+NEARBY_USERS = {
+    'DEFAULT_RADIUS_KM': 5,
+    'MAX_RADIUS_KM': 50,
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 100,
+    # sort=match ranks at most this many of the closest users
+    'CANDIDATE_CAP': 2000,
+}
+
+# Cache of serialised /api/events/ responses (see events.cache). Any Django cache backend works;
+# without CACHES configured this is the per-process local memory cache. With a shared backend the
+# list's ETag also comes from the cache, so a cached list is answered without any query.
+EVENT_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TTL': 30,
+    'STALE_TTL': 300,
+}
+
+# Full-text search over profiles (/api/users/search/) and events (/api/events/search/)
+SEARCH = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 50,
+}
+
+# In-process cache of profile locations bucketed by geohash cell, used by /api/nearby-users/.
+# PRECISION is the geohash length (5 = ~4.9 km cells); cells are reloaded after TTL seconds.
+NEARBY_USERS_CACHE = {
+    'ENABLED': False,
+    'PRECISION': 5,
+    'TTL': 60,
+    'MAX_CELLS': 10000,
+    'MAX_CELLS_PER_QUERY': 64,
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -0,0 +1,63 @@
+import functools
+import hashlib
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+class ConditionalGetStats:
+    """How many conditional GETs were answered with 304 instead of a serialised body."""
+
+    def __init__(self):
+        self.checked = 0
+        self.not_modified = 0
+
+    def stats(self):
+        return {
+            'checked': self.checked,
+            'not_modified': self.not_modified,
+            'not_modified_rate': round(self.not_modified / self.checked, 3) if self.checked else 0.0,
+        }
+
+
+conditional_stats = ConditionalGetStats()
+
+
+def conditional_get(version_func):
+    """
+    ETag / Last-Modified support for a DRF view method.
+    version_func(view, request, *args, **kwargs) returns (parts, last_modified) describing the current
+    version of what the method would return, or None to skip the check. It should be a cheap query
+    (a timestamp, an aggregate) rather than the data itself: when the client's If-None-Match or
+    If-Modified-Since still matches, the view method and its serialisation don't run at all.
+    last_modified may be None, and should be for aggregated lists: a newest timestamp misses deleted
+    rows and has one-second resolution in HTTP, so If-Modified-Since could answer 304 for a changed list.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            version = version_func(self, request, *args, **kwargs) if request.method in ('GET', 'HEAD') else None
+            if version is None:
+                return view_method(self, request, *args, **kwargs)
+
+            parts, last_modified = version
+            # The path and query string are part of the version: filtered lists get their own ETags.
+            source = '|'.join(str(part) for part in (request.get_full_path(), *parts))
+            etag = quote_etag(hashlib.blake2b(source.encode(), digest_size=16).hexdigest())
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            # Lets the view key caches on the same version the client sees (see events.cache).
+            request.version_etag = etag
+
+            conditional_stats.checked += 1
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                conditional_stats.not_modified += 1
+            else:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers['ETag'] = etag
+            if timestamp is not None:
+                response.headers['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
@@ -1,17 +1,438 @@
+import asyncio
 import json
 import logging
+from collections import OrderedDict
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from users.models import Chat
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from users.membership import membership_cache
+from users.inbox import mark_read
+from users.notifications import get_pending, notification_event, mark_delivered
+from users.persistence import find_duplicate, get_write_behind
+from users.ratelimit import rate_limiter
+from users.wire import JSON, MSGPACK, batch_frame, encode_for, encode_frame, fanout_config, msgpack, negotiate
 
 logger = logging.getLogger(__name__)
 
-class ChatConsumer(AsyncWebsocketConsumer):
+READ_RECEIPTS_DEFAULTS = {
+    'FLUSH_MS': 500,  # read frames within this window are written as one cursor update per chat
+}
+
+
+MESSAGE_DEDUP_DEFAULTS = {
+    # messageIds remembered per socket; resends older than that are caught by the unique constraint
+    'WINDOW': 256,
+}
+CLIENT_ID_MAX_LENGTH = 64
+
+REPLAY_DEFAULTS = {
+    'CHUNK': 100,  # messages per query and per burst on the socket
+    'MAX_MESSAGES': 1000,  # beyond this the client is told to page the rest over the history API
+}
+
+
+def read_receipts_config():
+    return {**READ_RECEIPTS_DEFAULTS, **getattr(settings, 'CHAT_READ_RECEIPTS', {})}
+
+
+def message_dedup_config():
+    return {**MESSAGE_DEDUP_DEFAULTS, **getattr(settings, 'CHAT_MESSAGE_DEDUP', {})}
+
+
+def replay_config():
+    return {**REPLAY_DEFAULTS, **getattr(settings, 'CHAT_REPLAY', {})}
+
+
+def replay_since(scope):
+    """
+    The ?since= of a reconnecting socket as a message id: the id of the last message the client has,
+    or a '<created_at>,<id>' history cursor. None when the client didn't ask for a replay.
+    """
+    value = parse_qs(scope.get('query_string', b'').decode()).get('since', [''])[0]
+    pk = value.rpartition(',')[2]
+    return int(pk) if pk.isdigit() else None
+
+
+def missed_messages(chat_id, after_id, limit):
+    """One range read of the (chat, id) index: the chat's messages after after_id, oldest first."""
+    from users.models import ChatMessage
+    return list(
+        ChatMessage.objects.filter(chat_id=chat_id, id__gt=after_id).order_by('id')
+        .values('id', 'sender_id', 'sender__username', 'message', 'client_id', 'created_at')[:limit]
+    )
+
+
+def client_message_id(value):
+    """A frame's messageId as stored in ChatMessage.client_id, or None if it can't identify the message."""
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        return None
+    value = str(value)
+    return value if 0 < len(value) <= CLIENT_ID_MAX_LENGTH else None
+
+
+def ack_frame(chat_id, messageId, chat_message):
+    return {
+        'type': 'ack',
+        'chat_id': int(chat_id),
+        'messageId': messageId,
+        'id': chat_message.pk,
+        'created_at': chat_message.created_at.isoformat(),
+    }
+
+
+def chat_group(chat_id):
+    return f'chat_{chat_id}'
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+class ChatMessagingMixin:
+    """
+    Sending and delivering chat messages, shared by the per-chat and the per-user consumer.
+    Messages are encoded once by the sender and handed to every recipient socket as is; each socket
+    sends them as JSON text or msgpack binary frames, optionally batched (see users.wire).
+    A message sent with a messageId is stored once per (chat, sender, messageId) and acknowledged
+    to the sender with {"type": "ack", "messageId": ..., "id": <server id>, "created_at": ...};
+    resending it, e.g. after a reconnect, only repeats the ack.
+    Incoming frames are rate limited per socket and per user (see users.ratelimit): frames over
+    the limit are held back briefly, then dropped with an error, and a socket that keeps
+    sending anyway is closed.
+    """
+    wire_format = JSON
+    batch_interval = 0
+
+    def setup_wire(self):
+        # Call from connect(), before accept().
+        self.wire_format, self.batch_interval = negotiate(self.scope)
+        self.max_batch = fanout_config()['MAX_BATCH']
+        self.pending_frames = []
+        self.flush_task = None
+        self.pending_reads = {}  # chat_id -> furthest message id read, not yet written
+        self.read_flush_task = None
+        self.recent_client_ids = OrderedDict()  # (chat_id, client_id) -> ack frame, or None until written
+        self.dedup_window = message_dedup_config()['WINDOW']
+        self.ack_tasks = set()
+        self.rate_limit = rate_limiter.connect(self.scope["user"].pk)
+        self.replayed = {}  # chat_id -> replayed_keys() of the messages sent by replay_missed()
+
+    async def admit_frame(self, text_data, bytes_data):
+        """Size and rate check for an incoming frame; waits if it has to. False if the frame is dropped."""
+        limit = self.rate_limit
+        size = len(text_data.encode()) if text_data is not None else len(bytes_data or b'')
+        if size > limit.config['MAX_FRAME_BYTES']:
+            rate_limiter.oversized_frames += 1
+            return await self.drop_frame({'type': 'error', 'detail': "Frame too large", 'max_bytes': limit.config['MAX_FRAME_BYTES']})
+        wait = await rate_limiter.admit(limit)
+        if wait is None:
+            # A message dropped here can be resent with the same messageId.
+            return await self.drop_frame({'type': 'error', 'detail': "Rate limit exceeded", 'retry_after_ms': limit.config['MAX_DELAY_MS']})
+        limit.drops = 0
+        if wait:
+            # Frames are handled one at a time, so holding this one back holds back the socket.
+            await asyncio.sleep(wait)
+        return True
+
+    async def drop_frame(self, error):
+        limit = self.rate_limit
+        limit.drops += 1
+        if limit.drops == limit.config['CLOSE_AFTER_DROPS']:
+            rate_limiter.closed_connections += 1
+            logger.warning(f"Closing socket of user {limit.user_id} after {limit.drops} dropped frames")
+            await self.close(code=1008)  # Policy violation
+        elif limit.drops == 1:
+            # Once per run of dropped frames, so a flooding client doesn't get a flood back.
+            await self.send_frame(error)
+        return False
+
+    async def post_message(self, chat_id, message, messageId=None):
+        # Use the authenticated user from the connection as sender
+        sender = self.scope["user"]
+        client_id = client_message_id(messageId)
+        key = (int(chat_id), client_id)
+        if client_id is not None and key in self.recent_client_ids:
+            # Sent again on this socket: no need to ask the database.
+            ack = self.recent_client_ids[key]
+            if ack is not None:  # Otherwise the ack follows once the first copy is written
+                await self.send_frame(ack)
+            return
+
+        write_behind = get_write_behind()
+        message_pk = None
+        if write_behind:
+            if client_id is not None:
+                # A resend from an earlier connection: the first copy is still queued or already
+                # stored (one probe of the client_id index), and was broadcast then. Only ack it.
+                written = write_behind.queued(chat_id, sender.pk, client_id)
+                if written is not None:
+                    self.ack_later(key, messageId, written)
+                    return
+                stored = await database_sync_to_async(find_duplicate)(chat_id, sender.pk, client_id)
+                if stored is not None:
+                    ack = ack_frame(chat_id, messageId, stored)
+                    self.remember_client_id(key, ack)
+                    await self.send_frame(ack)
+                    return
+            # Write-behind mode: queue the message for the next batch and broadcast right away.
+            written = write_behind.enqueue(chat_id, sender.pk, message, client_id)
+            if client_id is not None:
+                self.ack_later(key, messageId, written)
+        else:
+            # Save the message to the database
+            chat_message, created = await self.save_message(chat_id, message, sender, client_id)
+            message_pk = chat_message.pk
+            if client_id is not None:
+                ack = ack_frame(chat_id, messageId, chat_message)
+                self.remember_client_id(key, ack)
+                await self.send_frame(ack)
+            if not created:
+                return  # Stored and broadcast before the client reconnected
+
+        # Broadcast message to the chat group, encoded once for all recipients.
+        frame = {
+            'type': 'message',
+            'id': message_pk,  # Server id, for read cursors; not known yet in write-behind mode
+            'chat_id': int(chat_id),
+            'message': message,
+            'sender': str(sender.pk),
+            'sender_username': sender.username,
+            'messageId': messageId,
+        }
+        await self.channel_layer.group_send(
+            chat_group(chat_id),
+            # Calls chat message handler; the ids let sockets skip messages they replayed.
+            {
+                'type': 'chat_message', 'id': message_pk, 'chat_id': int(chat_id),
+                'sender_id': sender.pk, 'client_id': client_id, **encode_frame(frame),
+            },
+        )
+
+    def remember_client_id(self, key, ack):
+        self.recent_client_ids[key] = ack
+        self.recent_client_ids.move_to_end(key)
+        if len(self.recent_client_ids) > self.dedup_window:
+            self.recent_client_ids.popitem(last=False)
+
+    def ack_later(self, key, messageId, written):
+        self.remember_client_id(key, None)
+        task = asyncio.ensure_future(self.ack_when_written(key, messageId, written))
+        self.ack_tasks.add(task)
+        task.add_done_callback(self.ack_tasks.discard)
+
+    async def ack_when_written(self, key, messageId, written):
+        # shield(): cancelling this task on disconnect must not cancel the write-behind future.
+        chat_message = await asyncio.shield(written)
+        if chat_message is None:
+            self.recent_client_ids.pop(key, None)  # Let a resend try again
+            await self.send_frame({'type': 'error', 'chat_id': key[0], 'messageId': messageId, 'detail': "Message could not be saved"})
+            return
+        ack = ack_frame(key[0], messageId, chat_message)
+        if key in self.recent_client_ids:
+            self.recent_client_ids[key] = ack
+        await self.send_frame(ack)
+
+    async def chat_message(self, event):
+        if JSON not in event:
+            # Sent by a process still on the dict payload (rolling deploys).
+            event = encode_frame({
+                'type': 'message',
+                'chat_id': event.get('chat_id'),
+                'message': event['message'],
+                'sender': event['sender'],
+                'sender_username': event.get('sender_username', event['sender']),
+                'messageId': event.get('messageId'),
+            })
+        elif self.replayed and not self.replayed_keys(event).isdisjoint(self.replayed.get(event.get('chat_id'), ())):
+            return  # Already sent by replay_missed()
+        await self.send_encoded(event)
+
+    @staticmethod
+    def replayed_keys(message):
+        """
+        What identifies a message, live or replayed: its id, and (sender, messageId) for messages sent
+        with one. Live frames in write-behind mode have no id yet, so only the messageId can match them.
+        """
+        keys = set()
+        if message.get('id') is not None:
+            keys.add(('id', message['id']))
+        if message.get('client_id') is not None:
+            keys.add(('client_id', message['sender_id'], message['client_id']))
+        return keys
+
+    async def replay_missed(self, chat_id, since):
+        """
+        Send the messages of a chat after message id `since`, oldest first, CHUNK per query, followed by
+        {"type": "replayed", "chat_id": ..., "count": ..., "last_id": ..., "complete": ...}; when complete
+        is false the client pages the rest with ?after= on the history API.
+        Call from connect() after joining the chat group: live messages queue up until connect()
+        returns, so they arrive after the replay, and the ones the replay already sent are skipped.
+        Those are matched one by one rather than by id range: ids are assigned before commit, so a
+        message with a lower id than the replayed ones can still be committed and broadcast later.
+        """
+        config = replay_config()
+        last_id, count, complete = since, 0, True
+        replayed = self.replayed[chat_id] = set()
+        while True:
+            limit = min(config['CHUNK'], config['MAX_MESSAGES'] - count)
+            # One extra row tells whether anything is left after this chunk.
+            rows = await database_sync_to_async(missed_messages)(chat_id, last_id, limit + 1)
+            more, rows = len(rows) > limit, rows[:limit]
+            for row in rows:
+                replayed |= self.replayed_keys(row)
+                await self.send_frame({
+                    'type': 'message',
+                    'id': row['id'],
+                    'chat_id': chat_id,
+                    'message': row['message'],
+                    'sender': str(row['sender_id']),
+                    'sender_username': row['sender__username'],
+                    'messageId': row['client_id'],
+                    'created_at': row['created_at'].isoformat(),
+                })
+            count += len(rows)
+            if rows:
+                last_id = rows[-1]['id']
+            if not more:
+                break
+            if count >= config['MAX_MESSAGES']:
+                complete = False
+                break
+        await self.send_frame({'type': 'replayed', 'chat_id': chat_id, 'count': count, 'last_id': last_id, 'complete': complete})
+
+    async def read_frame(self, chat_id, data):
+        """{"type": "read", "message_id": 123}: the user has read the chat up to that message."""
+        try:
+            message_id = int(data.get('message_id'))
+        except (TypeError, ValueError):
+            await self.send_frame({'type': 'error', 'chat_id': chat_id, 'detail': "message_id is required"})
+            return
+        # Scrolling produces a stream of these; only the furthest one per chat is written, once per FLUSH_MS.
+        self.pending_reads[chat_id] = max(message_id, self.pending_reads.get(chat_id, 0))
+        if self.read_flush_task is None:
+            self.read_flush_task = asyncio.ensure_future(self.flush_reads_later())
+
+    async def flush_reads_later(self):
+        await asyncio.sleep(read_receipts_config()['FLUSH_MS'] / 1000)
+        self.read_flush_task = None
+        await self.flush_reads()
+
+    async def flush_reads(self):
+        reads, self.pending_reads = self.pending_reads, {}
+        user = self.scope["user"]
+        for chat_id, message_id in reads.items():
+            if not await database_sync_to_async(mark_read)(user.pk, chat_id, message_id):
+                continue
+            # Receipt for the other participants and the user's other sockets
+            await self.channel_layer.group_send(chat_group(chat_id), {
+                'type': 'read_receipt',
+                **encode_frame({'type': 'read', 'chat_id': int(chat_id), 'user_id': str(user.pk), 'message_id': message_id}),
+            })
+
+    async def read_receipt(self, event):
+        await self.send_encoded(event)
+
+    def decode_frame(self, text_data, bytes_data):
+        """Incoming frame as a dict: JSON text, or msgpack binary on sockets that negotiated it."""
+        try:
+            if bytes_data is not None and self.wire_format == MSGPACK:
+                data = msgpack.unpackb(bytes_data)
+            else:
+                data = json.loads(text_data if text_data is not None else bytes_data)
+        except (ValueError, TypeError):  # JSONDecodeError and msgpack's ExtraData/FormatError are ValueErrors
+            logger.error("Invalid frame received")
+            return None
+        return data if isinstance(data, dict) else None
+
+    async def send_frame(self, frame):
+        """Send a frame meant for this socket only, in its wire format."""
+        await self.send_encoded({self.wire_format: encode_for(frame, self.wire_format)})
+
+    async def send_encoded(self, encoded):
+        """Send a frame from encode_frame(), batching it if the socket asked for that."""
+        data = encoded.get(self.wire_format)
+        if data is None:
+            # Sent by a process without msgpack: re-encode rather than mix JSON text into a binary socket.
+            data = encode_for(json.loads(encoded[JSON]), self.wire_format)
+        if not self.batch_interval:
+            await self.send_data(data)
+            return
+        self.pending_frames.append(data)
+        if len(self.pending_frames) >= self.max_batch:
+            await self.flush_frames()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_frames_later())
+
+    async def flush_frames_later(self):
+        await asyncio.sleep(self.batch_interval)
+        self.flush_task = None
+        await self.flush_frames()
+
+    async def flush_frames(self):
+        if self.flush_task is not None and self.flush_task is not asyncio.current_task():
+            self.flush_task.cancel()
+            self.flush_task = None
+        frames, self.pending_frames = self.pending_frames, []
+        if len(frames) == 1:
+            await self.send_data(frames[0])
+        elif frames:
+            await self.send_data(batch_frame(frames, self.wire_format))
+
+    async def send_data(self, data):
+        if isinstance(data, bytes):
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
+
+    async def close_wire(self):
+        # Call from disconnect(): nothing can be delivered anymore, but pending read cursors are still saved.
+        if getattr(self, 'flush_task', None) is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if getattr(self, 'read_flush_task', None) is not None:
+            self.read_flush_task.cancel()
+            self.read_flush_task = None
+        for task in list(getattr(self, 'ack_tasks', ())):
+            task.cancel()
+        if getattr(self, 'rate_limit', None) is not None:
+            rate_limiter.disconnect(self.rate_limit)
+            self.rate_limit = None
+        if getattr(self, 'pending_reads', None):
+            await self.flush_reads()
+
+    async def flush_pending_messages(self):
+        # Make sure nothing this socket sent is left only in memory.
+        write_behind = get_write_behind()
+        if write_behind:
+            await write_behind.flush()
+
+    @database_sync_to_async
+    def save_message(self, chat_id, message, sender, client_id=None):
+        """Returns (ChatMessage, created); created is False when client_id was already stored."""
+        # Import locally to avoid circular imports.
+        from users.models import ChatMessage
+        from users.inbox import record_messages
+        chat_message = ChatMessage(chat_id=chat_id, sender_id=sender.pk, message=message, client_id=client_id)
+        try:
+            with transaction.atomic():
+                chat_message.save()
+                # Keep Chat.last_message/updated_at and the participants' inbox rows current.
+                record_messages([chat_message])
+        except IntegrityError:
+            existing = find_duplicate(chat_id, sender.pk, client_id)
+            if existing is None:
+                raise
+            return existing, False
+        return chat_message, True
+
+
+class ChatConsumer(ChatMessagingMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Extract chat_id from the URL
         logger.info(f"User in scope: {self.scope.get('user')}")
         self.chat_id = self.scope['url_route']['kwargs']['chat_id']
-        self.chat_group_name = f'chat_{self.chat_id}'
+        self.chat_group_name = chat_group(self.chat_id)
 
         if not self.scope["user"].is_authenticated:
             await self.close()
@@ -29,76 +450,168 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.chat_group_name,
             self.channel_name
         )
+        self.setup_wire()
         await self.accept()
         logger.info(f"User {self.scope['user']} connected to chat {self.chat_id}")
 
+        # Reconnecting with ?since=<last message id>: send what the client missed before live delivery starts.
+        since = replay_since(self.scope)
+        if since is not None:
+            await self.replay_missed(int(self.chat_id), since)
+
     async def disconnect(self, close_code):
+        await self.close_wire()
+        if not hasattr(self, 'chat_group_name'):
+            return
         # Leave chat group
         await self.channel_layer.group_discard(
             self.chat_group_name,
             self.channel_name
         )
+        await self.flush_pending_messages()
 
-    async def receive(self, text_data):
-        try:
-            data = json.loads(text_data)
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON received")
+    async def receive(self, text_data=None, bytes_data=None):
+        if not await self.admit_frame(text_data, bytes_data):
+            return
+        data = self.decode_frame(text_data, bytes_data)
+        if data is None:
+            return
+        if data.get('type') == 'read':
+            await self.read_frame(int(self.chat_id), data)
             return
         message = data.get('message')
         messageId = data.get('messageId') # Extract messageId from the payload
-        # Use the authenticated user from the connection as sender
-        sender = self.scope["user"]
         if not message:
             logger.warning("Empty message received; ignoring.")
             return
-        
-        # Save the message to the database
-        await self.save_message(message, sender)
+        await self.post_message(self.chat_id, message, messageId)
 
-        # Broadcast message to the chat group
-        await self.channel_layer.group_send(
-            self.chat_group_name,
-            {
-                'type': 'chat_message', # Calls chat message handler
-                'message': message,
-                'sender': str(sender.pk),
-                'sender_username': sender.username,
-                'messageId': messageId,
-            }
+    async def user_is_allowed(self):
+        # Served from the membership cache; reconnect storms don't reach the DB.
+        return await membership_cache.is_member(self.chat_id, self.scope["user"].pk)
+
+
+class UserConsumer(ChatMessagingMixin, AsyncWebsocketConsumer):
+    """
+    One socket per user (ws/me/) instead of one per chat.
+    Joins all of the user's chat groups plus a personal group, and accepts these frames:
+      {"type": "subscribe", "chat_id": 1}      join a chat (e.g. one created after connecting)
+      {"type": "unsubscribe", "chat_id": 1}    leave a chat
+      {"type": "message", "chat_id": 1, "message": "...", "messageId": "..."}   acked with {"type": "ack", ...}
+      {"type": "read", "chat_id": 1, "message_id": 123}   read up to a message; answered with a
+                                                         {"type": "read", ...} receipt to the chat
+    Every event sent to the client carries its chat_id.
+    """
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+
+        self.user_group_name = user_group(user.pk)
+        self.chat_ids = set(await self.get_chat_ids())
+        # Register all groups concurrently rather than one round trip after another.
+        await asyncio.gather(
+            self.channel_layer.group_add(self.user_group_name, self.channel_name),
+            *[self.channel_layer.group_add(chat_group(chat_id), self.channel_name) for chat_id in self.chat_ids],
         )
+        self.setup_wire()
+        await self.accept()
+        logger.info(f"User {user} connected to {len(self.chat_ids)} chats")
 
-    async def chat_message(self, event):
-        # Send message to WebSocket.
-        await self.send(text_data=json.dumps({
-            'message': event['message'],
-            'sender': event['sender'],
-            'sender_username': event.get('sender_username', event['sender']),
-            'messageId': event.get('messageId'),
-        }))
+        # Deliver what was queued while the user was offline. Pushes for these can still be
+        # in flight (they were sent after group_add), so remember them to avoid duplicates.
+        pending = await database_sync_to_async(get_pending)(user.pk)
+        self.replayed_notification_ids = {notification.id for notification in pending}
+        for notification in pending:
+            await self.send_notification(notification_event(notification))
+            await database_sync_to_async(mark_delivered)(notification.id)
 
-    @database_sync_to_async
-    def user_is_allowed(self):
-        try:
-            chat = Chat.objects.get(pk=self.chat_id)
-        except Chat.DoesNotExist:
-            logger.error(f"Chat with id {self.chat_id} does not exist.")
-            return False
+    async def disconnect(self, close_code):
+        await self.close_wire()
+        if not hasattr(self, 'user_group_name'):
+            return
+        await asyncio.gather(
+            self.channel_layer.group_discard(self.user_group_name, self.channel_name),
+            *[self.channel_layer.group_discard(chat_group(chat_id), self.channel_name) for chat_id in self.chat_ids],
+        )
+        await self.flush_pending_messages()
 
+    async def receive(self, text_data=None, bytes_data=None):
+        if not await self.admit_frame(text_data, bytes_data):
+            return
+        data = self.decode_frame(text_data, bytes_data)
+        if data is None:
+            return
         try:
-            user_pk = int(self.scope["user"].pk)
-        except (ValueError, TypeError):
-            logger.error(f"User pk is not convertible to int: {self.scope['user'].pk}")
-            return False
+            chat_id = int(data.get('chat_id'))
+        except (TypeError, ValueError):
+            await self.send_error("chat_id is required")
+            return
+
+        frame_type = data.get('type', 'message')
+        if frame_type == 'subscribe':
+            await self.subscribe(chat_id)
+        elif frame_type == 'unsubscribe':
+            await self.unsubscribe(chat_id)
+        elif frame_type == 'message':
+            message = data.get('message')
+            if not message:
+                logger.warning("Empty message received; ignoring.")
+                return
+            if chat_id not in self.chat_ids:
+                await self.send_error("Not subscribed to this chat", chat_id)
+                return
+            await self.post_message(chat_id, message, data.get('messageId'))
+        elif frame_type == 'read':
+            if chat_id not in self.chat_ids:
+                await self.send_error("Not subscribed to this chat", chat_id)
+                return
+            await self.read_frame(chat_id, data)
+        else:
+            await self.send_error(f"Unknown frame type {frame_type!r}", chat_id)
+
+    async def subscribe(self, chat_id):
+        if chat_id not in self.chat_ids:
+            if not await membership_cache.is_member(chat_id, self.scope["user"].pk):
+                await self.send_error("Not allowed in this chat", chat_id)
+                return
+            await self.channel_layer.group_add(chat_group(chat_id), self.channel_name)
+            self.chat_ids.add(chat_id)
+        await self.send_frame({'type': 'subscribed', 'chat_id': chat_id})
+
+    async def unsubscribe(self, chat_id):
+        if chat_id in self.chat_ids:
+            await self.channel_layer.group_discard(chat_group(chat_id), self.channel_name)
+            self.chat_ids.discard(chat_id)
+        await self.send_frame({'type': 'unsubscribed', 'chat_id': chat_id})
+
+    async def notify(self, event):
+        # Poke / new chat notification pushed to the user's personal group.
+        if event['id'] in getattr(self, 'replayed_notification_ids', ()):
+            return
+        chat_id = event['payload'].get('chat_id')
+        if chat_id is not None and chat_id not in self.chat_ids:
+            # A chat the user just became part of: start receiving its messages right away.
+            await self.channel_layer.group_add(chat_group(chat_id), self.channel_name)
+            self.chat_ids.add(chat_id)
+        await self.send_notification(event)
+        await database_sync_to_async(mark_delivered)(event['id'])
+
+    async def send_notification(self, event):
+        await self.send_frame({
+            'type': 'notification',
+            'id': event['id'],
+            'kind': event['kind'],
+            'chat_id': event['payload'].get('chat_id'),
+            'payload': event['payload'],
+            'created_at': event['created_at'],
+        })
 
-        participants_ids = list(chat.participants.values_list('id', flat=True))
-        logger.info(f"Chat participants: {participants_ids}, Current user pk: {user_pk}, type: {type(user_pk)}")
-        
-        return chat.participants.filter(pk=user_pk).exists()
+    async def send_error(self, detail, chat_id=None):
+        await self.send_frame({'type': 'error', 'chat_id': chat_id, 'detail': detail})
 
     @database_sync_to_async
-    def save_message(self, message, sender):
-        # Import ChatMessage locally to avoid circular imports.
-        from users.models import ChatMessage, Chat
-        chat = Chat.objects.get(pk=self.chat_id)
-        return ChatMessage.objects.create(chat=chat, sender=sender, message=message)
\ No newline at end of file
+    def get_chat_ids(self):
+        from users.models import ChatInbox
+        return list(ChatInbox.objects.filter(user_id=self.scope["user"].pk).values_list('chat_id', flat=True))
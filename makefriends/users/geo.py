@@ -0,0 +1,28 @@
+import math
+from django.contrib.gis.db.models.functions import GeoFunc
+from django.db.models import FloatField
+
+KM_PER_DEGREE = 111.32
+
+
+class KNNDistance(GeoFunc):
+    """
+    `location <-> point`, PostGIS' KNN distance operator. In ORDER BY it is answered from the
+    GiST index, nearest first, without computing the distance of every row. For SRID 4326
+    geometries the value is in degrees, so only use it for ordering; use Distance for display.
+    """
+    function = ''
+    arg_joiner = ' <-> '
+    template = '(%(expressions)s)'
+    geom_param_pos = (0, 1)
+    output_field = FloatField()
+
+
+def radius_in_degrees(radius_km, latitude):
+    """
+    Degrees that cover radius_km in every direction around latitude, for an index-friendly
+    ST_DWithin prefilter on SRID 4326 geometries (longitude degrees shrink towards the poles).
+    """
+    lat_degrees = radius_km / KM_PER_DEGREE
+    widest_latitude = min(abs(latitude) + lat_degrees, 89.0)
+    return radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest_latitude)))
@@ -0,0 +1,205 @@
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+
+NEARBY_CACHE_DEFAULTS = {
+    'ENABLED': False,
+    'PRECISION': 5,  # ~4.9 x 4.9 km cells
+    'TTL': 60,  # seconds before a cell is reloaded from the DB
+    'MAX_CELLS': 10000,  # least recently used cells are evicted beyond this
+    'MAX_CELLS_PER_QUERY': 64,  # larger searches go to PostGIS directly
+}
+
+# What the nearby search needs to know about a profile without touching the DB
+Candidate = namedtuple('Candidate', ['user_id', 'lon', 'lat', 'mood'])
+
+
+def geohash_encode(lat, lon, precision):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits = bits * 2
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def geohash_bbox(cell):
+    """(min_lon, min_lat, max_lon, max_lat) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        bits = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if bits >> shift & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+def cell_size(precision):
+    """(width, height) of a cell in degrees."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 360.0 / 2 ** lon_bits, 180.0 / 2 ** lat_bits
+
+
+def covering_cells(lat, lon, radius_km, precision):
+    """Geohash cells intersecting the bounding box of a circle around (lat, lon)."""
+    lat_delta = radius_km / 111.32
+    lon_delta = radius_km / (111.32 * max(math.cos(math.radians(min(abs(lat) + lat_delta, 89.0))), 1e-6))
+    min_lat, max_lat = max(lat - lat_delta, -90.0), min(lat + lat_delta, 90.0 - 1e-9)
+    min_lon, max_lon = max(lon - lon_delta, -180.0), min(lon + lon_delta, 180.0 - 1e-9)
+    width, height = cell_size(precision)
+    cells = set()
+    for row in range(int((max_lat - min_lat) / height) + 2):
+        cell_lat = min(min_lat + row * height, max_lat)
+        for column in range(int((max_lon - min_lon) / width) + 2):
+            cell_lon = min(min_lon + column * width, max_lon)
+            cells.add(geohash_encode(cell_lat, cell_lon, precision))
+    return cells
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class NearbyUsersCache:
+    """
+    Per-process cache of profile locations bucketed by geohash cell.
+    A nearby search reads the cells covering its radius, loads the missing or expired ones
+    from the DB in a single bounding-box query, and ranks the candidates in Python.
+    Profile writes move users between cached cells (see UserProfileSerializer.update); other
+    processes pick the change up when their copy of the cell expires.
+    """
+    def __init__(self):
+        self._cells = OrderedDict()  # cell -> (loaded_at, {user_id: Candidate})
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def config(self):
+        return {**NEARBY_CACHE_DEFAULTS, **getattr(settings, 'NEARBY_USERS_CACHE', {})}
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    def nearby(self, lat, lon, radius_km, exclude_user_id=None, mood=None):
+        """
+        Return [(distance_km, user_id)] within radius_km, closest first,
+        or None when the search covers too many cells to be served from the cache.
+        """
+        config = self.config
+        cells = covering_cells(lat, lon, radius_km, config['PRECISION'])
+        if len(cells) > config['MAX_CELLS_PER_QUERY']:
+            return None
+
+        members = self._get_cells(cells, config)
+        results = []
+        for candidate in members:
+            if candidate.user_id == exclude_user_id:
+                continue
+            if mood and (candidate.mood or '').lower() != mood.lower():
+                continue
+            distance = haversine_km(lat, lon, candidate.lat, candidate.lon)
+            if distance <= radius_km:
+                results.append((distance, candidate.user_id))
+        results.sort()
+        return results
+
+    def _get_cells(self, cells, config):
+        now = time.monotonic()
+        members, missing = [], []
+        with self._lock:
+            for cell in cells:
+                entry = self._cells.get(cell)
+                if entry is not None and now - entry[0] < config['TTL']:
+                    self._cells.move_to_end(cell)
+                    members.extend(entry[1].values())
+                    self.hits += 1
+                else:
+                    missing.append(cell)
+                    self.misses += 1
+        if missing:
+            loaded = self._load_cells(missing, config['PRECISION'])
+            with self._lock:
+                for cell, cell_members in loaded.items():
+                    self._cells[cell] = (now, cell_members)
+                    self._cells.move_to_end(cell)
+                    members.extend(cell_members.values())
+                while len(self._cells) > config['MAX_CELLS']:
+                    self._cells.popitem(last=False)
+        return members
+
+    @staticmethod
+    def _load_cells(cells, precision):
+        from users.models import UserProfile
+        boxes = [geohash_bbox(cell) for cell in cells]
+        # One query over the box enclosing all missing cells, bucketed in Python.
+        bbox = (
+            min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes),
+        )
+        loaded = {cell: {} for cell in cells}
+        rows = UserProfile.objects.filter(
+            location__bboverlaps=Polygon.from_bbox(bbox)
+        ).values_list('user_id', 'location', 'mood')
+        for user_id, location, mood in rows:
+            cell = geohash_encode(location.y, location.x, precision)
+            if cell in loaded:
+                loaded[cell][user_id] = Candidate(user_id, location.x, location.y, mood)
+        return loaded
+
+    def update_member(self, user_id, old_location, new_location, mood):
+        """Move a profile between cached cells after its location or mood changed."""
+        precision = self.config['PRECISION']
+        with self._lock:
+            if old_location is not None:
+                entry = self._cells.get(geohash_encode(old_location.y, old_location.x, precision))
+                if entry is not None:
+                    entry[1].pop(user_id, None)
+            if new_location is not None:
+                entry = self._cells.get(geohash_encode(new_location.y, new_location.x, precision))
+                if entry is not None:
+                    entry[1][user_id] = Candidate(user_id, new_location.x, new_location.y, mood)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'cells': len(self._cells),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+nearby_cache = NearbyUsersCache()
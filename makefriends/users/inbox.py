@@ -0,0 +1,109 @@
+from collections import Counter, defaultdict
+from django.db.models import BigIntegerField, Case, Count, Exists, F, IntegerField, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from users.models import Chat, ChatInbox, ChatMessage
+
+PREVIEW_LENGTH = ChatInbox._meta.get_field('last_message').max_length
+
+
+def preview(text):
+    return (text or '')[:PREVIEW_LENGTH]
+
+
+def record_messages(messages):
+    """
+    Update Chat and the participants' inbox rows for a list of saved messages.
+    Costs two UPDATEs per chat in the list, however many messages or participants it has.
+    """
+    by_chat = defaultdict(list)
+    for message in messages:
+        by_chat[message.chat_id].append(message)
+
+    for chat_id, chat_messages in by_chat.items():
+        last = max(chat_messages, key=lambda message: (message.created_at, message.id))
+        Chat.objects.filter(pk=chat_id).update(last_message=last.message, updated_at=last.created_at)
+
+        # Every participant gets one unread per message, minus the ones they sent themselves.
+        sent = Counter(message.sender_id for message in chat_messages)
+        own_messages = Case(
+            *[When(user_id=sender_id, then=Value(count)) for sender_id, count in sent.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        ChatInbox.objects.filter(chat_id=chat_id).update(
+            last_message=preview(last.message),
+            last_activity_at=last.created_at,
+            last_message_id=last.id,
+            unread_count=F('unread_count') + len(chat_messages) - own_messages,
+            # Whoever sent the latest message has read the chat up to it.
+            last_read_message_id=Case(
+                When(user_id=last.sender_id, then=Value(last.id)),
+                default=F('last_read_message_id'),
+                output_field=BigIntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+
+
+def sync_participants(chat_id):
+    """Create/delete inbox rows so they match the chat's participants, and refresh their names."""
+    participants = list(
+        Chat.participants.through.objects.filter(chat_id=chat_id).order_by('user_id').values_list('user_id', 'user__username')
+    )
+    user_ids = [user_id for user_id, _ in participants]
+    ChatInbox.objects.filter(chat_id=chat_id).exclude(user_id__in=user_ids).delete()
+
+    chat = Chat.objects.filter(pk=chat_id).values('last_message', 'updated_at').first()
+    if chat is None:
+        return
+    blocked = set(Chat.blocked_by.through.objects.filter(chat_id=chat_id).values_list('user_id', flat=True))
+    last_message_id = ChatMessage.objects.filter(chat_id=chat_id).order_by('-id').values_list('id', flat=True).first()
+    existing = {row.user_id: row for row in ChatInbox.objects.filter(chat_id=chat_id)}
+    to_create, to_update = [], []
+    for user_id, _ in participants:
+        # Same rule as the chat list always used: the first other participant names the chat.
+        name = next((username for other_id, username in participants if other_id != user_id), '')
+        row = existing.get(user_id)
+        if row is None:
+            to_create.append(ChatInbox(
+                user_id=user_id,
+                chat_id=chat_id,
+                name=name,
+                last_message=preview(chat['last_message']),
+                last_activity_at=chat['updated_at'],
+                last_message_id=last_message_id,
+                last_read_message_id=last_message_id,  # Joining doesn't make the history unread
+                blocked=user_id in blocked,
+            ))
+        elif row.name != name:
+            row.name = name
+            row.updated_at = timezone.now()
+            to_update.append(row)
+    ChatInbox.objects.bulk_create(to_create, ignore_conflicts=True)
+    ChatInbox.objects.bulk_update(to_update, ['name', 'updated_at'])
+
+
+def set_blocked(chat_id, user_ids, blocked):
+    ChatInbox.objects.filter(chat_id=chat_id, user_id__in=user_ids).update(blocked=blocked, updated_at=timezone.now())
+
+
+def mark_read(user_id, chat_id, message_id):
+    """
+    Move the user's read cursor in a chat forward to message_id and recount their unread messages,
+    in one UPDATE of their inbox row. Returns False if nothing changed: the cursor was already there
+    or further, or the message isn't in this chat.
+    """
+    unread_after = ChatMessage.objects.filter(
+        chat_id=chat_id, id__gt=message_id,
+    ).exclude(sender_id=user_id).order_by().values('chat_id').annotate(count=Count('id')).values('count')
+    return ChatInbox.objects.filter(
+        Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=message_id),
+        Exists(ChatMessage.objects.filter(chat_id=chat_id, id=message_id)),
+        user_id=user_id,
+        chat_id=chat_id,
+    ).update(
+        last_read_message_id=message_id,
+        unread_count=Coalesce(Subquery(unread_after), 0),
+        updated_at=timezone.now(),
+    ) > 0
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users.matching import FEATURE_FIELDS, build_features, feature_source
+from users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Build UserProfile.interest_vector/feature_vector from the free-text fields. Profiles are "
+        "streamed in primary key order, one chunk per query and transaction, so the command can be "
+        "interrupted and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help="Rebuild every profile, not only those without a feature vector")
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.only('id', *FEATURE_FIELDS).order_by('pk')
+        if not options['all']:
+            profiles = profiles.filter(feature_vector__isnull=True)
+
+        start = time.perf_counter()
+        last_pk, total = 0, 0
+        while True:
+            chunk = list(profiles.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not chunk:
+                break
+            for profile in chunk:
+                profile.interest_vector, profile.feature_vector = build_features(feature_source(profile))
+            with transaction.atomic():
+                UserProfile.objects.bulk_update(chunk, ['interest_vector', 'feature_vector'])
+            last_pk = chunk[-1].pk
+            total += len(chunk)
+            self.stdout.write(f"{total} profiles updated")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total} profiles in {time.perf_counter() - start:.1f}s"))
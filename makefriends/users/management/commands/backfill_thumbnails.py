@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from users.models import UserProfile
+from users.thumbnails import store_existing_picture
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing profile pictures to content-hash names and render their thumbnails. "
+        "Images are processed in a process pool, one chunk of profiles at a time; profiles that "
+        "already have thumbnails are skipped, so the command can be interrupted and re-run. "
+        "The original files are left in place."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True).filter(
+            profile_picture_thumbnails={},
+        ).only('id', 'profile_picture', 'updated_at').order_by('pk')
+
+        start = time.perf_counter()
+        last_pk, done, failed = 0, 0, 0
+        # Workers only touch storage; don't let forked children inherit open DB connections.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            while True:
+                chunk = list(profiles.filter(pk__gt=last_pk)[:options['chunk_size']])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+                results = dict(pool.map(store_existing_picture, {profile.profile_picture.name for profile in chunk}))
+
+                updated = []
+                for profile in chunk:
+                    result = results[profile.profile_picture.name]
+                    if result is None:
+                        failed += 1
+                        self.stderr.write(f"Profile {profile.pk}: could not process {profile.profile_picture.name}")
+                        continue
+                    profile.profile_picture, profile.profile_picture_thumbnails = result
+                    profile.updated_at = timezone.now()
+                    updated.append(profile)
+                UserProfile.objects.bulk_update(updated, ['profile_picture', 'profile_picture_thumbnails', 'updated_at'])
+                done += len(updated)
+                self.stdout.write(f"{done} pictures processed")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {done} pictures in {time.perf_counter() - start:.1f}s, {failed} failed"
+        ))
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from users.consumers import ChatConsumer
+from users.wire import JSON, MSGPACK, encode_frame, msgpack
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark chat fan-out on one core: encoding a message and handing it to N recipient sockets, "
+        "with the old per-socket json.dumps, the pre-encoded JSON and msgpack payloads, and batching. "
+        "Socket writes and the channel layer are not included."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000)
+        parser.add_argument('--recipients', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        sent = []
+
+        async def fake_send(text_data=None, bytes_data=None):
+            sent.append(text_data or bytes_data)
+
+        sender = User(pk=1, username='alice')  # Never saved; the consumers only read pk and username
+
+        def make_consumer(wire_format, batch_interval=0):
+            consumer = ChatConsumer()
+            consumer.scope = {'type': 'websocket', 'query_string': b'', 'user': sender}
+            consumer.setup_wire()
+            consumer.wire_format, consumer.batch_interval = wire_format, batch_interval
+            consumer.max_batch = options['batch_size']
+            consumer.send = fake_send
+            return consumer
+
+        def event_for(number):
+            return {
+                'type': 'message', 'chat_id': 1, 'message': f'message number {number} with some text',
+                'sender': '1', 'sender_username': 'alice', 'messageId': f'client-{number}',
+            }
+
+        async def old_path(recipients, count):
+            # What chat_message used to do: re-encode the dict for every socket.
+            for number in range(count):
+                event = event_for(number)
+                for _ in recipients:
+                    await fake_send(text_data=json.dumps(event))
+
+        async def encoded_path(recipients, count):
+            for number in range(count):
+                encoded = {'type': 'chat_message', **encode_frame(event_for(number))}
+                for consumer in recipients:
+                    await consumer.chat_message(encoded)
+            for consumer in recipients:
+                if consumer.batch_interval:
+                    await consumer.flush_frames()
+
+        count, recipient_count = options['messages'], options['recipients']
+        modes = [
+            ('old: json.dumps per socket', old_path, JSON, 0),
+            ('pre-encoded JSON', encoded_path, JSON, 0),
+            # A long interval, so batches are only sent when full (or flushed at the end)
+            ('pre-encoded JSON, batched', encoded_path, JSON, 3600),
+        ]
+        if msgpack is not None:
+            modes += [
+                ('pre-encoded msgpack', encoded_path, MSGPACK, 0),
+                ('pre-encoded msgpack, batched', encoded_path, MSGPACK, 3600),
+            ]
+
+        for label, path, wire_format, batch_interval in modes:
+            recipients = [make_consumer(wire_format, batch_interval) for _ in range(recipient_count)]
+            await path(recipients, 100)  # warm up
+            sent.clear()
+            start = time.perf_counter()
+            await path(recipients, count)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label:<30} {count / elapsed:>10,.0f} messages/s  "
+                f"{count * recipient_count / elapsed:>12,.0f} deliveries/s  {len(sent):>8} socket writes"
+            )
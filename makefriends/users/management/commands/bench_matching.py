@@ -0,0 +1,63 @@
+import random
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from users.matching import MOODS, CandidateBatch, hash_tokens, score_candidates, top_candidates
+
+INTEREST_WORDS = (
+    "hiking music football chess coding travel cooking art movies yoga climbing photography "
+    "reading running gaming dancing theatre wine coffee startups languages cycling"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark of nearby-user match scoring on synthetic candidates (no DB access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--budget-ms', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        count = options['candidates']
+        rng = random.Random(42)
+        today = date.today()
+
+        def random_profile():
+            return (
+                hash_tokens(" ".join(rng.sample(INTEREST_WORDS, rng.randint(0, 6)))),
+                rng.choice(MOODS + [None]),
+                today - timedelta(days=rng.randint(18 * 365, 60 * 365)) if rng.random() > 0.05 else None,
+            )
+
+        profiles = [random_profile() for _ in range(count)]
+        interest_vectors, moods, birth_dates = zip(*profiles)
+        distances = [rng.uniform(0, 5) for _ in range(count)]
+        my_vector, my_mood, my_birth_date = random_profile()
+
+        def build():
+            return CandidateBatch(range(1, count + 1), distances, interest_vectors, moods, birth_dates)
+
+        def rank(batch):
+            scores = score_candidates(batch, 5.0, my_vector, my_mood, my_birth_date)
+            return top_candidates(batch, scores, options['page_size'] + 1)
+
+        batch = build()
+        rank(batch)  # warm up
+
+        start = time.perf_counter()
+        for _ in range(options['repeat']):
+            batch = build()
+        build_ms = (time.perf_counter() - start) * 1000 / options['repeat']
+
+        start = time.perf_counter()
+        for _ in range(options['repeat']):
+            rank(batch)
+        rank_ms = (time.perf_counter() - start) * 1000 / options['repeat']
+
+        self.stdout.write(f"{count} candidates")
+        self.stdout.write(f"  build columns: {build_ms:.3f} ms/request")
+        self.stdout.write(f"  score + rank:  {rank_ms:.3f} ms/request")
+        style = self.style.SUCCESS if rank_ms <= options['budget_ms'] else self.style.ERROR
+        self.stdout.write(style(f"  budget {options['budget_ms']} ms: {'ok' if rank_ms <= options['budget_ms'] else 'exceeded'}"))
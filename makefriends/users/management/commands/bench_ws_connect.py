@@ -0,0 +1,52 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from users.middleware import jwt_auth, get_token_user, get_db_user
+from users.serializers import TokenObtainPairWithUsernameSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark WebSocket JWT user resolution: the old per-connect DB lookup, the cached DB lookup "
+        "and the stateless claims path. Thread hops and the session lookup of the old stack are not "
+        "included, so the old numbers are a lower bound."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--user-id', type=int, help="User to issue the token for (default: first user)")
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user_id']:
+            users = users.filter(pk=options['user_id'])
+        user = users.order_by('pk').first()
+        if user is None:
+            raise CommandError("No user to issue a token for.")
+        token = str(TokenObtainPairWithUsernameSerializer.get_token(user).access_token)
+        iterations = options['iterations']
+
+        def old_path():
+            auth = JWTAuthentication()
+            return auth.get_user(auth.get_validated_token(token))
+
+        def cached_path():
+            return get_db_user(jwt_auth.get_validated_token(token), cache_ttl=30)
+
+        def stateless_path():
+            return get_token_user(jwt_auth.get_validated_token(token))
+
+        for label, resolve in [('old (DB lookup)', old_path), ('cached DB lookup', cached_path), ('stateless claims', stateless_path)]:
+            resolve()  # warm up
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    resolve()
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label:<18} {elapsed / iterations * 1e6:9.1f} us/connect  "
+                f"{len(context.captured_queries) / iterations:.2f} queries/connect"
+            )
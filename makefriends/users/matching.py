@@ -0,0 +1,162 @@
+import hashlib
+import re
+from datetime import date
+import numpy as np
+from users.models import MOOD_CHOICES
+
+INTEREST_VECTOR_BITS = 256
+INTEREST_VECTOR_BYTES = INTEREST_VECTOR_BITS // 8
+
+# Weights of the match score components, each of which lies in [0, 1]
+SCORE_WEIGHTS = {
+    'distance': 0.35,
+    'interests': 0.35,
+    'mood': 0.2,
+    'age': 0.1,
+}
+AGE_SCALE_YEARS = 8.0  # an age gap of this many years scores exp(-1)
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+MOODS = [value for value, _ in MOOD_CHOICES]
+MOOD_INDEX = {mood: index for index, mood in enumerate(MOODS)}
+UNKNOWN_MOOD = len(MOODS)
+
+# How well two moods go together; symmetric, indexed by position in MOOD_CHOICES.
+# The last row/column is for profiles without a (known) mood.
+MOOD_COMPATIBILITY = np.full((len(MOODS) + 1, len(MOODS) + 1), 0.2, dtype=np.float32)
+np.fill_diagonal(MOOD_COMPATIBILITY, 1.0)
+for first, second in [
+    ('casual chat', 'new to town'),
+    ('casual chat', 'activity partner'),
+    ('activity partner', 'new to town'),
+    ('deep talk', 'casual chat'),
+    ('networking', 'new to town'),
+]:
+    MOOD_COMPATIBILITY[MOOD_INDEX[first], MOOD_INDEX[second]] = 0.6
+    MOOD_COMPATIBILITY[MOOD_INDEX[second], MOOD_INDEX[first]] = 0.6
+MOOD_COMPATIBILITY[UNKNOWN_MOOD, :] = 0.5
+MOOD_COMPATIBILITY[:, UNKNOWN_MOOD] = 0.5
+
+if hasattr(np, 'bitwise_count'):  # NumPy >= 2.0
+    def popcount_rows(words):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.uint16)
+else:
+    # Number of set bits of every byte value
+    POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint16)
+
+    def popcount_rows(words):
+        return POPCOUNT[words.view(np.uint8)].sum(axis=-1, dtype=np.uint16)
+
+EMPTY_VECTOR = bytes(INTEREST_VECTOR_BYTES)
+
+# Free-text profile fields making up UserProfile.feature_vector, one hashed segment each, in this order
+FEATURE_FIELDS = ('interests', 'personality', 'why')
+
+
+def tokenize(text):
+    return set(TOKEN_RE.findall((text or '').lower()))
+
+
+def hash_tokens(text, bits=INTEREST_VECTOR_BITS):
+    """
+    Fixed-width hashed bag of words: one bit per token, set at a stable hash of the token.
+    Comparing two of these with AND/OR popcounts approximates the Jaccard similarity of the token sets.
+    """
+    vector = bytearray(bits // 8)
+    for token in tokenize(text):
+        position = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little') % bits
+        vector[position // 8] |= 1 << (position % 8)
+    return bytes(vector)
+
+
+def feature_source(profile):
+    """The text the feature vector is built from; equal sources give equal vectors."""
+    return tuple(getattr(profile, field) or '' for field in FEATURE_FIELDS)
+
+
+def build_features(source):
+    """(interest_vector, feature_vector) for a feature_source() tuple."""
+    segments = [hash_tokens(text) for text in source]
+    return segments[0], b''.join(segments)
+
+
+def mood_index(mood):
+    return MOOD_INDEX.get((mood or '').lower(), UNKNOWN_MOOD)
+
+
+def age_in_years(birth_date, today=None):
+    if birth_date is None:
+        return np.nan
+    today = today or date.today()
+    return (today - birth_date).days / 365.2425
+
+
+def as_words(vectors, empty=EMPTY_VECTOR):
+    """Hashed vectors (bytes or None) as an (n, words per vector) uint64 array."""
+    data = b''.join(bytes(vector) if vector else empty for vector in vectors)
+    return np.frombuffer(data, dtype=np.uint64).reshape(-1, len(empty) // 8)
+
+
+class CandidateBatch:
+    """
+    Column arrays for a batch of candidates. Everything that doesn't depend on the searching
+    profile (mood indexes, ages, interest bit counts) is computed here once.
+    """
+    def __init__(self, user_ids, distances_km, interest_vectors, moods, birth_dates):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.distances = np.asarray(distances_km, dtype=np.float32)
+        self.interests = as_words(interest_vectors)
+        self.interest_bits = popcount_rows(self.interests)
+        self.moods = np.array([mood_index(mood) for mood in moods], dtype=np.intp)
+        # Day ordinals are much cheaper to convert than datetime64 from date objects
+        birth_days = np.array([birth_date.toordinal() if birth_date else np.nan for birth_date in birth_dates], dtype=np.float64)
+        self.ages = ((date.today().toordinal() - birth_days) / 365.2425).astype(np.float32)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+
+def score_candidates(batch, radius_km, interest_vector, mood, birth_date):
+    """Match score in [0, 1] for every candidate in the batch, relative to the searching profile."""
+    if not len(batch):
+        return np.zeros(0, dtype=np.float32)
+
+    distance_score = 1.0 - np.minimum(batch.distances * np.float32(1.0 / radius_km), np.float32(1.0))
+
+    # Jaccard similarity of the hashed token sets: |A & B| / (|A| + |B| - |A & B|)
+    mine = as_words([interest_vector])
+    shared = popcount_rows(batch.interests & mine).astype(np.float32)
+    union = batch.interest_bits + popcount_rows(mine)[0] - shared
+    interest_score = np.divide(shared, union, out=np.zeros(len(batch), dtype=np.float32), where=union > 0)
+
+    mood_score = MOOD_COMPATIBILITY[mood_index(mood)][batch.moods]
+
+    age_gap = np.abs(batch.ages - np.float32(age_in_years(birth_date)))
+    # Unknown ages (NaN) count as neutral
+    age_score = np.nan_to_num(np.exp(age_gap * np.float32(-1.0 / AGE_SCALE_YEARS)), nan=0.5)
+
+    scores = SCORE_WEIGHTS['distance'] * distance_score
+    scores += SCORE_WEIGHTS['interests'] * interest_score
+    scores += SCORE_WEIGHTS['mood'] * mood_score
+    scores += SCORE_WEIGHTS['age'] * age_score
+    return scores.astype(np.float32)
+
+
+def top_candidates(batch, scores, limit, after=None):
+    """
+    Positions of the best `limit` candidates ordered by (score desc, user id asc), optionally
+    only those ranked after the (score, user_id) keyset position `after`.
+    Uses a partial sort so the cost stays linear in the batch size.
+    """
+    eligible = np.arange(len(batch))
+    if after is not None:
+        after_score, after_user = np.float32(after[0]), after[1]
+        mask = (scores < after_score) | ((scores == after_score) & (batch.user_ids > after_user))
+        eligible = eligible[mask]
+    if len(eligible) > limit:
+        # Everything that can make the page: the top `limit`, plus anything tied with the cut-off score
+        cutoff = np.partition(-scores[eligible], limit - 1)[limit - 1]
+        eligible = eligible[-scores[eligible] <= cutoff]
+    order = np.lexsort((batch.user_ids[eligible], -scores[eligible]))
+    return eligible[order][:limit]
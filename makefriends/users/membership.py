@@ -0,0 +1,81 @@
+import logging
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from channels.db import database_sync_to_async
+from users.models import Chat
+
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_CACHE_DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 300,
+    # A per-process cache (LocMemCache) is only invalidated in the process that changed the chat,
+    # so entries there expire after LOCAL_TTL seconds instead of TTL.
+    'LOCAL_TTL': 5,
+}
+
+
+class MembershipCache:
+    """
+    Caches "user X is a participant of chat Y" in the configured Django cache backend, invalidated
+    when Chat.participants changes or the chat is deleted (see users.signals). Denials are never
+    cached, so a user added to a chat can join right away.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def config(self):
+        return {**MEMBERSHIP_CACHE_DEFAULTS, **getattr(settings, 'CHAT_MEMBERSHIP_CACHE', {})}
+
+    @property
+    def cache(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    @property
+    def ttl(self):
+        config = self.config
+        if isinstance(self.cache, LocMemCache):
+            return min(config['TTL'], config['LOCAL_TTL'])
+        return config['TTL']
+
+    @staticmethod
+    def key(chat_id, user_id):
+        return f"chat_member:{chat_id}:{user_id}"
+
+    async def is_member(self, chat_id, user_id):
+        try:
+            chat_id, user_id = int(chat_id), int(user_id)
+        except (ValueError, TypeError):
+            logger.error(f"Invalid chat/user id for membership check: {chat_id!r}, {user_id!r}")
+            return False
+        key = self.key(chat_id, user_id)
+        if await self.cache.aget(key) is True:
+            self.hits += 1
+            return True
+        self.misses += 1
+        allowed = await database_sync_to_async(self.lookup)(chat_id, user_id)
+        if allowed:
+            await self.cache.aset(key, True, self.ttl)
+        return allowed
+
+    @staticmethod
+    def lookup(chat_id, user_id):
+        # One indexed probe of the participants table; a missing chat simply has no rows.
+        return Chat.participants.through.objects.filter(chat_id=chat_id, user_id=user_id).exists()
+
+    def invalidate(self, chat_id, user_ids):
+        self.cache.delete_many([self.key(chat_id, user_id) for user_id in user_ids])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+membership_cache = MembershipCache()
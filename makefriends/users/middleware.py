@@ -1,33 +1,96 @@
 # your_app/middleware.py
-import json
 from urllib.parse import parse_qs
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
 from channels.db import database_sync_to_async
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+WS_JWT_AUTH_DEFAULTS = {
+    # Build the user from the token's claims instead of loading it from the DB. Saves a query per
+    # connect, but a deactivated or deleted user keeps WebSocket access until the token expires.
+    'STATELESS': False,
+    # Seconds to cache users loaded from the DB; deactivation takes effect after at most this long. 0 disables.
+    'USER_CACHE_TTL': 30,
+    'CACHE_ALIAS': 'default',
+}
+
+# JWTAuthentication holds no per-request state, so one instance serves every connection.
+jwt_auth = JWTAuthentication()
+
+
+def get_ws_auth_config():
+    return {**WS_JWT_AUTH_DEFAULTS, **getattr(settings, 'WS_JWT_AUTH', {})}
+
+
+def get_token_user(validated_token):
+    """
+    Return a lightweight TokenUser built from the token claims, or None if the token
+    doesn't carry what the consumers need (user id and username).
+    """
+    if jwt_settings.USER_ID_CLAIM not in validated_token or 'username' not in validated_token:
+        return None
+    return TokenUser(validated_token)
+
+
+def get_db_user(validated_token, cache_ttl=0, cache_alias='default'):
+    """
+    Load the user from the DB, going through a short-TTL cache when cache_ttl is set.
+    Only the id, username and is_active are cached, never the password hash or the rest of the row,
+    so a user served from the cache is an unsaved instance with just those fields: fine for the
+    consumers, which only read pk and username, but not for saving.
+    """
+    if not cache_ttl:
+        return jwt_auth.get_user(validated_token)
+    cache = caches[cache_alias]
+    key = f"ws_user:{validated_token[jwt_settings.USER_ID_CLAIM]}"
+    fields = cache.get(key)
+    if fields is None:
+        user = jwt_auth.get_user(validated_token)
+        cache.set(key, {'id': user.pk, 'username': user.get_username(), 'is_active': user.is_active}, cache_ttl)
+        return user
+    return jwt_auth.user_model(
+        pk=fields['id'],
+        is_active=fields['is_active'],
+        **{jwt_auth.user_model.USERNAME_FIELD: fields['username']},
+    )
+
+
+async def get_user_for_token(token):
+    validated_token = jwt_auth.get_validated_token(token)
+    config = get_ws_auth_config()
+    if config['STATELESS']:
+        user = get_token_user(validated_token)
+        if user is not None:
+            return user
+    return await database_sync_to_async(get_db_user)(validated_token, config['USER_CACHE_TTL'], config['CACHE_ALIAS'])
+
 
 class JWTAuthMiddleware:
     """
     Custom middleware that extracts a JWT token from the query string,
     validates it using SimpleJWT, and populates scope["user"].
+    Token-authenticated sockets go straight to `inner`; sockets without a token
+    go through `session_inner` (the session-based AuthMiddlewareStack).
     """
-    def __init__(self, inner):
+    def __init__(self, inner, session_inner=None):
         self.inner = inner
+        self.session_inner = session_inner or inner
 
     async def __call__(self, scope, receive, send):
         # Parse the query string to extract token
         query_string = scope.get("query_string", b"").decode()
         query_params = parse_qs(query_string)
         token_list = query_params.get("token")
-        if token_list:
-            token = token_list[0]
-            try:
-                jwt_auth = JWTAuthentication()
-                validated_token = jwt_auth.get_validated_token(token)
-                user = await database_sync_to_async(jwt_auth.get_user)(validated_token)
-                scope["user"] = user
-            except Exception:
-                scope["user"] = AnonymousUser()
-        else:
+        if not token_list:
+            return await self.session_inner(scope, receive, send)
+
+        scope = dict(scope)
+        try:
+            scope["user"] = await get_user_for_token(token_list[0])
+        except Exception:
             scope["user"] = AnonymousUser()
 
         # Call the next middleware/application with all three arguments.
@@ -35,7 +98,8 @@ class JWTAuthMiddleware:
 
 def JWTAuthMiddlewareStack(inner):
     """
-    Wraps the inner application with JWTAuthMiddleware on top of the default AuthMiddlewareStack.
+    Wraps the inner application with JWTAuthMiddleware. The default AuthMiddlewareStack
+    (cookie + session lookups) is only used for sockets that don't carry a token.
     """
     from channels.auth import AuthMiddlewareStack
-    return JWTAuthMiddleware(AuthMiddlewareStack(inner))
+    return JWTAuthMiddleware(inner, session_inner=AuthMiddlewareStack(inner))
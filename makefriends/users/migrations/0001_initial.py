@@ -0,0 +1,60 @@
+# Generated by Django 5.1.6 on 2026-10-17 00:35
+# The users tables predate the app's migrations: this is the schema they were created with.
+# On a database that already has them, record it as applied instead of creating them again:
+#     python manage.py migrate users --fake-initial
+# Django then checks that every table and column below exists and skips the CREATE TABLEs.
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('blocked_by', models.ManyToManyField(blank=True, related_name='blocked_chats', to=settings.AUTH_USER_MODEL)),
+                ('participants', models.ManyToManyField(to=settings.AUTH_USER_MODEL)),
+                ('unread_by', models.ManyToManyField(blank=True, related_name='unread_chats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='users.chat')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('dateOfBirth_str', models.DateField(max_length=50)),
+                ('gender', models.CharField(max_length=10)),
+                ('interests', models.TextField(blank=True, null=True)),
+                ('personality', models.TextField(blank=True, null=True)),
+                ('why', models.TextField(blank=True, null=True)),
+                ('profile_picture', models.ImageField(blank=True, null=True, upload_to='profile_pictures/')),
+                ('mood', models.CharField(blank=True, choices=[('casual chat', 'Casual chat'), ('deep talk', 'Looking for a deep talk'), ('activity partner', 'Activity partner'), ('networking', 'Networking'), ('new to town', 'New to town')], max_length=50, null=True)),
+                ('location', django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326)),
+                ('anonymous', models.BooleanField(default=False)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', 'created_at', 'id'], name='chatmessage_chat_created_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def backfill_inbox(apps, schema_editor):
+    """Create one inbox row per chat participant from the existing chats."""
+    Chat = apps.get_model('users', 'Chat')
+    ChatInbox = apps.get_model('users', 'ChatInbox')
+    ChatMessage = apps.get_model('users', 'ChatMessage')
+    preview_length = ChatInbox._meta.get_field('last_message').max_length
+
+    rows = []
+    for chat in Chat.objects.prefetch_related('participants', 'unread_by', 'blocked_by').iterator(chunk_size=500):
+        participants = sorted(chat.participants.all(), key=lambda user: user.id)
+        unread_ids = {user.id for user in chat.unread_by.all()}
+        blocked_ids = {user.id for user in chat.blocked_by.all()}
+        last = ChatMessage.objects.filter(chat_id=chat.id).order_by('-created_at', '-id').first()
+        last_message = last.message if last else chat.last_message
+        for user in participants:
+            other = next((p for p in participants if p.id != user.id), None)
+            rows.append(ChatInbox(
+                user_id=user.id,
+                chat_id=chat.id,
+                name=other.username if other else '',
+                last_message=(last_message or '')[:preview_length],
+                last_activity_at=last.created_at if last else chat.updated_at,
+                # Only a flag existed before, so an unread chat starts with a count of one.
+                unread_count=1 if user.id in unread_ids else 0,
+                blocked=user.id in blocked_ids,
+            ))
+        if len(rows) >= 1000:
+            ChatInbox.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    ChatInbox.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_chatinbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='pair_low',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='pair_high',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def backfill_pair_keys(apps, schema_editor):
+    """
+    Set the canonical pair key on every two-person chat. When a pair already has a chat
+    (duplicates created by racing pokes), the later chat is merged into the oldest one.
+    """
+    Chat = apps.get_model('users', 'Chat')
+    ChatMessage = apps.get_model('users', 'ChatMessage')
+    ChatInbox = apps.get_model('users', 'ChatInbox')
+    Participant = Chat.participants.through
+
+    participants = {}
+    for chat_id, user_id in Participant.objects.order_by('chat_id').values_list('chat_id', 'user_id').iterator():
+        participants.setdefault(chat_id, []).append(user_id)
+
+    kept = {}
+    for chat_id in sorted(participants):
+        user_ids = participants[chat_id]
+        if len(user_ids) != 2:
+            continue
+        low, high = sorted(user_ids)
+        if (low, high) not in kept:
+            kept[(low, high)] = chat_id
+            Chat.objects.filter(pk=chat_id).update(pair_low=low, pair_high=high)
+            continue
+        merge_chat(Chat, ChatMessage, ChatInbox, source_id=chat_id, target_id=kept[(low, high)])
+
+
+def merge_chat(Chat, ChatMessage, ChatInbox, source_id, target_id):
+    source = Chat.objects.get(pk=source_id)
+    target = Chat.objects.get(pk=target_id)
+    ChatMessage.objects.filter(chat_id=source_id).update(chat_id=target_id)
+    target.unread_by.add(*source.unread_by.all())
+    target.blocked_by.add(*source.blocked_by.all())
+
+    last = ChatMessage.objects.filter(chat_id=target_id).order_by('-created_at', '-id').first()
+    if last is not None:
+        Chat.objects.filter(pk=target_id).update(last_message=last.message, updated_at=last.created_at)
+
+    # Fold the duplicate's inbox rows into the kept chat's rows.
+    for row in ChatInbox.objects.filter(chat_id=source_id):
+        target_row = ChatInbox.objects.filter(chat_id=target_id, user_id=row.user_id)
+        target_row.update(unread_count=F('unread_count') + row.unread_count)
+        if row.blocked:
+            target_row.update(blocked=True)
+    if last is not None:
+        ChatInbox.objects.filter(chat_id=target_id).update(
+            last_message=last.message[:ChatInbox._meta.get_field('last_message').max_length],
+            last_activity_at=last.created_at,
+        )
+    source.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_chat_pair_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pair_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_backfill_chat_pair_key'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='chat',
+            constraint=models.UniqueConstraint(fields=('pair_low', 'pair_high'), name='chat_direct_pair_unique'),
+        ),
+    ]
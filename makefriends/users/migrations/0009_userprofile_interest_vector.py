@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-17 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_chat_direct_pair_unique'),
+    ]
+
+    operations = [
+        # Filled in by `manage.py backfill_profile_features` (together with feature_vector, see 0010)
+        # rather than here: a migration must not import users.matching, whose hashing may change
+        # after this migration is written. Until then profiles match as if they had no interests.
+        migrations.AddField(
+            model_name='userprofile',
+            name='interest_vector',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_userprofile_interest_vector'),
+    ]
+
+    operations = [
+        # Filled in by `manage.py backfill_profile_features` rather than here, so deploys don't
+        # rewrite every profile row inside the migration transaction.
+        migrations.AddField(
+            model_name='userprofile',
+            name='feature_vector',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('english', coalesce({row}interests, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}personality, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce({row}why, '')), 'C')
+"""
+
+CREATE_TRIGGER = f"""
+CREATE FUNCTION users_userprofile_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_userprofile_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF interests, personality, why ON users_userprofile
+    FOR EACH ROW EXECUTE FUNCTION users_userprofile_search_vector_update();
+
+UPDATE users_userprofile SET search_vector = {SEARCH_VECTOR.format(row='')};
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS users_userprofile_search_vector_trigger ON users_userprofile;
+DROP FUNCTION IF EXISTS users_userprofile_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_userprofile_feature_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Backfill before building the index, so the rows aren't indexed one update at a time.
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='userprofile_search_idx'),
+        ),
+    ]
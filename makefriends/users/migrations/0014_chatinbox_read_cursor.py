@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-17 17:40
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill_cursors(apps, schema_editor):
+    ChatInbox = apps.get_model('users', 'ChatInbox')
+    ChatMessage = apps.get_model('users', 'ChatMessage')
+    latest = ChatMessage.objects.filter(chat_id=OuterRef('chat_id')).order_by('-id').values('id')[:1]
+    ChatInbox.objects.update(last_message_id=Subquery(latest))
+    # Rows without unread messages start out read up to the latest message.
+    ChatInbox.objects.filter(unread_count=0).update(last_read_message_id=F('last_message_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatinbox',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatinbox',
+            name='last_read_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_cursors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_chatinbox_read_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_id__isnull', False)), fields=('chat', 'sender', 'client_id'), name='chatmessage_client_id_unique'),
+        ),
+    ]
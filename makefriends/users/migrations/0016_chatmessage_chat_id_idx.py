@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_chatmessage_client_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', 'id'], name='chatmessage_chat_id_idx'),
+        ),
+    ]
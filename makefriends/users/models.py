@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models as geomodels
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 
 MOOD_CHOICES = [
     ('casual chat', 'Casual chat'),
@@ -19,10 +22,33 @@ class UserProfile(models.Model):
     personality = models.TextField(blank=True, null=True)
     why = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', null=True, blank=True)
+    # {size name: stored name} of the rendered thumbnails, see users.thumbnails.store_picture
+    profile_picture_thumbnails = models.JSONField(default=dict, blank=True, editable=False)
     mood = models.CharField(max_length=50, choices=MOOD_CHOICES, blank=True, null=True)
     location = geomodels.PointField(null=True, blank=True, srid=4326)
     anonymous = models.BooleanField(default=False)
-    
+    updated_at = models.DateTimeField(auto_now=True)  # Version stamp for ETag / Last-Modified on /api/users/me/
+    # Hashed bags of words over the free-text fields (see users.matching.build_features), rebuilt by
+    # the pre_save signal when those fields change and backfilled by `manage.py backfill_profile_features`.
+    interest_vector = models.BinaryField(null=True, blank=True, editable=False)
+    feature_vector = models.BinaryField(null=True, blank=True, editable=False)
+    # Weighted tsvector of interests/personality/why, maintained by a DB trigger (migration 0011)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='userprofile_search_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the text the stored vectors were built from, so unchanged saves skip the rebuild.
+        from .matching import FEATURE_FIELDS, feature_source
+        if all(field in field_names for field in FEATURE_FIELDS):
+            instance._loaded_feature_source = feature_source(instance)
+        return instance
+
     def __str__(self):
         return self.user.username  # Using the related User model's username
 
@@ -34,6 +60,20 @@ class Chat(models.Model):
     # Many-to-many fields to track which users haven't read the chat or have blocked it.
     unread_by = models.ManyToManyField(User, related_name='unread_chats', blank=True)
     blocked_by = models.ManyToManyField(User, related_name='blocked_chats', blank=True)
+    # Canonical key of a 1:1 chat: the two participants' ids, smallest first. Null for other chats.
+    pair_low = models.BigIntegerField(null=True, blank=True, editable=False)
+    pair_high = models.BigIntegerField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # One direct chat per pair of users; doubles as the index for the poke lookup.
+            models.UniqueConstraint(fields=['pair_low', 'pair_high'], name='chat_direct_pair_unique'),
+        ]
+
+    @staticmethod
+    def pair_key(user_a_id, user_b_id):
+        low, high = sorted((int(user_a_id), int(user_b_id)))
+        return {'pair_low': low, 'pair_high': high}
 
     def __str__(self):
         return f"Chat {self.id}"
@@ -45,6 +85,78 @@ class ChatMessage(models.Model):
     # Optional image attachment:
     #image = models.ImageField(upload_to='chat_images/', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # The messageId the client sent the message with; retries after a reconnect reuse it.
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # A resent message is stored once (see ChatMessagingMixin.save_message).
+            models.UniqueConstraint(
+                fields=['chat', 'sender', 'client_id'],
+                condition=models.Q(client_id__isnull=False),
+                name='chatmessage_client_id_unique',
+            ),
+        ]
+        indexes = [
+            # Keyset pagination over one chat's history: chat_id = ? AND (created_at, id) < (?, ?)
+            models.Index(fields=['chat', 'created_at', 'id'], name='chatmessage_chat_created_idx'),
+            # Catch-up on WebSocket reconnect: chat_id = ? AND id > ? (see ChatConsumer.replay_missed)
+            models.Index(fields=['chat', 'id'], name='chatmessage_chat_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sender.username} in chat {self.chat.id}: {self.message}"
+
+# One row per (user, chat) holding everything the chat list shows, updated as messages arrive
+# so /api/chats/me/ is a single range scan over (user, last_activity_at).
+class ChatInbox(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox')
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='inbox_rows')
+    name = models.CharField(max_length=150, blank=True)  # Username of the other participant
+    last_message = models.CharField(max_length=255, blank=True)  # Preview of the latest message
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    unread_count = models.PositiveIntegerField(default=0)
+    blocked = models.BooleanField(default=False)
+    # Id of the chat's latest message, and the user's read cursor: the chat is unread while the
+    # cursor is behind. The cursor moves with "read" frames on the WebSocket (see users.inbox.mark_read).
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_read_message_id = models.BigIntegerField(null=True, blank=True)
+    # Bumped by every write to the row (see users.inbox); with the row count it versions the chat list
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'chat'], name='chatinbox_user_chat_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at'], name='chatinbox_user_activity_idx'),
+        ]
+
+    @property
+    def unread(self):
+        return self.last_message_id is not None and (self.last_read_message_id or 0) < self.last_message_id
+
+    def __str__(self):
+        return f"Inbox of {self.user_id} for chat {self.chat_id}"
+
+
+NOTIFICATION_KINDS = [
+    ('poke', 'Poke'),
+    ('chat_created', 'Chat created'),
+]
+
+# Notifications waiting to be delivered over the user's WebSocket. Rows are deleted once delivered,
+# so the table only holds what offline users haven't seen yet.
+class Notification(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=20, choices=NOTIFICATION_KINDS)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='notification_user_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.sender.username} in chat {self.chat.id}: {self.message}"
\ No newline at end of file
+        return f"{self.kind} for {self.user_id}"
\ No newline at end of file
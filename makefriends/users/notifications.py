@@ -0,0 +1,53 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from users.models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+def notification_event(notification):
+    """Channel-layer event for a notification, handled by UserConsumer.notify."""
+    return {
+        'type': 'notify',
+        'id': notification.id,
+        'kind': notification.kind,
+        'payload': notification.payload,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def notify_user(user_id, kind, payload):
+    """
+    Queue a notification for a user and push it to their connected sockets.
+    The row stays queued until a socket delivers it, so offline users get it on their next connect.
+    """
+    notification = Notification.objects.create(user_id=user_id, kind=kind, payload=payload)
+
+    def push():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        # Imported here so views don't pull in the consumers at import time.
+        from users.consumers import user_group
+        try:
+            async_to_sync(channel_layer.group_send)(user_group(user_id), notification_event(notification))
+        except Exception:
+            # Still queued; it will be delivered on the next connect.
+            logger.exception(f"Could not push {kind} notification to user {user_id}")
+
+    transaction.on_commit(push)
+    return notification
+
+
+def get_pending(user_id):
+    """
+    Return the user's queued notifications, oldest first. They stay queued until mark_delivered(),
+    so a socket that drops mid-replay, or another device, still gets them.
+    """
+    return list(Notification.objects.filter(user_id=user_id).order_by('id'))
+
+
+def mark_delivered(notification_id):
+    Notification.objects.filter(pk=notification_id).delete()
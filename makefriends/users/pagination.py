@@ -0,0 +1,64 @@
+import base64
+import binascii
+import json
+import math
+from datetime import timezone as dt_timezone
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def parse_message_cursor(value):
+    """
+    Parse a '<created_at>,<id>' message cursor.
+    Returns a (created_at, id) tuple, or None if the cursor is malformed.
+    """
+    created_at, _, pk = (value or '').rpartition(',')
+    # A '+' in the UTC offset arrives as a space when the client didn't URL-encode it.
+    created = parse_datetime(created_at.strip().replace(' ', '+'))
+    if created is None or not pk.isdigit():
+        return None
+    if timezone.is_naive(created):
+        created = timezone.make_aware(created, dt_timezone.utc)
+    return created, int(pk)
+
+
+def format_message_cursor(message):
+    return f"{message.created_at.isoformat()},{message.id}"
+
+
+def messages_before(queryset, cursor):
+    """Messages strictly older than the cursor, newest first."""
+    created_at, pk = cursor
+    return queryset.filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    ).order_by('-created_at', '-id')
+
+
+def messages_after(queryset, cursor):
+    """Messages strictly newer than the cursor, oldest first."""
+    created_at, pk = cursor
+    return queryset.filter(
+        Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+    ).order_by('created_at', 'id')
+
+
+def encode_cursor(*values):
+    """Opaque continuation token for keyset pagination over the given sort values."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(token, length):
+    """Decode a token from encode_cursor. Returns the list of values, or None if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def is_number(value):
+    """True for a finite int or float cursor value (bool and str are not numbers here)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
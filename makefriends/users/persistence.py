@@ -0,0 +1,192 @@
+import asyncio
+import atexit
+import logging
+import time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from channels.db import database_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_DEFAULTS = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL_MS': 50,
+    'MAX_BATCH': 200,
+}
+
+
+class MessageWriteBehind:
+    """
+    Per-process buffer for chat messages.
+    Messages are queued as unsaved ChatMessage objects and written with bulk_create
+    every flush_interval_ms or as soon as max_batch messages are pending.
+    Batches are written one at a time in the order they were queued, so per-chat ordering is kept.
+    """
+    def __init__(self, flush_interval_ms=50, max_batch=200):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []  # (ChatMessage, enqueued_at, future)
+        # (chat_id, sender_id, client_id) -> future, until the message is written
+        self._queued_client_ids = {}
+        self._lock = asyncio.Lock()
+        self._timer = None
+        self._tasks = set()
+        # Metrics
+        self.flushes = 0
+        self.messages_written = 0
+        self.failed_messages = 0
+        self.duplicate_messages = 0
+        self.failed_flushes = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+
+    def enqueue(self, chat_id, sender_id, message, client_id=None):
+        """
+        Queue a message for the next batch. Must be called from the event loop.
+        Returns a future resolved with the saved ChatMessage (or None if it could not be written).
+        A message whose client_id was already stored resolves to the stored one.
+        """
+        from users.models import ChatMessage
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        chat_message = ChatMessage(chat_id=chat_id, sender_id=sender_id, message=message, client_id=client_id)
+        self._pending.append((chat_message, time.monotonic(), future))
+        if client_id is not None:
+            self._queued_client_ids[client_key(chat_id, sender_id, client_id)] = future
+        if len(self._pending) >= self.max_batch:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._schedule_flush)
+        return future
+
+    def queued(self, chat_id, sender_id, client_id):
+        """The future of a message with this client_id that is queued or being written, or None."""
+        return self._queued_client_ids.get(client_key(chat_id, sender_id, client_id))
+
+    def _schedule_flush(self):
+        task = asyncio.ensure_future(self.flush())
+        # Keep a reference so the task isn't garbage collected before it finishes.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """Write everything queued so far. Returns the saved messages."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return []
+            try:
+                saved = await database_sync_to_async(self._write)([item[0] for item in batch])
+            except Exception:
+                # Database unreachable, connection dropped, ...: the batch is lost, but whoever waits
+                # on it is told so (the sender gets an error frame and can resend).
+                logger.exception(f"Writing {len(batch)} chat messages failed")
+                self.failed_flushes += 1
+                self.failed_messages += len(batch)
+                saved = [None] * len(batch)
+            lag = time.monotonic() - batch[0][1]
+            self.flushes += 1
+            self.last_flush_lag = lag
+            self.max_flush_lag = max(self.max_flush_lag, lag)
+            logger.debug(f"Flushed {len(batch)} chat messages, lag {lag * 1000:.1f} ms")
+            for (chat_message, _, future), message in zip(batch, saved):
+                if not future.done():
+                    future.set_result(message)
+                if chat_message.client_id is not None:
+                    key = client_key(chat_message.chat_id, chat_message.sender_id, chat_message.client_id)
+                    if self._queued_client_ids.get(key) is future:
+                        del self._queued_client_ids[key]
+            return [message for message in saved if message is not None]
+
+    def _write(self, messages):
+        from users.inbox import record_messages
+        from users.models import ChatMessage
+        try:
+            with transaction.atomic():
+                saved = ChatMessage.objects.bulk_create(messages)
+                record_messages(saved)
+            self.messages_written += len(saved)
+            return saved
+        except IntegrityError:
+            # One bad row (a chat deleted meanwhile, a resent client_id) fails the whole batch; fall back to row by row.
+            logger.warning(f"Batch insert of {len(messages)} chat messages failed, retrying one by one")
+        saved = []
+        for message in messages:
+            # bulk_create may have assigned a pk before the rollback.
+            message.pk = None
+            try:
+                with transaction.atomic():
+                    message.save()
+                    record_messages([message])
+                saved.append(message)
+                self.messages_written += 1
+            except IntegrityError:
+                existing = find_duplicate(message.chat_id, message.sender_id, message.client_id)
+                if existing is not None:
+                    self.duplicate_messages += 1
+                    saved.append(existing)
+                    continue
+                logger.error(f"Dropping chat message for chat {message.chat_id} from user {message.sender_id}")
+                self.failed_messages += 1
+                saved.append(None)
+        return saved
+
+    def flush_sync(self):
+        """Write whatever is still queued without an event loop (used at interpreter shutdown)."""
+        batch, self._pending = self._pending, []
+        self._queued_client_ids.clear()
+        if batch:
+            logger.info(f"Flushing {len(batch)} pending chat messages on shutdown")
+            try:
+                self._write([item[0] for item in batch])
+            except Exception:
+                logger.exception(f"Writing {len(batch)} chat messages on shutdown failed")
+                self.failed_flushes += 1
+                self.failed_messages += len(batch)
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'flushes': self.flushes,
+            'messages_written': self.messages_written,
+            'failed_messages': self.failed_messages,
+            'duplicate_messages': self.duplicate_messages,
+            'failed_flushes': self.failed_flushes,
+            'last_flush_lag_ms': round(self.last_flush_lag * 1000, 3),
+            'max_flush_lag_ms': round(self.max_flush_lag * 1000, 3),
+        }
+
+
+def client_key(chat_id, sender_id, client_id):
+    # Chat ids arrive as URL strings, user pks as str (token users) or int
+    return int(chat_id), str(sender_id), client_id
+
+
+def find_duplicate(chat_id, sender_id, client_id):
+    """The stored message with this (chat, sender, client_id), or None."""
+    from users.models import ChatMessage
+    if not client_id:
+        return None
+    return ChatMessage.objects.filter(chat_id=chat_id, sender_id=sender_id, client_id=client_id).first()
+
+
+_write_behind = None
+
+def get_write_behind():
+    """
+    Return the process-wide write-behind buffer, or None when CHAT_WRITE_BEHIND is disabled.
+    """
+    global _write_behind
+    config = {**WRITE_BEHIND_DEFAULTS, **getattr(settings, 'CHAT_WRITE_BEHIND', {})}
+    if not config['ENABLED']:
+        return None
+    if _write_behind is None:
+        _write_behind = MessageWriteBehind(
+            flush_interval_ms=config['FLUSH_INTERVAL_MS'],
+            max_batch=config['MAX_BATCH'],
+        )
+        atexit.register(_write_behind.flush_sync)
+    return _write_behind
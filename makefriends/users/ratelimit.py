@@ -0,0 +1,138 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+RATE_LIMIT_DEFAULTS = {
+    'RATE': 5,  # frames per second a connection may keep sending
+    'BURST': 20,  # frames a connection may send at once after being idle
+    'USER_RATE': 10,  # the same, across all of a user's connections
+    'USER_BURST': 40,
+    # Keep the per-user limit in CACHE_ALIAS so it holds across processes. The shared limit counts
+    # frames in fixed windows of USER_BURST / USER_RATE seconds rather than with a token bucket.
+    'SHARED': False,
+    'CACHE_ALIAS': 'default',
+    'MAX_FRAME_BYTES': 16 * 1024,
+    'MAX_DELAY_MS': 250,  # frames over the limit are held back this long at most, later ones are dropped
+    'CLOSE_AFTER_DROPS': 50,  # consecutive dropped frames before the socket is closed
+}
+
+
+def rate_limit_config():
+    return {**RATE_LIMIT_DEFAULTS, **getattr(settings, 'CHAT_RATE_LIMIT', {})}
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most capacity."""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def wait(self, now):
+        """Seconds until a token is available, 0 if one is available now."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        # May go below zero for a frame admitted with a delay; the next wait() accounts for it.
+        self.tokens -= 1
+
+
+class UserBucket(TokenBucket):
+    __slots__ = ('connections',)
+
+
+class ConnectionLimit:
+    """Rate limit state of one socket: its own bucket and the one it shares with the user's other sockets."""
+    __slots__ = ('user_id', 'config', 'bucket', 'user_bucket', 'drops')
+
+    def __init__(self, user_id, config, bucket, user_bucket):
+        self.user_id = user_id
+        self.config = config
+        self.bucket = bucket
+        self.user_bucket = user_bucket
+        self.drops = 0  # consecutive dropped frames
+
+
+class RateLimiter:
+    """
+    Token bucket limits on incoming WebSocket frames, per connection and per user.
+    Memory is fixed: one ConnectionLimit per open socket and one UserBucket per connected user,
+    released when the user's last socket disconnects. Frames that would need to wait longer than
+    MAX_DELAY_MS are dropped rather than queued.
+    """
+    def __init__(self):
+        self.user_buckets = {}  # user_id -> UserBucket
+        # Metrics
+        self.delayed_frames = 0
+        self.throttled_frames = 0
+        self.oversized_frames = 0
+        self.closed_connections = 0
+
+    def connect(self, user_id):
+        # TokenUser pks are the token's str claim, DB users' are ints: key both the same way.
+        user_id = str(user_id)
+        config = rate_limit_config()
+        now = time.monotonic()
+        user_bucket = None
+        if not config['SHARED']:
+            user_bucket = self.user_buckets.get(user_id)
+            if user_bucket is None:
+                user_bucket = self.user_buckets[user_id] = UserBucket(config['USER_RATE'], config['USER_BURST'], now)
+                user_bucket.connections = 0
+            user_bucket.connections += 1
+        return ConnectionLimit(user_id, config, TokenBucket(config['RATE'], config['BURST'], now), user_bucket)
+
+    def disconnect(self, limit):
+        user_bucket = limit.user_bucket
+        if user_bucket is not None:
+            user_bucket.connections -= 1
+            if user_bucket.connections <= 0 and self.user_buckets.get(limit.user_id) is user_bucket:
+                del self.user_buckets[limit.user_id]
+
+    async def admit(self, limit):
+        """Seconds the next frame on this connection has to wait (0 for none), or None to drop it."""
+        now = time.monotonic()
+        wait = limit.bucket.wait(now)
+        if limit.user_bucket is not None:
+            wait = max(wait, limit.user_bucket.wait(now))
+        else:
+            wait = max(wait, await self.shared_wait(limit))
+        if wait * 1000 > limit.config['MAX_DELAY_MS']:
+            self.throttled_frames += 1
+            return None
+        limit.bucket.take()
+        if limit.user_bucket is not None:
+            limit.user_bucket.take()
+        if wait:
+            self.delayed_frames += 1
+        return wait
+
+    async def shared_wait(self, limit):
+        config = limit.config
+        window = config['USER_BURST'] / config['USER_RATE']
+        now = time.time()
+        key = f"chat_rate:{limit.user_id}:{int(now // window)}"
+        cache = caches[config['CACHE_ALIAS']]
+        await cache.aadd(key, 0, timeout=int(window) + 1)
+        try:
+            count = await cache.aincr(key)
+        except ValueError:  # Expired between add and incr
+            return 0.0
+        return 0.0 if count <= config['USER_BURST'] else window - now % window
+
+    def stats(self):
+        return {
+            'users': len(self.user_buckets),
+            'delayed_frames': self.delayed_frames,
+            'throttled_frames': self.throttled_frames,
+            'oversized_frames': self.oversized_frames,
+            'closed_connections': self.closed_connections,
+        }
+
+
+rate_limiter = RateLimiter()
@@ -4,4 +4,6 @@ from . import consumers
 websocket_urlpatterns = [
     # Looking for the chat ID of the chat group
     re_path(r'ws/chats/(?P<chat_id>[0-9a-f-]+)/$', consumers.ChatConsumer.as_asgi()),
+    # One socket per user multiplexing all of their chats
+    re_path(r'ws/me/$', consumers.UserConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from rest_framework.exceptions import ValidationError
+from .pagination import encode_cursor, decode_cursor, is_number
+
+# Text search configuration of the search_vector triggers (see the users and events migrations);
+# queries have to be parsed with the same one to match.
+SEARCH_CONFIG = 'english'
+
+
+def search_params(request):
+    """(text, limit, cursor) from ?q=...&limit=...&cursor=..., raising ValidationError on bad input."""
+    params = request.query_params
+    text = params.get('q', '').strip()
+    if not text:
+        raise ValidationError({"q": "A search query is required."})
+    try:
+        limit = int(params.get('limit', settings.SEARCH['PAGE_SIZE']))
+    except ValueError:
+        raise ValidationError({"limit": "limit must be an integer."})
+    limit = max(1, min(limit, settings.SEARCH['MAX_PAGE_SIZE']))
+    cursor = None
+    if params.get('cursor'):
+        cursor = decode_cursor(params['cursor'], 2)
+        if cursor is None or not is_number(cursor[0]) or not isinstance(cursor[1], str):
+            raise ValidationError({"cursor": "Invalid cursor."})
+    return text, limit, cursor
+
+
+def ranked_search(queryset, text, limit, cursor=None):
+    """
+    One page of the rows whose search_vector matches `text` (web search syntax: words, "phrases",
+    or, -exclusions), best ranked first. The match is answered from the GIN index and pages continue
+    from the (rank, pk) of the previous page's last row, so deep pages cost no more than the first.
+    Returns (rows, next cursor or None); each row carries its `rank`.
+    """
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    # ts_rank is a float4; as float8 it survives the round trip through the cursor exactly, so
+    # the keyset comparison below matches the row it came from.
+    queryset = queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+    )
+    if cursor:
+        rank, pk = cursor
+        queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, pk__gt=pk))
+
+    rows = list(queryset.order_by('-rank', 'pk')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, str(rows[-1].pk))
+    return rows, next_cursor
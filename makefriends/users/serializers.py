@@ -1,7 +1,34 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.utils.encoding import filepath_to_uri
 from django.contrib.gis.geos import Point
-from .models import UserProfile, Chat, ChatMessage
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .models import UserProfile, ChatMessage, ChatInbox
+from .geocache import nearby_cache
+from .thumbnails import store_picture
+
+
+def media_url(serializer, storage, name):
+    """
+    Absolute URL of a stored file. The URL prefix is resolved once per response rather than once
+    per row (same result as build_absolute_uri(storage.url(name)) with the file system storage).
+    """
+    prefix = serializer.context.get('media_url_prefix')
+    if prefix is None:
+        placeholder = storage.url('_')
+        request = serializer.context.get('request')
+        if request:
+            placeholder = request.build_absolute_uri(placeholder)
+        prefix = serializer.context['media_url_prefix'] = placeholder[:-1]
+    return prefix + filepath_to_uri(name)
+
+
+def thumbnail_urls(serializer, instance):
+    """{size name: absolute URL}, or None until the picture's thumbnails have been rendered."""
+    if not instance.profile_picture or not instance.profile_picture_thumbnails:
+        return None
+    storage = instance.profile_picture.storage
+    return {size: media_url(serializer, storage, name) for size, name in instance.profile_picture_thumbnails.items()}
 
 class UserProfileSerializer(serializers.ModelSerializer):
     user_id = serializers.IntegerField(source="user.id", read_only=True)  # Add this line
@@ -71,17 +98,32 @@ class UserProfileSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(username=username, email=email, password=password)
 
         # Now create the UserProfile object and associate it with the user
+        self.store_picture(validated_data)
         user_profile = UserProfile.objects.create(user=user, **validated_data)
 
         return user_profile
 
     def update(self, instance, validated_data):
+        old_location, old_mood = instance.location, instance.mood
         # Update location if provided
         location_data = validated_data.pop('location', None)
         if location_data:
             # Expecting a dict like: {"type": "Point", "coordinates": [lon, lat]}
             instance.location = Point(location_data['coordinates'][0], location_data['coordinates'][1])
-        return super().update(instance, validated_data)
+        self.store_picture(validated_data)
+        instance = super().update(instance, validated_data)
+        # Move the user between geohash cells of the nearby-users cache
+        if nearby_cache.enabled and (instance.location != old_location or instance.mood != old_mood):
+            nearby_cache.update_member(instance.user_id, old_location, instance.location, instance.mood)
+        return instance
+
+    def store_picture(self, validated_data):
+        # Uploads are stored under their content hash and their thumbnails rendered once, here.
+        picture = validated_data.get('profile_picture')
+        if picture:
+            validated_data['profile_picture'], validated_data['profile_picture_thumbnails'] = store_picture(picture)
+        elif 'profile_picture' in validated_data:
+            validated_data['profile_picture_thumbnails'] = {}
 
     def get_location_display(self, instance):
         if instance.location:
@@ -91,49 +133,82 @@ class UserProfileSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation.pop("location", None)
+        # Distance from the requesting user, when the queryset was annotated with it (nearby search)
+        distance = getattr(instance, 'distance', None)
+        if distance is not None:
+            representation['distance'] = round(distance.km, 3)
+        match_score = getattr(instance, 'match_score', None)
+        if match_score is not None:
+            representation['match_score'] = round(match_score, 4)
         if instance.profile_picture:
             request = self.context.get('request')
             if request:
                 representation['profile_picture'] = request.build_absolute_uri(instance.profile_picture.url)
             else:
                 representation['profile_picture'] = instance.profile_picture.url
+        # Size-specific URLs; lists should use these rather than the original upload
+        representation['profile_picture_thumbnails'] = thumbnail_urls(self, instance)
         return representation
 
-# Chat serializer
-class ChatSerializer(serializers.ModelSerializer):
-    # Return the name of the other participant (if available)
+# Read-only profile card for lists (/api/users/, /api/users/search/): no email, no write fields.
+class UserProfileListSerializer(serializers.ModelSerializer):
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+    profile_picture = serializers.SerializerMethodField()
+    profile_picture_thumbnails = serializers.SerializerMethodField()
+
+    # Columns the list needs; load the queryset with .only(*LIST_FIELDS) and select_related('user').
+    LIST_FIELDS = ('id', 'user', 'user__username', 'name', 'gender', 'interests', 'mood', 'profile_picture', 'profile_picture_thumbnails', 'anonymous')
+
+    class Meta:
+        model = UserProfile
+        fields = ['user_id', 'username', 'name', 'gender', 'interests', 'mood', 'profile_picture', 'profile_picture_thumbnails', 'anonymous']
+        read_only_fields = fields
+
+    def get_profile_picture(self, instance):
+        if not instance.profile_picture:
+            return None
+        return media_url(self, instance.profile_picture.storage, instance.profile_picture.name)
+
+    def get_profile_picture_thumbnails(self, instance):
+        return thumbnail_urls(self, instance)
+
+# Chat list row, read straight from the denormalised inbox table
+class ChatInboxSerializer(serializers.ModelSerializer):
+    # The keys the chat list has always returned, plus the unread count and read cursor.
+    id = serializers.IntegerField(source='chat_id', read_only=True)
     name = serializers.SerializerMethodField()
     unread = serializers.SerializerMethodField()
-    blocked = serializers.SerializerMethodField()
+    updated_at = serializers.DateTimeField(source='last_activity_at', read_only=True)
 
     class Meta:
-        model = Chat
-        fields = ['id', 'name', 'last_message', 'unread', 'blocked', 'updated_at']
+        model = ChatInbox
+        fields = [
+            'id', 'name', 'last_message', 'unread', 'unread_count', 'blocked', 'updated_at',
+            'last_message_id', 'last_read_message_id',
+        ]
 
     def get_name(self, obj):
-        request = self.context.get('request')
-        if request:
-            current_user = request.user
-            other = obj.participants.exclude(id=current_user.id).first()
-            return other.username if other else "Chat"
-        return "Chat"
+        return obj.name or "Chat"
 
     def get_unread(self, obj):
-        request = self.context.get('request')
-        if request:
-            return obj.unread_by.filter(id=request.user.id).exists()
-        return False
+        # Derived from the read cursor stored on the row, no extra query
+        return obj.unread
 
-    def get_blocked(self, obj):
-        request = self.context.get('request')
-        if request:
-            return obj.blocked_by.filter(id=request.user.id).exists()
-        return False
-    
 class ChatMessageSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
+    # The id the client sent the message with over the WebSocket, for matching history to local copies
+    messageId = serializers.CharField(source='client_id', read_only=True)
     
     class Meta:
         model = ChatMessage
-        fields = ['id', 'chat', 'sender', 'sender_username', 'message', 'created_at']
-        read_only_fields = ['id', 'created_at', 'sender']
\ No newline at end of file
+        fields = ['id', 'chat', 'sender', 'sender_username', 'message', 'created_at', 'messageId']
+        read_only_fields = ['id', 'created_at', 'sender']
+
+class TokenObtainPairWithUsernameSerializer(TokenObtainPairSerializer):
+    """Adds a username claim so WebSocket auth can build the user from the token (see users.middleware)."""
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        return token
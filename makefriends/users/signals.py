@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import Chat, UserProfile
+from .inbox import sync_participants, set_blocked
+from .matching import FEATURE_FIELDS, build_features, feature_source
+from .membership import membership_cache
+
+
+def _changed_pairs(instance, reverse, pk_set):
+    """Normalise an m2m_changed call on a Chat <-> User relation into (chat_id, user_ids) pairs."""
+    if reverse:
+        # instance is a User, pk_set holds chat ids
+        chat_ids = pk_set if pk_set is not None else getattr(instance, '_cleared_chat_ids', [])
+        return [(chat_id, {instance.pk}) for chat_id in chat_ids]
+    user_ids = pk_set if pk_set is not None else getattr(instance, '_cleared_user_ids', set())
+    return [(instance.pk, set(user_ids))]
+
+
+def _remember_cleared(instance, reverse, field_name):
+    # clear() doesn't pass pk_set, so record what is about to be removed.
+    if reverse:
+        instance._cleared_chat_ids = list(getattr(instance, field_name).values_list('id', flat=True))
+    else:
+        instance._cleared_user_ids = set(getattr(instance, field_name).values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Chat.participants.through)
+def chat_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        _remember_cleared(instance, reverse, 'chat_set' if reverse else 'participants')
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    for chat_id, user_ids in _changed_pairs(instance, reverse, pk_set):
+        _invalidate_membership_on_commit(chat_id, user_ids)
+        sync_participants(chat_id)
+
+
+def _invalidate_membership_on_commit(chat_id, user_ids):
+    # Until the commit other connections still see the old participants and could cache them again.
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: membership_cache.invalidate(chat_id, user_ids))
+
+
+@receiver(pre_delete, sender=Chat)
+def chat_deleted(sender, instance, **kwargs):
+    # Cascaded deletes don't send m2m_changed, so drop cached memberships here.
+    _invalidate_membership_on_commit(instance.pk, instance.participants.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Chat.blocked_by.through)
+def chat_blocked_by_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        _remember_cleared(instance, reverse, 'blocked_chats' if reverse else 'blocked_by')
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    for chat_id, user_ids in _changed_pairs(instance, reverse, pk_set):
+        set_blocked(chat_id, user_ids, blocked=(action == 'post_add'))
+
+
+@receiver(pre_save, sender=UserProfile)
+def profile_features_pre_save(sender, instance, raw, update_fields, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not update_fields & set(FEATURE_FIELDS):
+        return
+    source = feature_source(instance)
+    # Skip the rebuild when the text is what the stored vectors were built from.
+    if instance.__dict__.get('feature_vector') is not None and getattr(instance, '_loaded_feature_source', None) == source:
+        return
+    instance.interest_vector, instance.feature_vector = build_features(source)
+    instance._loaded_feature_source = source
+    if update_fields is not None and not {'interest_vector', 'feature_vector'} <= update_fields:
+        # save(update_fields=...) won't write the vectors, so post_save does.
+        instance._feature_vectors_pending = True
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_features_post_save(sender, instance, raw, **kwargs):
+    if instance.__dict__.pop('_feature_vectors_pending', False):
+        UserProfile.objects.filter(pk=instance.pk).update(
+            interest_vector=instance.interest_vector, feature_vector=instance.feature_vector,
+        )
@@ -1,3 +1,1286 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import tracemalloc
+from datetime import date, datetime, timezone as dt_timezone
+from io import BytesIO
+from unittest import mock
+import numpy as np
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from PIL import Image
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+from . import persistence
+from .models import Chat, ChatMessage, Notification, UserProfile
+from .consumers import ChatConsumer, UserConsumer, missed_messages, replay_since, user_group
+from .geocache import nearby_cache
+from .inbox import mark_read, record_messages
+from .matching import INTEREST_VECTOR_BYTES, CandidateBatch, build_features, feature_source, hash_tokens, score_candidates, top_candidates
+from .membership import MembershipCache
+from .middleware import get_user_for_token
+from .notifications import get_pending, mark_delivered, notify_user
+from .pagination import encode_cursor, format_message_cursor, parse_message_cursor
+from .persistence import MessageWriteBehind, get_write_behind
+from .ratelimit import RateLimiter, TokenBucket
+from .routing import websocket_urlpatterns
+from .serializers import TokenObtainPairWithUsernameSerializer, UserProfileSerializer
+from .thumbnails import store_existing_picture, store_picture
+from .uploads import StreamingMultiPartParser, UploadTooLarge
+from .wire import JSON, MSGPACK, batch_frame, encode_for, encode_frame, msgpack, negotiate
 
-# Create your tests here.
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def chat_socket(user, path):
+    """A WebsocketCommunicator on the chat routes, authenticated as user."""
+    communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+    communicator.scope['user'] = user
+    return communicator
+
+
+class ChatHistoryViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+        self.friend_count = 0
+
+    def make_chats(self, count, unread=False, blocked=False):
+        chats = []
+        for _ in range(count):
+            self.friend_count += 1
+            other = User.objects.create_user(username=f'friend{self.friend_count}', password='secret-pass-123')
+            chat = Chat.objects.create()
+            chat.participants.add(self.user, other)
+            if unread:
+                chat.unread_by.add(self.user)
+            if blocked:
+                chat.blocked_by.add(self.user)
+            chats.append(chat)
+        return chats
+
+    def get_inbox(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('chat_history'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_inbox_query_count_does_not_grow_with_chats(self):
+        self.make_chats(2, unread=True)
+        _, few_queries = self.get_inbox()
+        self.make_chats(10, blocked=True)
+        response, many_queries = self.get_inbox()
+        self.assertEqual(len(response.data), 12)
+        self.assertEqual(few_queries, many_queries)
+
+    def test_inbox_answers_conditional_get_with_304_until_it_changes(self):
+        chat, = self.make_chats(1)
+        etag = self.client.get(reverse('chat_history'))['ETag']
+        response = self.client.get(reverse('chat_history'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        chat.blocked_by.add(self.user)
+        response = self.client.get(reverse('chat_history'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_inbox_ignores_if_modified_since(self):
+        # A deleted chat doesn't move the newest timestamp, so only the ETag can tell.
+        chat, _ = self.make_chats(2)
+        response = self.client.get(reverse('chat_history'))
+        self.assertNotIn('Last-Modified', response)
+        chat.delete()
+        response = self.client.get(reverse('chat_history'), HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+    def test_inbox_reports_name_unread_and_blocked(self):
+        unread_chat, = self.make_chats(1)
+        # Unread state comes from the inbox rows, which record_messages keeps up to date.
+        friend = unread_chat.participants.get(username='friend1')
+        record_messages([ChatMessage.objects.create(chat=unread_chat, sender=friend, message='hi')])
+        blocked_chat, = self.make_chats(1, blocked=True)
+        response, _ = self.get_inbox()
+        rows = {row['id']: row for row in response.data}
+        self.assertEqual(rows[unread_chat.id]['name'], 'friend1')
+        self.assertTrue(rows[unread_chat.id]['unread'])
+        self.assertEqual(rows[unread_chat.id]['unread_count'], 1)
+        self.assertEqual(rows[unread_chat.id]['last_message'], 'hi')
+        self.assertFalse(rows[unread_chat.id]['blocked'])
+        self.assertEqual(rows[blocked_chat.id]['name'], 'friend2')
+        self.assertFalse(rows[blocked_chat.id]['unread'])
+        self.assertTrue(rows[blocked_chat.id]['blocked'])
+
+
+class MessageCursorTests(SimpleTestCase):
+    def test_aware_cursor(self):
+        self.assertEqual(
+            parse_message_cursor('2026-10-17T12:00:00+02:00,42'),
+            (datetime(2026, 10, 17, 10, 0, tzinfo=dt_timezone.utc), 42),
+        )
+
+    def test_naive_cursor_is_utc(self):
+        self.assertEqual(
+            parse_message_cursor('2026-10-17T12:00:00,42'),
+            (datetime(2026, 10, 17, 12, 0, tzinfo=dt_timezone.utc), 42),
+        )
+
+    def test_plus_sent_as_space(self):
+        self.assertEqual(
+            parse_message_cursor('2026-10-17T12:00:00.500000 00:00,7'),
+            (datetime(2026, 10, 17, 12, 0, 0, 500000, tzinfo=dt_timezone.utc), 7),
+        )
+
+    def test_malformed_cursors(self):
+        for value in (None, '', '42', 'yesterday,42', '2026-10-17T12:00:00,', '2026-10-17T12:00:00,-1', '2026-10-17T12:00:00,x'):
+            self.assertIsNone(parse_message_cursor(value), value)
+
+
+class ChatMessageHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+        self.chat = Chat.objects.create()
+        self.chat.participants.add(self.user)
+        self.messages = [ChatMessage.objects.create(chat=self.chat, sender=self.user, message=str(n)) for n in range(5)]
+        # Messages 1-3 share an instant: the id breaks the tie.
+        for message, hour in zip(self.messages, (11, 12, 12, 12, 13)):
+            ChatMessage.objects.filter(pk=message.pk).update(created_at=datetime(2026, 10, 17, hour, tzinfo=dt_timezone.utc))
+        for message in self.messages:
+            message.refresh_from_db()
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('chat_messages', args=[self.chat.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['message'] for row in response.data['results']], response.data
+
+    def test_after_pages_forward_through_ties(self):
+        messages, data = self.get_page(after=format_message_cursor(self.messages[1]), limit=2)
+        self.assertEqual(messages, ['2', '3'])
+        self.assertTrue(data['has_more'])
+        messages, data = self.get_page(after=data['next'], limit=2)
+        self.assertEqual(messages, ['4'])
+        self.assertFalse(data['has_more'])
+
+    def test_before_pages_backward_through_ties(self):
+        messages, data = self.get_page(before=format_message_cursor(self.messages[3]), limit=2)
+        self.assertEqual(messages, ['2', '1'])
+        messages, data = self.get_page(before=data['next'], limit=2)
+        self.assertEqual(messages, ['0'])
+        self.assertFalse(data['has_more'])
+
+    def test_naive_cursor_is_accepted(self):
+        naive = self.messages[1].created_at.replace(tzinfo=None).isoformat()
+        messages, _ = self.get_page(after=f'{naive},{self.messages[1].id}')
+        self.assertEqual(messages, ['2', '3', '4'])
+
+    def test_malformed_cursor_is_rejected(self):
+        response = self.client.get(reverse('chat_messages', args=[self.chat.id]), {'after': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChatInboxTests(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.bob = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.chat = Chat.objects.create()
+        self.chat.participants.add(self.alice, self.bob)
+
+    def test_record_messages_updates_chat_and_unread_counts(self):
+        messages = [
+            ChatMessage.objects.create(chat=self.chat, sender=self.alice, message='one'),
+            ChatMessage.objects.create(chat=self.chat, sender=self.alice, message='two'),
+            ChatMessage.objects.create(chat=self.chat, sender=self.bob, message='three'),
+        ]
+        record_messages(messages)
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.last_message, 'three')
+        alice_row = self.alice.inbox.get(chat=self.chat)
+        bob_row = self.bob.inbox.get(chat=self.chat)
+        self.assertEqual((alice_row.name, alice_row.unread_count), ('bob', 1))
+        self.assertEqual((bob_row.name, bob_row.unread_count), ('alice', 2))
+        self.assertEqual(bob_row.last_message, 'three')
+
+    def test_blocking_updates_inbox_row(self):
+        self.chat.blocked_by.add(self.bob)
+        self.assertTrue(self.bob.inbox.get(chat=self.chat).blocked)
+        self.chat.blocked_by.remove(self.bob)
+        self.assertFalse(self.bob.inbox.get(chat=self.chat).blocked)
+
+    def test_removed_participant_loses_inbox_row(self):
+        self.chat.participants.remove(self.bob)
+        self.assertFalse(self.bob.inbox.exists())
+
+    def test_mark_read_moves_cursor_and_recounts_unread(self):
+        first, second = [
+            ChatMessage.objects.create(chat=self.chat, sender=self.alice, message=text) for text in ('one', 'two')
+        ]
+        record_messages([first, second])
+        bob_row = self.bob.inbox.get(chat=self.chat)
+        self.assertTrue(bob_row.unread)
+        self.assertFalse(self.alice.inbox.get(chat=self.chat).unread)
+
+        self.assertTrue(mark_read(self.bob.id, self.chat.id, first.id))
+        bob_row.refresh_from_db()
+        self.assertEqual((bob_row.last_read_message_id, bob_row.unread_count), (first.id, 1))
+        self.assertTrue(bob_row.unread)
+
+        # Older cursors and messages from other chats don't move it
+        self.assertFalse(mark_read(self.bob.id, self.chat.id, first.id))
+        other_chat = Chat.objects.create()
+        elsewhere = ChatMessage.objects.create(chat=other_chat, sender=self.alice, message='elsewhere')
+        self.assertFalse(mark_read(self.bob.id, self.chat.id, elsewhere.id))
+
+        self.assertTrue(mark_read(self.bob.id, self.chat.id, second.id))
+        bob_row.refresh_from_db()
+        self.assertEqual(bob_row.unread_count, 0)
+        self.assertFalse(bob_row.unread)
+
+    def test_resent_client_id_is_stored_once(self):
+        first = ChatMessage(chat=self.chat, sender=self.alice, message='hello', client_id='m-1')
+        write_behind = MessageWriteBehind()
+        saved, = write_behind._write([first])
+        # Resent after a reconnect, in a batch with a new message
+        resent = ChatMessage(chat=self.chat, sender=self.alice, message='hello', client_id='m-1')
+        other = ChatMessage(chat=self.chat, sender=self.alice, message='again', client_id='m-2')
+        duplicate, new = write_behind._write([resent, other])
+        self.assertEqual(duplicate.pk, saved.pk)
+        self.assertIsNotNone(new.pk)
+        self.assertEqual(write_behind.stats()['duplicate_messages'], 1)
+        self.assertEqual(self.chat.messages.count(), 2)
+        self.assertEqual(self.bob.inbox.get(chat=self.chat).unread_count, 2)
+
+    def test_replay_reads_only_messages_after_since(self):
+        first, second, third = [
+            ChatMessage.objects.create(chat=self.chat, sender=self.alice, message=text, client_id=text)
+            for text in ('one', 'two', 'three')
+        ]
+        ChatMessage.objects.create(chat=Chat.objects.create(), sender=self.alice, message='elsewhere')
+        self.assertEqual(replay_since({'query_string': f'since={first.id}'.encode()}), first.id)
+        rows = missed_messages(self.chat.id, first.id, limit=10)
+        self.assertEqual([row['id'] for row in rows], [second.id, third.id])
+        self.assertEqual((rows[0]['sender__username'], rows[0]['client_id']), ('alice', 'two'))
+        self.assertEqual(len(missed_messages(self.chat.id, first.id, limit=1)), 1)
+
+
+# database_sync_to_async closes connections left inside a transaction, so the async paths need TransactionTestCase.
+class MembershipCacheTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.alice = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.bob = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.chat = Chat.objects.create()
+        self.chat.participants.add(self.alice)
+        self.membership = MembershipCache()
+
+    def is_member(self, user):
+        return async_to_sync(self.membership.is_member)(self.chat.id, user.id)
+
+    def test_members_are_cached_and_denials_are_not(self):
+        self.assertTrue(self.is_member(self.alice))
+        self.assertTrue(self.is_member(self.alice))
+        self.assertFalse(self.is_member(self.bob))
+        # Added without m2m_changed, so only an uncached denial lets bob in
+        Chat.participants.through.objects.create(chat=self.chat, user=self.bob)
+        self.assertTrue(self.is_member(self.bob))
+        self.assertEqual(self.membership.stats()['hits'], 1)
+
+    def test_process_local_cache_keeps_entries_briefly(self):
+        self.assertEqual(self.membership.ttl, 5)
+        with override_settings(CHAT_MEMBERSHIP_CACHE={'TTL': 300, 'LOCAL_TTL': 2}):
+            self.assertEqual(self.membership.ttl, 2)
+
+    def test_removed_participant_is_refused(self):
+        self.assertTrue(self.is_member(self.alice))
+        self.chat.participants.remove(self.alice)
+        self.assertFalse(self.is_member(self.alice))
+
+    def test_cleared_participants_are_refused(self):
+        self.assertTrue(self.is_member(self.alice))
+        self.chat.participants.clear()
+        self.assertFalse(self.is_member(self.alice))
+
+    def test_deleted_chat_is_refused(self):
+        self.assertTrue(self.is_member(self.alice))
+        self.chat.delete()
+        self.assertFalse(self.is_member(self.alice))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ChatConsumerMessageTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.alice = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.bob = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.chat = Chat.objects.create()
+        self.chat.participants.add(self.alice, self.bob)
+        self.path = f'ws/chats/{self.chat.id}/'
+
+    def tearDown(self):
+        persistence._write_behind = None
+
+    async def connect(self, user):
+        socket = chat_socket(user, self.path)
+        connected, _ = await socket.connect()
+        self.assertTrue(connected)
+        return socket
+
+    def message_count(self):
+        return database_sync_to_async(self.chat.messages.count)()
+
+    async def test_resent_message_is_acked_again_without_a_second_broadcast(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        frame = {'message': 'hi', 'messageId': 'm-1'}
+        await alice.send_json_to(frame)
+        ack = await alice.receive_json_from()
+        self.assertEqual((ack['type'], ack['chat_id'], ack['messageId']), ('ack', self.chat.id, 'm-1'))
+        self.assertTrue(ack['created_at'])
+        self.assertEqual((await alice.receive_json_from())['id'], ack['id'])
+        self.assertEqual((await bob.receive_json_from())['id'], ack['id'])
+
+        # Same socket: answered from the in-memory window, even with the row gone
+        await database_sync_to_async(ChatMessage.objects.filter(pk=ack['id']).delete)()
+        await alice.send_json_to(frame)
+        self.assertEqual(await alice.receive_json_from(), ack)
+        self.assertTrue(await bob.receive_nothing())
+        self.assertEqual(await self.message_count(), 0)
+
+        await alice.send_json_to({'message': 'again', 'messageId': 'm-2'})
+        second_ack = await alice.receive_json_from()
+        await alice.receive_json_from()
+        await bob.receive_json_from()
+        # A new socket has an empty window: the unique constraint finds the stored copy
+        await alice.disconnect()
+        alice = await self.connect(self.alice)
+        await alice.send_json_to({'message': 'again', 'messageId': 'm-2'})
+        self.assertEqual(await alice.receive_json_from(), second_ack)
+        self.assertTrue(await bob.receive_nothing())
+        self.assertEqual(await self.message_count(), 1)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    @override_settings(CHAT_WRITE_BEHIND={'ENABLED': True, 'FLUSH_INTERVAL_MS': 60_000})
+    async def test_write_behind_resend_is_not_broadcast_again(self):
+        first, bob = await self.connect(self.alice), await self.connect(self.bob)
+        frame = {'message': 'hi', 'messageId': 'm-1'}
+        await first.send_json_to(frame)
+        self.assertEqual((await first.receive_json_from())['type'], 'message')
+        self.assertEqual((await bob.receive_json_from())['messageId'], 'm-1')
+
+        # Resent on a second socket while the first copy is still queued
+        second = await self.connect(self.alice)
+        await second.send_json_to(frame)
+        self.assertTrue(await bob.receive_nothing())
+        await get_write_behind().flush()
+        ack = await first.receive_json_from()
+        self.assertEqual(await second.receive_json_from(), ack)
+        self.assertEqual((ack['type'], ack['messageId']), ('ack', 'm-1'))
+
+        # Resent on a third socket once stored
+        third = await self.connect(self.alice)
+        await third.send_json_to(frame)
+        self.assertEqual(await third.receive_json_from(), ack)
+        self.assertTrue(await bob.receive_nothing())
+        self.assertEqual(await self.message_count(), 1)
+        for socket in (first, second, third, bob):
+            await socket.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CHAT_READ_RECEIPTS={'FLUSH_MS': 0})
+class UserConsumerTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.alice = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.bob = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.carol = User.objects.create_user(username='carol', password='secret-pass-123')
+        self.chat = Chat.objects.create()
+        self.chat.participants.add(self.alice, self.bob)
+
+    async def connect(self, user):
+        socket = chat_socket(user, 'ws/me/')
+        connected, _ = await socket.connect()
+        self.assertTrue(connected)
+        return socket
+
+    async def create_chat(self, *users):
+        chat = await database_sync_to_async(Chat.objects.create)()
+        await database_sync_to_async(chat.participants.add)(*users)
+        return chat
+
+    async def test_message_is_acked_and_broadcast_to_the_chat(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        await alice.send_json_to({'type': 'message', 'chat_id': self.chat.id, 'message': 'hi', 'messageId': 'm-1'})
+        ack = await alice.receive_json_from()
+        self.assertEqual((ack['type'], ack['chat_id'], ack['messageId']), ('ack', self.chat.id, 'm-1'))
+        self.assertEqual((await alice.receive_json_from())['id'], ack['id'])
+        frame = await bob.receive_json_from()
+        self.assertEqual((frame['type'], frame['chat_id'], frame['message']), ('message', self.chat.id, 'hi'))
+        self.assertEqual(frame['sender_username'], 'alice')
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_chat_the_user_is_not_in_is_rejected(self):
+        other_chat = await self.create_chat(self.bob, self.carol)
+        alice, carol = await self.connect(self.alice), await self.connect(self.carol)
+        await alice.send_json_to({'type': 'subscribe', 'chat_id': other_chat.id})
+        self.assertEqual(
+            await alice.receive_json_from(),
+            {'type': 'error', 'chat_id': other_chat.id, 'detail': 'Not allowed in this chat'},
+        )
+        for frame_type in ('message', 'read'):
+            await alice.send_json_to({'type': frame_type, 'chat_id': other_chat.id, 'message': 'hi', 'message_id': 1})
+            self.assertEqual(
+                await alice.receive_json_from(),
+                {'type': 'error', 'chat_id': other_chat.id, 'detail': 'Not subscribed to this chat'},
+            )
+        await carol.send_json_to({'type': 'message', 'chat_id': other_chat.id, 'message': 'secret'})
+        self.assertEqual((await carol.receive_json_from())['message'], 'secret')
+        self.assertTrue(await alice.receive_nothing())
+        self.assertEqual(await database_sync_to_async(ChatMessage.objects.filter(sender=self.alice).count)(), 0)
+        await alice.disconnect()
+        await carol.disconnect()
+
+    async def test_subscribe_and_unsubscribe(self):
+        alice, carol = await self.connect(self.alice), await self.connect(self.carol)
+        # Created after alice connected, so she has to subscribe to it
+        new_chat = await self.create_chat(self.alice, self.carol)
+        await alice.send_json_to({'type': 'subscribe', 'chat_id': new_chat.id})
+        self.assertEqual(await alice.receive_json_from(), {'type': 'subscribed', 'chat_id': new_chat.id})
+        await carol.send_json_to({'type': 'subscribe', 'chat_id': new_chat.id})
+        await carol.receive_json_from()
+        await carol.send_json_to({'type': 'message', 'chat_id': new_chat.id, 'message': 'welcome'})
+        await carol.receive_json_from()
+        frame = await alice.receive_json_from()
+        self.assertEqual((frame['chat_id'], frame['message']), (new_chat.id, 'welcome'))
+
+        await alice.send_json_to({'type': 'unsubscribe', 'chat_id': new_chat.id})
+        self.assertEqual(await alice.receive_json_from(), {'type': 'unsubscribed', 'chat_id': new_chat.id})
+        await carol.send_json_to({'type': 'message', 'chat_id': new_chat.id, 'message': 'still there?'})
+        await carol.receive_json_from()
+        self.assertTrue(await alice.receive_nothing())
+        await alice.disconnect()
+        await carol.disconnect()
+
+    async def test_read_frame_sends_a_receipt_to_the_chat(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        await bob.send_json_to({'type': 'message', 'chat_id': self.chat.id, 'message': 'hi'})
+        message_id = (await bob.receive_json_from())['id']
+        await alice.receive_json_from()
+        await alice.send_json_to({'type': 'read', 'chat_id': self.chat.id, 'message_id': message_id})
+        receipt = {'type': 'read', 'chat_id': self.chat.id, 'user_id': str(self.alice.pk), 'message_id': message_id}
+        self.assertEqual(await bob.receive_json_from(), receipt)
+        self.assertEqual(await alice.receive_json_from(), receipt)
+        row = await database_sync_to_async(self.alice.inbox.get)(chat=self.chat)
+        self.assertEqual((row.last_read_message_id, row.unread_count), (message_id, 0))
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_malformed_frames_are_answered_with_errors(self):
+        alice = await self.connect(self.alice)
+        await alice.send_json_to({'type': 'subscribe'})
+        self.assertEqual(await alice.receive_json_from(), {'type': 'error', 'chat_id': None, 'detail': 'chat_id is required'})
+        await alice.send_json_to({'type': 'wave', 'chat_id': self.chat.id})
+        self.assertEqual(
+            await alice.receive_json_from(),
+            {'type': 'error', 'chat_id': self.chat.id, 'detail': "Unknown frame type 'wave'"},
+        )
+        await alice.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class PokeTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.bob = User.objects.create_user(username='bob', password='secret-pass-123')
+
+    def poke(self, user, target):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(reverse('poke'), {'target_id': target.id}, format='json')
+
+    def test_pokes_either_way_share_one_chat(self):
+        first = self.poke(self.alice, self.bob)
+        second = self.poke(self.bob, self.alice)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(first.data['chat_id'], second.data['chat_id'])
+        chat = Chat.objects.get()
+        self.assertEqual((chat.pair_low, chat.pair_high), (self.alice.id, self.bob.id))
+        self.assertEqual(set(chat.participants.all()), {self.alice, self.bob})
+
+    def test_concurrent_pokes_create_one_chat(self):
+        barrier = threading.Barrier(4)
+        chat_ids = []
+
+        def poke(user, target):
+            try:
+                barrier.wait()
+                response = self.poke(user, target)
+                chat_ids.append((response.status_code, response.data['chat_id']))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=poke, args=pair) for pair in [(self.alice, self.bob), (self.bob, self.alice)] * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        chat = Chat.objects.get()
+        self.assertEqual(chat_ids, [(200, str(chat.id))] * 4)
+        self.assertEqual(chat.participants.count(), 2)
+
+    def test_pair_key_is_unique(self):
+        Chat.objects.create(**Chat.pair_key(self.bob.id, self.alice.id))
+        with self.assertRaises(IntegrityError):
+            Chat.objects.create(**Chat.pair_key(self.alice.id, self.bob.id))
+
+    def test_self_poke_is_rejected(self):
+        self.assertEqual(self.poke(self.alice, self.alice).status_code, 400)
+        self.assertFalse(Chat.objects.exists())
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class NotificationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret-pass-123')
+
+    def test_notify_user_queues_and_pushes_on_commit(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(user_group(self.user.id), channel)
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = notify_user(self.user.id, 'poke', {'from': 'bob'})
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual((event['type'], event['id'], event['payload']), ('notify', notification.id, {'from': 'bob'}))
+        self.assertEqual(get_pending(self.user.id), [notification])
+
+    def test_pending_notifications_stay_queued_until_delivered(self):
+        first, second = [Notification.objects.create(user=self.user, kind='poke') for _ in range(2)]
+        self.assertEqual(get_pending(self.user.id), [first, second])
+        self.assertEqual(get_pending(self.user.id), [first, second])
+        mark_delivered(first.id)
+        self.assertEqual(get_pending(self.user.id), [second])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class NotificationReplayTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.notifications = [
+            Notification.objects.create(user=self.user, kind='poke', payload={'n': n}) for n in range(2)
+        ]
+
+    async def test_queued_notifications_are_deleted_once_sent(self):
+        socket = chat_socket(self.user, 'ws/me/')
+        connected, _ = await socket.connect()
+        self.assertTrue(connected)
+        for notification in self.notifications:
+            frame = await socket.receive_json_from()
+            self.assertEqual((frame['type'], frame['id']), ('notification', notification.id))
+        self.assertEqual(await database_sync_to_async(get_pending)(self.user.id), [])
+        await socket.disconnect()
+
+    async def test_notifications_not_sent_stay_queued(self):
+        sent = []
+
+        async def send_once(consumer, event):
+            if sent:
+                raise ConnectionError("socket dropped")
+            sent.append(event['id'])
+
+        socket = chat_socket(self.user, 'ws/me/')
+        with mock.patch.object(UserConsumer, 'send_notification', send_once):
+            connected, _ = await socket.connect()
+            self.assertTrue(connected)
+            with self.assertRaises(ConnectionError):
+                await socket.receive_output()
+        pending = await database_sync_to_async(get_pending)(self.user.id)
+        self.assertEqual(sent, [self.notifications[0].id])
+        self.assertEqual(pending, self.notifications[1:])
+
+
+class WebSocketAuthTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(username='alice', password='secret-pass-123')
+        # Carries the username claim
+        self.token = str(TokenObtainPairWithUsernameSerializer.get_token(self.user).access_token)
+
+    def get_user(self, token=None):
+        return async_to_sync(get_user_for_token)(token or self.token)
+
+    @override_settings(WS_JWT_AUTH={'STATELESS': True})
+    def test_stateless_user_comes_from_the_claims(self):
+        with self.assertNumQueries(0):
+            user = self.get_user()
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual((str(user.pk), user.username), (str(self.user.pk), 'alice'))
+
+    @override_settings(WS_JWT_AUTH={'STATELESS': True, 'USER_CACHE_TTL': 0})
+    def test_stateless_falls_back_to_db_without_username_claim(self):
+        user = self.get_user(str(AccessToken.for_user(self.user)))
+        self.assertEqual(user, self.user)
+
+    @override_settings(WS_JWT_AUTH={'STATELESS': False, 'USER_CACHE_TTL': 0})
+    def test_db_lookup_refuses_inactive_users(self):
+        self.assertEqual(self.get_user(), self.user)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.get_user()
+
+    @override_settings(WS_JWT_AUTH={'STATELESS': False, 'USER_CACHE_TTL': 30})
+    def test_db_users_are_cached(self):
+        self.assertEqual(self.get_user(), self.user)
+        with self.assertNumQueries(0):
+            user = self.get_user()
+        self.assertEqual((user, user.username, user.is_active), (self.user, 'alice', True))
+        # Nothing beyond what the consumers need, least of all the password hash
+        cached = caches['default'].get(f'ws_user:{self.user.pk}')
+        self.assertEqual(cached, {'id': self.user.pk, 'username': 'alice', 'is_active': True})
+        self.assertEqual(user.password, '')
+
+
+class UserProfileListTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+        for number in range(1, 23):
+            user = User.objects.create_user(username=f'user{number}', password='secret-pass-123')
+            UserProfile.objects.create(
+                user=user, name=f'User {number}', dateOfBirth_str=date(1990, 1, 1), gender='female',
+                profile_picture=f'profile_pictures/user {number}.jpg',
+            )
+
+    def get_list(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('userprofile-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        _, few_queries = self.get_list(limit=2)
+        response, many_queries = self.get_list(limit=22)
+        self.assertEqual(len(response.data['results']), 22)
+        self.assertEqual(few_queries, many_queries)
+
+    def test_list_pages_with_cursor(self):
+        usernames, cursor = [], None
+        for limit in (3, 3, 16):
+            response, _ = self.get_list(limit=limit, **({'cursor': cursor} if cursor else {}))
+            usernames += [row['username'] for row in response.data['results']]
+            cursor = response.data['next']
+        self.assertEqual(usernames, [f'user{number}' for number in range(1, 23)])
+        self.assertIsNone(cursor)
+
+    def test_list_rows_are_lean_with_absolute_picture_urls(self):
+        response, _ = self.get_list(limit=1)
+        row, = response.data['results']
+        self.assertNotIn('email', row)
+        full = UserProfileSerializer(UserProfile.objects.get(user__username='user1'), context={'request': response.wsgi_request})
+        self.assertEqual(row['profile_picture'], full.data['profile_picture'])
+
+    def test_only_reads_and_patches_are_allowed(self):
+        self.assertEqual(self.client.put(reverse('userprofile-detail', args=['me']), {}).status_code, 405)
+        self.assertEqual(self.client.delete(reverse('userprofile-detail', args=['me'])).status_code, 405)
+        self.assertEqual(self.client.post(reverse('userprofile-list'), {}).status_code, 405)
+
+
+class NearbyUsersTests(APITestCase):
+    # Dyadic coordinates, so distances along the meridian are exact
+    ORIGIN = (13.5, 52.5)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+        self.add_profile(self.user, 0)
+        # Degrees of latitude north (or south) of bob: ~1.7, 3.5, 5.2 and 6.9 km, and ~111 km
+        for username, offset in [('near', 1 / 64), ('north', 2 / 64), ('south', -3 / 64), ('far', 4 / 64), ('remote', 1.0)]:
+            self.add_profile(User.objects.create_user(username=username, password='secret-pass-123'), offset)
+
+    def add_profile(self, user, offset):
+        lon, lat = self.ORIGIN
+        return UserProfile.objects.create(
+            user=user, name=user.username, dateOfBirth_str=date(1990, 1, 1), gender='female',
+            location=Point(lon, lat + offset, srid=4326),
+        )
+
+    def get_nearby(self, **params):
+        response = self.client.get(reverse('nearby_users'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['username'] for row in response.data['results']], response.data['next']
+
+    def test_pages_closest_first_with_cursor(self):
+        usernames, cursor = self.get_nearby(radius=10, limit=3)
+        self.assertEqual(usernames, ['near', 'north', 'south'])
+        usernames, cursor = self.get_nearby(radius=10, limit=3, cursor=cursor)
+        self.assertEqual(usernames, ['far'])
+        self.assertIsNone(cursor)
+
+    def test_radius_is_capped(self):
+        usernames, _ = self.get_nearby(radius=100_000, limit=10)
+        self.assertNotIn('remote', usernames)
+        self.assertEqual(usernames, ['near', 'north', 'south', 'far'])
+
+    def test_invalid_cursor_is_rejected(self):
+        for cursor in ['not-a-cursor', encode_cursor('a', 'b'), encode_cursor(0.5, '3'), encode_cursor(0.5, True)]:
+            response = self.client.get(reverse('nearby_users'), {'radius': 10, 'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_sort_by_match_ranks_shared_interests_first(self):
+        for profile in UserProfile.objects.filter(user__username__in=['bob', 'far']):
+            profile.interests = 'hiking, chess'
+            profile.save()
+        usernames, cursor = self.get_nearby(radius=10, limit=2, sort='match')
+        self.assertEqual(usernames, ['far', 'near'])
+        usernames, cursor = self.get_nearby(radius=10, limit=2, sort='match', cursor=cursor)
+        self.assertEqual(usernames, ['north', 'south'])
+        self.assertIsNone(cursor)
+
+    def test_sort_by_match_rejects_cursors_with_wrong_types(self):
+        for cursor in [encode_cursor('0.5', 3), encode_cursor(0.5, 'x'), encode_cursor(float('nan'), 3)]:
+            response = self.client.get(reverse('nearby_users'), {'radius': 10, 'sort': 'match', 'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(NEARBY_USERS_CACHE={'ENABLED': True, 'PRECISION': 5, 'TTL': 60, 'MAX_CELLS': 10000, 'MAX_CELLS_PER_QUERY': 64})
+class NearbyUsersCacheTests(NearbyUsersTests):
+    """The NearbyUsersTests again, served from the geohash cell cache, plus its invalidation."""
+
+    def setUp(self):
+        nearby_cache.clear()
+        self.addCleanup(nearby_cache.clear)
+        super().setUp()
+
+    def move(self, username, offset):
+        lon, lat = self.ORIGIN
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username=username))
+        response = client.patch(
+            reverse('userprofile-detail', args=['me']),
+            {'location': {'type': 'Point', 'coordinates': [lon, lat + offset]}}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_repeated_search_is_served_from_cached_cells(self):
+        self.get_nearby(radius=10)
+        misses = nearby_cache.stats()['misses']
+        self.assertGreater(misses, 0)
+        self.get_nearby(radius=10)
+        self.assertEqual(nearby_cache.stats()['misses'], misses)
+
+    def test_profile_update_moves_user_between_cached_cells(self):
+        self.get_nearby(radius=10)
+        misses = nearby_cache.stats()['misses']
+        self.move('near', 1.0)
+        usernames, _ = self.get_nearby(radius=10)
+        self.assertEqual(usernames, ['north', 'south', 'far'])
+        self.move('remote', 5 / 64)
+        usernames, _ = self.get_nearby(radius=10)
+        self.assertEqual(usernames, ['north', 'south', 'far', 'remote'])
+        # Answered without reloading any cell
+        self.assertEqual(nearby_cache.stats()['misses'], misses)
+
+
+class MatchScoreTests(SimpleTestCase):
+    def make_batch(self, distances, interests, moods=None, birth_dates=None):
+        count = len(distances)
+        return CandidateBatch(
+            list(range(1, count + 1)), distances, [hash_tokens(text) for text in interests],
+            moods or [None] * count, birth_dates or [None] * count,
+        )
+
+    def test_hash_tokens_ignores_case_punctuation_and_order(self):
+        self.assertEqual(hash_tokens('Hiking, chess!'), hash_tokens('chess hiking'))
+        self.assertNotEqual(hash_tokens('hiking'), hash_tokens('chess'))
+        self.assertEqual(hash_tokens(''), bytes(INTEREST_VECTOR_BYTES))
+
+    def test_each_component_raises_the_score(self):
+        # Closer, more shared interests, compatible mood, closer in age
+        batch = self.make_batch(
+            [1.0, 9.0, 5.0, 5.0, 5.0, 5.0],
+            ['', '', 'hiking chess', 'cooking', '', ''],
+            moods=[None, None, None, None, 'casual chat', 'networking'],
+            birth_dates=[None, None, None, None, None, None],
+        )
+        scores = score_candidates(batch, 10, hash_tokens('hiking chess'), 'casual chat', None)
+        self.assertTrue(((scores >= 0) & (scores <= 1)).all())
+        self.assertGreater(scores[0], scores[1])
+        self.assertGreater(scores[2], scores[3])
+        self.assertGreater(scores[4], scores[5])
+
+        batch = self.make_batch([5.0, 5.0, 5.0], ['', '', ''], birth_dates=[date(1990, 1, 1), date(1960, 1, 1), None])
+        scores = score_candidates(batch, 10, None, None, date(1991, 1, 1))
+        self.assertGreater(scores[0], scores[2])
+        self.assertGreater(scores[2], scores[1])
+
+    def test_empty_batch(self):
+        self.assertEqual(len(score_candidates(self.make_batch([], []), 10, None, None, None)), 0)
+
+    def test_top_candidates_breaks_ties_by_user_id_and_pages_after_a_cursor(self):
+        batch = self.make_batch([1.0] * 5, [''] * 5)
+        scores = np.array([0.5, 0.9, 0.5, 0.7, 0.5], dtype=np.float32)
+        first = top_candidates(batch, scores, 3)
+        self.assertEqual(batch.user_ids[first].tolist(), [2, 4, 1])
+        last = first[-1]
+        rest = top_candidates(batch, scores, 3, after=(float(scores[last]), int(batch.user_ids[last])))
+        self.assertEqual(batch.user_ids[rest].tolist(), [3, 5])
+
+
+class ProfileSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bob', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+        for username, interests, personality, why in [
+            ('hiker', 'hiking and climbing', '', ''),
+            ('reader', 'books', '', 'I would like to go hiking'),
+            ('player', 'chess', 'calm', ''),
+            ('both', 'hiking', 'chess nerd', ''),
+        ]:
+            UserProfile.objects.create(
+                user=User.objects.create_user(username=username, password='secret-pass-123'), name=username,
+                dateOfBirth_str=date(1990, 1, 1), gender='female', interests=interests, personality=personality, why=why,
+            )
+
+    def search(self, **params):
+        response = self.client.get(reverse('userprofile-search'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['username'] for row in response.data['results']], response.data['next']
+
+    def test_interests_rank_above_why(self):
+        usernames, cursor = self.search(q='hiking')
+        self.assertEqual(set(usernames[:2]), {'hiker', 'both'})
+        self.assertEqual(usernames[2:], ['reader'])
+        self.assertIsNone(cursor)
+
+    def test_web_search_syntax(self):
+        usernames, _ = self.search(q='hiking -chess')
+        self.assertEqual(set(usernames), {'hiker', 'reader'})
+        usernames, _ = self.search(q='chess or climbing')
+        self.assertEqual(set(usernames), {'hiker', 'player', 'both'})
+
+    def test_pages_follow_the_ranking(self):
+        ranked, _ = self.search(q='hiking')
+        usernames, cursor = [], None
+        for _ in ranked:
+            page, cursor = self.search(q='hiking', limit=1, **({'cursor': cursor} if cursor else {}))
+            usernames += page
+        self.assertEqual(usernames, ranked)
+        self.assertIsNone(cursor)
+
+    def test_pages_through_tied_ranks(self):
+        # Identical text gives identical ranks, none of them exact in float4
+        for number in range(5):
+            UserProfile.objects.create(
+                user=User.objects.create_user(username=f'skater{number}', password='secret-pass-123'), name='skater',
+                dateOfBirth_str=date(1990, 1, 1), gender='female', interests='skating',
+            )
+        usernames, cursor = [], None
+        for _ in range(3):
+            page, cursor = self.search(q='skating', limit=2, **({'cursor': cursor} if cursor else {}))
+            usernames += page
+        self.assertEqual(usernames, [f'skater{number}' for number in range(5)])
+        self.assertIsNone(cursor)
+
+    def test_search_vector_follows_profile_updates(self):
+        profile = UserProfile.objects.get(user__username='player')
+        profile.interests = 'hiking'
+        profile.save()
+        usernames, _ = self.search(q='hiking')
+        self.assertIn('player', usernames)
+        usernames, _ = self.search(q='chess')
+        self.assertEqual(set(usernames), {'player', 'both'})
+
+    def test_missing_query_and_bad_cursor_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('userprofile-search')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('userprofile-search'), {'q': 'hiking', 'cursor': 'x'}).status_code, 400)
+        wrong_types = encode_cursor('high', 1)
+        self.assertEqual(self.client.get(reverse('userprofile-search'), {'q': 'hiking', 'cursor': wrong_types}).status_code, 400)
+
+
+class ProfileFeatureVectorTests(APITestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='alice', password='secret-pass-123')
+        self.profile = UserProfile.objects.create(
+            user=user, name='Alice', dateOfBirth_str=date(1990, 1, 1), gender='female',
+            interests='hiking, chess', personality='calm', why='new to town',
+        )
+
+    def assertVectorsMatch(self, profile):
+        profile.refresh_from_db()
+        interest_vector, feature_vector = build_features(feature_source(profile))
+        self.assertEqual(bytes(profile.interest_vector), interest_vector)
+        self.assertEqual(bytes(profile.feature_vector), feature_vector)
+
+    def test_vectors_are_built_on_create(self):
+        self.assertVectorsMatch(self.profile)
+        self.assertEqual(bytes(self.profile.interest_vector), hash_tokens('hiking, chess'))
+
+    def test_text_change_rebuilds_vectors(self):
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        profile.interests = 'climbing'
+        profile.save()
+        self.assertVectorsMatch(profile)
+
+    def test_update_fields_save_writes_rebuilt_vectors(self):
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        profile.why = 'looking for a chess partner'
+        profile.save(update_fields=['why'])
+        self.assertVectorsMatch(profile)
+
+    def test_unchanged_text_skips_the_rebuild(self):
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        with mock.patch('users.signals.build_features', wraps=build_features) as build:
+            profile.name = 'Alice B.'
+            profile.save()
+            profile.save(update_fields=['name'])
+            UserProfile.objects.get(pk=self.profile.pk).save()
+        build.assert_not_called()
+        self.assertVectorsMatch(profile)
+
+
+@override_settings(PROFILE_THUMBNAILS={'SIZES': {'small': 16, 'large': 64}, 'FORMAT': 'WEBP', 'QUALITY': 80})
+class ThumbnailTests(SimpleTestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, image, image_format='PNG', **save_options):
+        buffer = BytesIO()
+        image.save(buffer, image_format, **save_options)
+        return SimpleUploadedFile('picture', buffer.getvalue())
+
+    def open_stored(self, name):
+        with default_storage.open(name, 'rb') as file:
+            image = Image.open(file)
+            image.load()
+        return image
+
+    def test_picture_is_stored_by_content_hash_with_each_size(self):
+        name, thumbnails = store_picture(self.upload(Image.new('RGB', (200, 100), 'red')))
+        self.assertRegex(name, r'^profile_pictures/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(set(thumbnails), {'small', 'large'})
+        self.assertTrue(thumbnails['small'].endswith('_16.webp'))
+        self.assertEqual(self.open_stored(thumbnails['small']).size, (16, 8))
+        self.assertEqual(self.open_stored(thumbnails['large']).size, (64, 32))
+
+    def test_identical_pictures_share_one_copy(self):
+        image = Image.new('RGB', (50, 50), 'blue')
+        first = store_picture(self.upload(image))
+        with mock.patch('users.thumbnails.render_thumbnails') as render:
+            second = store_picture(self.upload(image))
+        self.assertEqual(first, second)
+        render.assert_not_called()
+        self.assertEqual(len(default_storage.listdir(os.path.dirname(first[0]))[1]), 1)
+
+    def test_thumbnails_follow_exif_orientation_and_keep_alpha(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees
+        _, thumbnails = store_picture(self.upload(Image.new('RGB', (120, 60)), 'JPEG', exif=exif))
+        self.assertEqual(self.open_stored(thumbnails['large']).size, (32, 64))
+
+        _, thumbnails = store_picture(self.upload(Image.new('RGBA', (64, 64), (0, 0, 0, 0))))
+        self.assertEqual(self.open_stored(thumbnails['small']).mode, 'RGBA')
+
+    def test_backfill_worker_skips_missing_and_invalid_files(self):
+        self.assertEqual(store_existing_picture('profile_pictures/missing.jpg'), ('profile_pictures/missing.jpg', None))
+        name = default_storage.save('profile_pictures/notes.txt', SimpleUploadedFile('notes.txt', b'not an image'))
+        self.assertEqual(store_existing_picture(name), (name, None))
+
+
+@override_settings(PROFILE_PICTURE_UPLOAD={'MAX_BYTES': 10 * 1024 * 1024, 'MAX_PIXELS': 40_000_000})
+class StreamingUploadTests(SimpleTestCase):
+    def make_request(self, content, name='picture.png', field='profile_picture'):
+        body = encode_multipart(BOUNDARY, {field: SimpleUploadedFile(name, content, 'image/png'), 'name': 'Bob'})
+        return RequestFactory().generic('PATCH', '/api/users/me/', body, content_type=MULTIPART_CONTENT)
+
+    def parse(self, request):
+        """Parse the request body the way UserProfileViewSet does; returns (files, peak traced bytes)."""
+        request = Request(request, parsers=[StreamingMultiPartParser()])
+        tracemalloc.start()
+        try:
+            files = request.FILES
+            return files, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def large_png(self):
+        # Random pixels don't compress, so this is an ~8 MB file.
+        image = Image.frombytes('RGB', (1650, 1650), os.urandom(1650 * 1650 * 3))
+        buffer = BytesIO()
+        image.save(buffer, 'PNG', compress_level=0)
+        return buffer.getvalue()
+
+    def test_large_upload_is_spooled_with_flat_memory(self):
+        content = self.large_png()
+        files, peak = self.parse(self.make_request(content))
+        picture = files['profile_picture']
+        self.assertEqual(picture.size, len(content))
+        self.assertTrue(os.path.exists(picture.temporary_file_path()))
+        self.assertLess(peak, 1024 * 1024)
+        picture.close()
+
+    def test_oversized_upload_is_rejected_while_streaming(self):
+        # Small enough over the limit to pass the Content-Length check, so the received chunks are counted.
+        request = self.make_request(bytes(10 * 1024 * 1024 + 32 * 1024))
+        with self.assertRaises(UploadTooLarge):
+            self.parse(request)
+
+    def test_oversized_content_length_is_rejected_up_front(self):
+        with self.assertRaises(UploadTooLarge):
+            self.parse(self.make_request(bytes(11 * 1024 * 1024)))
+
+    def test_header_is_validated(self):
+        with self.assertRaises(ValidationError):
+            self.parse(self.make_request(b'not an image'))
+        files, _ = self.parse(self.make_request(b'not an image', field='other_file'))
+        self.assertNotIn('other_file', files)
+
+
+class RateLimitTests(SimpleTestCase):
+    def test_token_bucket_refills_at_rate_up_to_capacity(self):
+        bucket = TokenBucket(rate=10, capacity=2, now=0.0)
+        for _ in range(2):
+            self.assertEqual(bucket.wait(0.0), 0)
+            bucket.take()
+        self.assertAlmostEqual(bucket.wait(0.0), 0.1)
+        self.assertEqual(bucket.wait(0.1), 0)
+        self.assertEqual(bucket.wait(60.0), 0)
+        self.assertEqual(bucket.tokens, 2)
+
+    @override_settings(CHAT_RATE_LIMIT={'RATE': 1, 'BURST': 1, 'USER_RATE': 1000, 'USER_BURST': 1000, 'MAX_DELAY_MS': 0})
+    def test_frames_over_the_limit_are_dropped_and_counted(self):
+        limiter = RateLimiter()
+        limit = limiter.connect(user_id=1)
+        self.assertEqual(async_to_sync(limiter.admit)(limit), 0)
+        self.assertIsNone(async_to_sync(limiter.admit)(limit))
+        self.assertEqual(limiter.stats()['throttled_frames'], 1)
+        limiter.disconnect(limit)
+        self.assertEqual(limiter.stats()['users'], 0)
+
+    @override_settings(CHAT_RATE_LIMIT={'RATE': 1000, 'BURST': 1000, 'USER_RATE': 1, 'USER_BURST': 2, 'MAX_DELAY_MS': 0})
+    def test_user_limit_is_shared_by_the_users_connections(self):
+        limiter = RateLimiter()
+        first, second = limiter.connect(user_id=1), limiter.connect(user_id=1)
+        self.assertEqual(async_to_sync(limiter.admit)(first), 0)
+        self.assertEqual(async_to_sync(limiter.admit)(second), 0)
+        self.assertIsNone(async_to_sync(limiter.admit)(first))
+        self.assertEqual(async_to_sync(limiter.admit)(limiter.connect(user_id=2)), 0)
+        # A token user's str pk and a DB user's int pk are the same user
+        self.assertIsNone(async_to_sync(limiter.admit)(limiter.connect(user_id='1')))
+        self.assertEqual(limiter.stats()['users'], 2)
+
+
+class WriteBehindTests(SimpleTestCase):
+    """Batching and ordering of MessageWriteBehind, with _write standing in for the database."""
+
+    def make_buffer(self, fail=False, **kwargs):
+        write_behind = MessageWriteBehind(**kwargs)
+        write_behind.batches = []
+
+        def write(messages):
+            if fail:
+                raise OperationalError("connection lost")
+            write_behind.batches.append([message.message for message in messages])
+            return messages
+        write_behind._write = write
+        return write_behind
+
+    async def test_flush_writes_in_order_and_resolves_futures(self):
+        write_behind = self.make_buffer(flush_interval_ms=60_000)
+        futures = [write_behind.enqueue(1, 1, text) for text in ('one', 'two', 'three')]
+        self.assertEqual(write_behind.stats()['pending'], 3)
+        saved = await write_behind.flush()
+        self.assertEqual(write_behind.batches, [['one', 'two', 'three']])
+        self.assertEqual([future.result().message for future in futures], ['one', 'two', 'three'])
+        self.assertEqual(len(saved), 3)
+        self.assertEqual(await write_behind.flush(), [])
+
+    async def test_timer_flushes_after_interval(self):
+        write_behind = self.make_buffer(flush_interval_ms=1)
+        future = write_behind.enqueue(1, 1, 'one')
+        await asyncio.wait_for(future, timeout=1)
+        self.assertEqual(write_behind.batches, [['one']])
+
+    async def test_full_batch_is_written_without_waiting_for_the_timer(self):
+        write_behind = self.make_buffer(flush_interval_ms=60_000, max_batch=2)
+        futures = [write_behind.enqueue(1, 1, text) for text in ('one', 'two')]
+        await asyncio.wait_for(asyncio.gather(*futures), timeout=1)
+        self.assertEqual(write_behind.batches, [['one', 'two']])
+        third = write_behind.enqueue(1, 1, 'three')
+        await asyncio.sleep(0)
+        self.assertFalse(third.done())
+        await write_behind.flush()
+        self.assertEqual(write_behind.batches, [['one', 'two'], ['three']])
+
+    async def test_failed_write_resolves_futures_with_none(self):
+        write_behind = self.make_buffer(fail=True, flush_interval_ms=60_000)
+        futures = [write_behind.enqueue(1, 1, text) for text in ('one', 'two')]
+        with self.assertLogs('users.persistence', 'ERROR'):
+            self.assertEqual(await write_behind.flush(), [])
+        self.assertEqual([future.result() for future in futures], [None, None])
+        stats = write_behind.stats()
+        self.assertEqual((stats['failed_flushes'], stats['failed_messages'], stats['pending']), (1, 2, 0))
+
+    def test_failed_shutdown_flush_is_counted(self):
+        write_behind = self.make_buffer(fail=True)
+        write_behind._pending = [(ChatMessage(chat_id=1, sender_id=1, message='one'), 0.0, None)]
+        with self.assertLogs('users.persistence', 'ERROR'):
+            write_behind.flush_sync()
+        self.assertEqual(write_behind.stats()['failed_messages'], 1)
+
+
+class WireTests(SimpleTestCase):
+    def test_negotiate(self):
+        with override_settings(CHAT_FANOUT={'BATCH_MS': 5}):
+            self.assertEqual(negotiate({'query_string': b''}), (JSON, 0))
+            self.assertEqual(negotiate({'query_string': b'format=msgpack&batch=1'}), (MSGPACK, 0.005))
+            self.assertEqual(negotiate({'query_string': b'format=xml&batch=yes'}), (JSON, 0))
+
+    def test_batch_frame_wraps_encoded_frames(self):
+        frames = [{'type': 'message', 'n': n} for n in range(3)]
+        self.assertEqual(
+            json.loads(batch_frame([encode_for(frame, JSON) for frame in frames], JSON)),
+            {'type': 'batch', 'messages': frames},
+        )
+        # fixarray, array16 and array32 headers
+        for count in (3, 20, 70_000):
+            frames = list(range(count))
+            batch = batch_frame([encode_for(frame, MSGPACK) for frame in frames], MSGPACK)
+            self.assertEqual(msgpack.unpackb(batch), {'type': 'batch', 'messages': frames})
+
+    def make_socket(self, query_string):
+        socket = ChatConsumer()
+        socket.scope = {'type': 'websocket', 'query_string': query_string, 'user': User(pk=1, username='alice')}
+        socket.setup_wire()
+        socket.max_batch = 3
+        socket.sent = []
+
+        async def send(text_data=None, bytes_data=None):
+            socket.sent.append(text_data if text_data is not None else bytes_data)
+        socket.send = send
+        return socket
+
+    async def test_batching_socket_sends_frames_together(self):
+        socket = self.make_socket(b'batch=1')
+        socket.batch_interval = 60  # Only full batches and explicit flushes are sent
+        for n in range(4):
+            await socket.send_encoded(encode_frame({'n': n}))
+        self.assertEqual(len(socket.sent), 1)
+        self.assertEqual(json.loads(socket.sent[0])['messages'], [{'n': 0}, {'n': 1}, {'n': 2}])
+        await socket.flush_frames()
+        self.assertEqual(json.loads(socket.sent[1]), {'n': 3})
+        await socket.flush_frames()
+        self.assertEqual(len(socket.sent), 2)
+        await socket.close_wire()
+
+    async def test_msgpack_socket_reencodes_frames_without_msgpack_form(self):
+        socket = self.make_socket(b'format=msgpack&batch=1')
+        socket.batch_interval = 60
+        await socket.send_encoded(encode_frame({'n': 0}))
+        await socket.send_encoded({JSON: '{"n":1}', MSGPACK: None})  # From a process without msgpack
+        await socket.flush_frames()
+        self.assertEqual(msgpack.unpackb(socket.sent[0]), {'type': 'batch', 'messages': [{'n': 0}, {'n': 1}]})
+        await socket.close_wire()
+
+
+def stored_rows(ids):
+    """missed_messages() rows for messages with these ids."""
+    created_at = datetime(2026, 10, 17, 12, tzinfo=dt_timezone.utc)
+    return [
+        {'id': pk, 'sender_id': 2, 'sender__username': 'bob', 'message': f'message {pk}', 'client_id': None, 'created_at': created_at}
+        for pk in ids
+    ]
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CHAT_REPLAY={'CHUNK': 2, 'MAX_MESSAGES': 4})
+class ReplayTests(SimpleTestCase):
+    """ChatConsumer's ?since= replay, with missed_messages() standing in for the database."""
+
+    async def replay(self, stored, broadcast_during_replay=(), client_ids=None):
+        """
+        Reconnect with ?since=10 to a chat holding `stored` message ids. Returns the frames received.
+        client_ids maps message ids to the messageId they were sent with; a broadcast given as
+        (None, messageId) is a write-behind frame, sent before the message has an id.
+        """
+        layer = get_channel_layer()
+        client_ids = client_ids or {}
+        rows, broadcasts = stored_rows(stored), list(broadcast_during_replay)
+        for row in rows:
+            row['client_id'] = client_ids.get(row['id'])
+
+        def missed(chat_id, after_id, limit):
+            # Messages saved meanwhile are broadcast while the first chunk is read.
+            for broadcast in broadcasts:
+                pk, client_id = broadcast if isinstance(broadcast, tuple) else (broadcast, client_ids.get(broadcast))
+                frame = {'type': 'message', 'id': pk, 'chat_id': 5, 'message': f'message {pk or client_id}', 'messageId': client_id}
+                async_to_sync(layer.group_send)('chat_5', {
+                    'type': 'chat_message', 'id': pk, 'chat_id': 5, 'sender_id': 2, 'client_id': client_id, **encode_frame(frame),
+                })
+            broadcasts.clear()
+            return [row for row in rows if row['id'] > after_id][:limit]
+
+        socket = chat_socket(User(pk=1, username='alice'), 'ws/chats/5/?since=10')
+        with mock.patch('users.consumers.missed_messages', missed), \
+                mock.patch.object(ChatConsumer, 'user_is_allowed', mock.AsyncMock(return_value=True)):
+            connected, _ = await socket.connect()
+            self.assertTrue(connected)
+            frames = []
+            while not await socket.receive_nothing(timeout=0.1):
+                frames.append(await socket.receive_json_from())
+            await socket.disconnect()
+        return frames
+
+    async def test_live_messages_follow_the_replay_without_duplicates(self):
+        frames = await self.replay([11, 12], broadcast_during_replay=[12, 13])
+        self.assertEqual(
+            [(frame['type'], frame.get('id')) for frame in frames],
+            [('message', 11), ('message', 12), ('replayed', None), ('message', 13)],
+        )
+        self.assertEqual(frames[0]['created_at'], '2026-10-17T12:00:00+00:00')
+
+    async def test_message_committed_after_a_higher_id_is_still_delivered(self):
+        # 12 was assigned before 13 but committed after the replay read the chat.
+        frames = await self.replay([11, 13], broadcast_during_replay=[13, 12])
+        self.assertEqual(
+            [(frame['type'], frame.get('id')) for frame in frames],
+            [('message', 11), ('message', 13), ('replayed', None), ('message', 12)],
+        )
+
+    async def test_write_behind_frames_are_matched_by_message_id(self):
+        frames = await self.replay([11, 12], broadcast_during_replay=[(None, 'c-12'), (None, 'c-13')], client_ids={12: 'c-12'})
+        self.assertEqual(
+            [(frame['type'], frame.get('id'), frame.get('messageId')) for frame in frames],
+            [('message', 11, None), ('message', 12, 'c-12'), ('replayed', None, None), ('message', None, 'c-13')],
+        )
+
+    async def test_replay_of_exactly_max_messages_is_complete(self):
+        frames = await self.replay([11, 12, 13, 14])
+        self.assertEqual(frames[-1], {'type': 'replayed', 'chat_id': 5, 'count': 4, 'last_id': 14, 'complete': True})
+
+    async def test_longer_gap_is_left_to_the_history_api(self):
+        frames = await self.replay([11, 12, 13, 14, 15])
+        self.assertEqual(frames[-1], {'type': 'replayed', 'chat_id': 5, 'count': 4, 'last_id': 14, 'complete': False})
+        self.assertEqual(len(frames), 5)
+
+    async def test_nothing_missed(self):
+        frames = await self.replay([])
+        self.assertEqual(frames, [{'type': 'replayed', 'chat_id': 5, 'count': 0, 'last_id': 10, 'complete': True}])
@@ -0,0 +1,91 @@
+import hashlib
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+THUMBNAIL_DEFAULTS = {
+    # Longest side in pixels of each rendered size
+    'SIZES': {'small': 96, 'medium': 320, 'large': 800},
+    'FORMAT': 'WEBP',  # or 'JPEG'
+    'QUALITY': 80,
+}
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp', 'BMP': 'bmp', 'TIFF': 'tif'}
+
+
+def thumbnail_config():
+    return {**THUMBNAIL_DEFAULTS, **getattr(settings, 'PROFILE_THUMBNAILS', {})}
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def original_name(digest, extension):
+    return f'profile_pictures/{digest[:2]}/{digest}.{extension}'
+
+
+def thumbnail_name(digest, pixels, config):
+    # The pixel size is part of the name, so changing SIZES produces new URLs instead of stale cached ones.
+    return f'profile_pictures/thumbs/{digest[:2]}/{digest}_{pixels}.{EXTENSIONS[config["FORMAT"]]}'
+
+
+def render_thumbnails(file, sizes, config):
+    """{pixels: encoded image} for each requested longest-side size, largest first."""
+    file.seek(0)
+    rendered = {}
+    with Image.open(file) as image:
+        # Lets JPEG decode at a reduced scale instead of full resolution.
+        image.draft('RGB', (max(sizes), max(sizes)))
+        current = ImageOps.exif_transpose(image)
+        keep_alpha = config['FORMAT'] != 'JPEG' and current.mode in ('RGBA', 'LA', 'PA', 'P')
+        current = current.convert('RGBA' if keep_alpha else 'RGB')
+        for pixels in sorted(sizes, reverse=True):
+            # Each size is scaled down from the previous, larger one.
+            current = current.copy()
+            current.thumbnail((pixels, pixels), Image.LANCZOS)
+            buffer = BytesIO()
+            current.save(buffer, format=config['FORMAT'], quality=config['QUALITY'])
+            rendered[pixels] = buffer.getvalue()
+    return rendered
+
+
+def store_picture(file, storage=None):
+    """
+    Store an image under its content hash and render its thumbnails.
+    Identical images share one stored copy, and because a name always refers to the same bytes,
+    the URLs can be cached forever. Returns (original name, {size name: thumbnail name}).
+    """
+    storage = storage or default_storage
+    config = thumbnail_config()
+    digest = content_hash(file)
+    with Image.open(file) as image:
+        extension = EXTENSIONS.get(image.format, 'img')
+
+    name = original_name(digest, extension)
+    if not storage.exists(name):
+        file.seek(0)
+        name = storage.save(name, file)
+
+    thumbnails = {size_name: thumbnail_name(digest, pixels, config) for size_name, pixels in config['SIZES'].items()}
+    missing = {pixels for size_name, pixels in config['SIZES'].items() if not storage.exists(thumbnails[size_name])}
+    if missing:
+        for pixels, data in render_thumbnails(file, missing, config).items():
+            storage.save(thumbnail_name(digest, pixels, config), ContentFile(data))
+    return name, thumbnails
+
+
+def store_existing_picture(name):
+    """Process pool worker for the backfill: re-store a saved picture. Returns (old name, result or None)."""
+    try:
+        with default_storage.open(name, 'rb') as file:
+            return name, store_picture(file)
+    except (OSError, Image.DecompressionBombError):  # Missing, unreadable or not an image
+        return name, None
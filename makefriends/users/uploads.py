@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError, ValidationError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+UPLOAD_DEFAULTS = {
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'MAX_PIXELS': 40_000_000,  # width * height, read from the image header
+    'FORMATS': ('JPEG', 'PNG', 'WEBP', 'GIF'),
+}
+# Room for the non-file fields and multipart boundaries when checking Content-Length up front
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The uploaded file is too large."
+    default_code = 'upload_too_large'
+
+
+def upload_config():
+    return {**UPLOAD_DEFAULTS, **getattr(settings, 'PROFILE_PICTURE_UPLOAD', {})}
+
+
+class BoundedImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools image uploads to a temporary file chunk by chunk, whatever their size, and rejects them
+    as soon as they cross MAX_BYTES. Once complete, only the image header is decoded to check the
+    format and dimensions; the pixels are left for the thumbnail renderer.
+    """
+    file_fields = ('profile_picture',)
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.config = upload_config()
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Refuse bodies that can't fit before reading any of them.
+        if content_length and content_length > self.config['MAX_BYTES'] + FORM_OVERHEAD_BYTES:
+            raise UploadTooLarge()
+
+    def new_file(self, field_name, *args, **kwargs):
+        if field_name not in self.file_fields:
+            raise SkipFile()
+        super().new_file(field_name, *args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.config['MAX_BYTES']:
+            self.file.close()  # Deletes the temporary file
+            raise UploadTooLarge()
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        try:
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+        except (OSError, Image.DecompressionBombError):
+            file.close()
+            raise ValidationError({self.field_name: ["Upload a valid image."]})
+        if image_format not in self.config['FORMATS'] or width * height > self.config['MAX_PIXELS']:
+            file.close()
+            raise ValidationError({self.field_name: [
+                f"Images must be {', '.join(self.config['FORMATS'])} and at most "
+                f"{self.config['MAX_PIXELS'] / 1e6:g} megapixels."
+            ]})
+        file.seek(0)
+        return file
+
+
+class StreamingMultiPartParser(MultiPartParser):
+    """MultiPartParser that runs uploads through BoundedImageUploadHandler only."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        try:
+            data, files = DjangoMultiPartParser(meta, stream, [BoundedImageUploadHandler()], encoding).parse()
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
+        return DataAndFiles(data, files)
@@ -1,4 +1,6 @@
+import math
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -6,9 +8,20 @@ from django.contrib.gis.measure import Distance
 from django.contrib.gis.db.models.functions import Distance as DistanceFunc
 from django.contrib.auth.models import User
 from rest_framework.generics import ListAPIView
-from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from .models import UserProfile, Chat, ChatMessage
-from .serializers import UserProfileSerializer, ChatSerializer, ChatMessageSerializer
+from rest_framework.parsers import FormParser, JSONParser
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from .models import UserProfile, Chat, ChatMessage, ChatInbox
+from .serializers import UserProfileSerializer, UserProfileListSerializer, ChatInboxSerializer, ChatMessageSerializer
+from .notifications import notify_user
+from .geo import KNNDistance, radius_in_degrees
+from .geocache import nearby_cache
+from .matching import CandidateBatch, score_candidates, top_candidates
+from .search import search_params, ranked_search
+from .uploads import StreamingMultiPartParser
+from .conditional import conditional_get
+from .pagination import parse_message_cursor, format_message_cursor, messages_before, messages_after, encode_cursor, decode_cursor, is_number
 
 class UserRegistrationView(APIView):
     permission_classes = [AllowAny]  # Allow unauthenticated users to register
@@ -25,13 +38,59 @@ class UserRegistrationView(APIView):
         # If data is invalid, return a bad request response
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def own_profile_version(view, request, pk=None):
+    if pk != 'me':
+        return None
+    updated_at = UserProfile.objects.filter(user=request.user).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None  # Created on first retrieve
+    # username/email live on the already loaded User row
+    return (request.user.pk, request.user.username, request.user.email, updated_at.isoformat()), updated_at
+
+def inbox_version(view, request):
+    # Every inbox write bumps the row's updated_at; the count catches rows deleted with their chat.
+    version = ChatInbox.objects.filter(user=request.user).aggregate(updated_at=Max('updated_at'), rows=Count('id'))
+    updated_at = version['updated_at']
+    # No Last-Modified: Max(updated_at) doesn't move on deletes, so only the ETag is reliable.
+    return (request.user.pk, updated_at.isoformat() if updated_at else '', version['rows']), None
+
 class UserProfileViewSet(viewsets.ModelViewSet):
-    queryset = UserProfile.objects.all()
+    queryset = UserProfile.objects.select_related('user')
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]  # Only logged-in users can access
-    # Add the parsers to handle both JSON and multipart/form-data
-    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    # Add the parsers to handle both JSON and multipart/form-data.
+    # Multipart uploads are streamed to disk with a size limit rather than buffered (see users.uploads).
+    parser_classes = [StreamingMultiPartParser, FormParser, JSONParser]
+    # Profiles are created through /register/ and edited through PATCH /api/users/me/ only
+    http_method_names = ['get', 'patch', 'head', 'options']
+
+    def list(self, request):
+        """
+        GET /api/users/?limit=50&cursor=<next>
+        Profile cards in id order, one page and one query at a time.
+        """
+        try:
+            limit = int(request.query_params.get('limit', settings.USER_PROFILES_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.USER_PROFILES_MAX_PAGE_SIZE))
+
+        profiles = self.get_queryset().only(*UserProfileListSerializer.LIST_FIELDS).order_by('pk')
+        if request.query_params.get('cursor'):
+            cursor = decode_cursor(request.query_params['cursor'], 1)
+            if cursor is None or not isinstance(cursor[0], int):
+                return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+            profiles = profiles.filter(pk__gt=cursor[0])
 
+        page = list(profiles[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1].pk)
+        serializer = UserProfileListSerializer(page, many=True, context={'request': request})
+        return Response({"results": serializer.data, "next": next_cursor})
+
+    @conditional_get(own_profile_version)
     def retrieve(self, request, pk=None):
         """
         Retrieve the authenticated user's profile.
@@ -42,8 +101,8 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
         # Ensure a profile exists.
         profile, created = UserProfile.objects.get_or_create(user=request.user)
+        profile.user = request.user  # Already loaded by authentication; saves the username/email query
         serializer = UserProfileSerializer(profile, context={'request': request})
-        print(serializer.data)
         return Response(serializer.data)
 
     def partial_update(self, request, pk=None):
@@ -54,16 +113,37 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         if pk != 'me':
             return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
         profile, created = UserProfile.objects.get_or_create(user=request.user)
+        profile.user = request.user
         serializer = UserProfileSerializer(profile, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over interests, personality and why.
+        GET /api/users/search/?q=hiking "board games" -football&limit=20&cursor=<next>
+        """
+        text, limit, cursor = search_params(request)
+        profiles = self.get_queryset().only(*UserProfileListSerializer.LIST_FIELDS)
+        page, next_cursor = ranked_search(profiles, text, limit, cursor)
+        serializer = UserProfileListSerializer(page, many=True, context={'request': request})
+        return Response({"results": serializer.data, "next": next_cursor})
+
 class NearbyUsersView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        """
+        GET /api/nearby-users/?radius=10&limit=50&cursor=<next>[&sort=match]
+        Closest users first, one page at a time. The radius (km) is capped server-side and the
+        response carries a `next` token while more users are in range.
+        With sort=match, the closest CANDIDATE_CAP users are ranked by match score instead
+        (distance, shared interests, mood compatibility and age).
+        """
+        config = settings.NEARBY_USERS
         # Get the current user's profile and its location.
         try:
             profile, _ = UserProfile.objects.get_or_create(user=request.user)
@@ -74,33 +154,136 @@ class NearbyUsersView(APIView):
             return Response({"detail": "Current user location is not set."}, status=status.HTTP_400_BAD_REQUEST)
         
         # Get the search radius from the query parameters, default to 5 km. (GET /api/users/nearby/?radius=10)
-        radius_param = request.query_params.get('radius', 5)
+        radius_param = request.query_params.get('radius', config['DEFAULT_RADIUS_KM'])
         try:
             search_radius = float(radius_param)
         except ValueError:
-            search_radius = 5
+            search_radius = config['DEFAULT_RADIUS_KM']
+        if not math.isfinite(search_radius) or search_radius <= 0:
+            search_radius = config['DEFAULT_RADIUS_KM']
+        search_radius = min(search_radius, config['MAX_RADIUS_KM'])
+
+        try:
+            limit = int(request.query_params.get('limit', config['PAGE_SIZE']))
+        except ValueError:
+            limit = config['PAGE_SIZE']
+        limit = max(1, min(limit, config['MAX_PAGE_SIZE']))
+
+        cursor = None
+        if request.query_params.get('cursor'):
+            cursor = decode_cursor(request.query_params['cursor'], 2)
+            # (distance or score, user id) in every sort order
+            if cursor is None or not is_number(cursor[0]) or type(cursor[1]) is not int:
+                return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = None
+        if request.query_params.get('sort') == 'match':
+            page = self.page_by_match(request, profile, search_radius, limit, cursor)
+        elif nearby_cache.enabled:
+            page = self.page_from_cache(request, profile, search_radius, limit, cursor)
+        if page is None:
+            page = self.page_from_db(request, profile, search_radius, limit, cursor)
+        page, next_cursor = page
+
+        serializer = UserProfileSerializer(page, many=True, context={'request': request})
+        return Response({"results": serializer.data, "next": next_cursor}, status=status.HTTP_200_OK)
 
-        # Use GeoDjango filtering:
-        nearby_profiles = UserProfile.objects.filter(
-            location__distance_lte=(profile.location, Distance(km=search_radius))
+    def nearby_queryset(self, request, profile, search_radius):
+        origin = profile.location
+        # The DWithin prefilter (in degrees) is answered from the GiST index; distance_lte then
+        # applies the exact spherical radius to what is left.
+        return UserProfile.objects.filter(
+            location__dwithin=(origin, radius_in_degrees(search_radius, origin.y)),
+        ).filter(
+            location__distance_lte=(origin, Distance(km=search_radius))
         ).exclude(user=request.user).annotate(
-            distance=DistanceFunc('location', profile.location)
-        ).order_by('distance')
+            knn=KNNDistance('location', origin),
+            distance=DistanceFunc('location', origin),
+        )
+
+    def page_from_db(self, request, profile, search_radius, limit, cursor):
+        nearby_profiles = self.nearby_queryset(request, profile, search_radius).select_related('user')
         
         # Optionally filter by mood if your frontend requires that logic;
         # For instance, if the current user’s mood is set and you only want to show profiles with a matching mood:
         if profile.mood:
             nearby_profiles = nearby_profiles.filter(mood__iexact=profile.mood)
 
-        serializer = UserProfileSerializer(nearby_profiles, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Keyset pagination on (KNN distance, user id), in the same order the index returns rows.
+        if cursor:
+            knn, user_id = cursor
+            nearby_profiles = nearby_profiles.filter(Q(knn__gt=knn) | Q(knn=knn, user_id__gt=user_id))
+
+        page = list(nearby_profiles.order_by('knn', 'user_id')[:limit + 1])
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1].knn, page[-1].user_id)
+        return page, next_cursor
+
+    def page_by_match(self, request, profile, search_radius, limit, cursor):
+        """Score the closest candidates in one NumPy pass and page through them by (score, user id)."""
+        rows = list(
+            self.nearby_queryset(request, profile, search_radius)
+            .order_by('knn')
+            .values_list('user_id', 'distance', 'interest_vector', 'mood', 'dateOfBirth_str')
+            [:settings.NEARBY_USERS['CANDIDATE_CAP']]
+        )
+        if not rows:
+            return [], None
+        user_ids, distances, interest_vectors, moods, birth_dates = zip(*rows)
+        batch = CandidateBatch(user_ids, [distance.km for distance in distances], interest_vectors, moods, birth_dates)
+        scores = score_candidates(batch, search_radius, profile.interest_vector, profile.mood, profile.dateOfBirth_str)
+        positions = top_candidates(batch, scores, limit + 1, after=cursor)
+
+        next_cursor = None
+        if len(positions) > limit:
+            positions = positions[:limit]
+            last = positions[-1]
+            next_cursor = encode_cursor(float(scores[last]), int(batch.user_ids[last]))
+
+        profiles = UserProfile.objects.select_related('user').in_bulk([int(batch.user_ids[position]) for position in positions], field_name='user_id')
+        page = []
+        for position in positions:
+            match = profiles.get(int(batch.user_ids[position]))
+            if match is not None:
+                match.distance = Distance(km=float(batch.distances[position]))
+                match.match_score = float(scores[position])
+                page.append(match)
+        return page, next_cursor
+
+    def page_from_cache(self, request, profile, search_radius, limit, cursor):
+        """
+        Rank candidates from the geohash cell cache and load only the page's profiles.
+        Returns None when the radius covers too many cells, so the caller falls back to PostGIS.
+        """
+        origin = profile.location
+        ranked = nearby_cache.nearby(origin.y, origin.x, search_radius, exclude_user_id=request.user.id, mood=profile.mood)
+        if ranked is None:
+            return None
+        # Keyset pagination on (distance in km, user id)
+        if cursor:
+            ranked = [entry for entry in ranked if entry > tuple(cursor)]
+        next_cursor = encode_cursor(*ranked[limit - 1]) if len(ranked) > limit else None
+        ranked = ranked[:limit]
+
+        profiles = UserProfile.objects.select_related('user').in_bulk([user_id for _, user_id in ranked], field_name='user_id')
+        page = []
+        for distance, user_id in ranked:
+            nearby_profile = profiles.get(user_id)
+            if nearby_profile is not None:  # Deleted since the cell was cached
+                nearby_profile.distance = Distance(km=distance)
+                page.append(nearby_profile)
+        return page, next_cursor
 
 class ChatHistoryView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(inbox_version)
     def get(self, request):
-        chats = Chat.objects.filter(participants=request.user).order_by('-updated_at')
-        serializer = ChatSerializer(chats, many=True, context={'request': request})
+        # One range scan over the user's inbox rows, which are kept current as messages arrive.
+        rows = ChatInbox.objects.filter(user=request.user).order_by('-last_activity_at')
+        serializer = ChatInboxSerializer(rows, many=True, context={'request': request})
         return Response(serializer.data)
 
 class PokeView(APIView):
@@ -118,15 +301,27 @@ class PokeView(APIView):
         
         poking_user = request.user  # Bob
         
-        # Create a Chat if one doesn't already exist
-        chat = Chat.objects.filter(participants=poking_user).filter(participants=target_user).first()
-        if not chat:
-            chat = Chat.objects.create()
-            chat.participants.add(poking_user, target_user)
+        if target_user == poking_user:
+            return Response({"error": "You can't poke yourself"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Create a Chat if one doesn't already exist. The unique (pair_low, pair_high) key makes this a
+        # single indexed lookup, and a concurrent poke for the same pair gets the same chat back.
+        with transaction.atomic():
+            chat, created = Chat.objects.get_or_create(**Chat.pair_key(poking_user.id, target_user.id))
+            if created:
+                chat.participants.add(poking_user, target_user)
         
-        # Here you would normally trigger a notification mechanism (push, websocket, etc.)
-        # For demonstration, we simply log the action.
-        print(f"Notification: {poking_user.username} poked {target_user.username}")
+        # Push to both users' sockets (ws/me/); queued for whoever is offline.
+        notify_user(target_user.id, 'poke', {
+            'chat_id': chat.id,
+            'from_user_id': poking_user.id,
+            'from_username': poking_user.username,
+        })
+        if created:
+            notify_user(poking_user.id, 'chat_created', {
+                'chat_id': chat.id,
+                'name': target_user.username,
+            })
         
         return Response({"message": f"{poking_user.username} poked {target_user.username}", "chat_id": str(chat.id)}, status=status.HTTP_200_OK)
     
@@ -141,4 +336,48 @@ class ChatMessageListView(ListAPIView):
 
     def get_queryset(self):
         chat_id = self.kwargs.get('chat_id')
-        return ChatMessage.objects.filter(chat_id=chat_id).order_by('-created_at')
\ No newline at end of file
+        return ChatMessage.objects.filter(chat_id=chat_id).select_related('sender').order_by('-created_at', '-id')
+
+    def list(self, request, *args, **kwargs):
+        """
+        Without query params the whole history is returned, newest first.
+        Keyset mode (served from the (chat_id, created_at, id) index):
+          ?before=<created_at>,<id>&limit=50  older page, newest first
+          ?after=<created_at>,<id>&limit=50   messages the client missed, oldest first
+          ?limit=50                           latest page
+        """
+        params = request.query_params
+        if not any(key in params for key in ('before', 'after', 'limit')):
+            return super().list(request, *args, **kwargs)
+
+        try:
+            limit = int(params.get('limit', settings.CHAT_MESSAGES_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.CHAT_MESSAGES_MAX_PAGE_SIZE))
+
+        queryset = self.get_queryset()
+        cursor = None
+        if 'after' in params:
+            cursor = parse_message_cursor(params['after'])
+            if cursor is None:
+                return Response({"error": "Invalid after cursor"}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = messages_after(queryset, cursor)
+        elif 'before' in params:
+            cursor = parse_message_cursor(params['before'])
+            if cursor is None:
+                return Response({"error": "Invalid before cursor"}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = messages_before(queryset, cursor)
+
+        # Fetch one extra row to know whether another page exists.
+        messages = list(queryset[:limit + 1])
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if messages:
+            next_cursor = format_message_cursor(messages[-1])
+        else:
+            # Nothing new: an incremental sync keeps polling from the same position.
+            next_cursor = params.get('after')
+
+        serializer = self.get_serializer(messages, many=True)
+        return Response({"results": serializer.data, "next": next_cursor, "has_more": has_more})
\ No newline at end of file
@@ -0,0 +1,66 @@
+import json
+from urllib.parse import parse_qs
+from django.conf import settings
+
+try:
+    import msgpack
+except ImportError:  # Installed with channels_redis; without it every socket speaks JSON
+    msgpack = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+JSON_SEPARATORS = (',', ':')
+
+FANOUT_DEFAULTS = {
+    'BATCH_MS': 5,  # how long a batching socket holds frames before sending them together; 0 disables batching
+    'MAX_BATCH': 50,  # frames per batch; a full batch is sent right away
+}
+
+
+def fanout_config():
+    return {**FANOUT_DEFAULTS, **getattr(settings, 'CHAT_FANOUT', {})}
+
+
+def negotiate(scope):
+    """
+    Wire options a socket asked for in its query string: ?format=msgpack for binary msgpack frames
+    instead of JSON text, and ?batch=1 to receive bursts as {"type": "batch", "messages": [...]}.
+    Returns (format, batch interval in seconds or 0).
+    """
+    params = parse_qs(scope.get('query_string', b'').decode())
+    wire_format = MSGPACK if params.get('format') == [MSGPACK] and msgpack is not None else JSON
+    batch_ms = fanout_config()['BATCH_MS'] if params.get('batch') == ['1'] else 0
+    return wire_format, batch_ms / 1000
+
+
+def encode_frame(frame):
+    """
+    Encode a frame once in every supported format: {'json': str, 'msgpack': bytes or None}.
+    Group events carry these, so recipients only pick one instead of re-encoding per socket.
+    """
+    return {
+        JSON: json.dumps(frame, separators=JSON_SEPARATORS),
+        MSGPACK: msgpack.packb(frame) if msgpack is not None else None,
+    }
+
+
+def encode_for(frame, wire_format):
+    """Encode a frame in one format, for frames sent to a single socket."""
+    if wire_format == MSGPACK:
+        return msgpack.packb(frame)
+    return json.dumps(frame, separators=JSON_SEPARATORS)
+
+
+def batch_frame(frames, wire_format):
+    """{"type": "batch", "messages": [...]} built around already encoded frames, without decoding them."""
+    if wire_format == MSGPACK:
+        count = len(frames)
+        if count < 16:
+            header = bytes([0x90 | count])
+        elif count < 1 << 16:
+            header = b'\xdc' + count.to_bytes(2, 'big')
+        else:
+            header = b'\xdd' + count.to_bytes(4, 'big')
+        # A two-entry map: "type" -> "batch", "messages" -> array of the frames
+        return b'\x82' + msgpack.packb('type') + msgpack.packb('batch') + msgpack.packb('messages') + header + b''.join(frames)
+    return '{"type":"batch","messages":[' + ','.join(frames) + ']}'